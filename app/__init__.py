@@ -7,22 +7,71 @@ from config import Config
 db = SQLAlchemy()
 login_manager = LoginManager()
 
-def create_app():
+def create_app(config_class=Config):
     app = Flask(__name__)
     
     # Load configuration from config.py (supports both SQLite and PostgreSQL)
-    app.config.from_object(Config)
+    app.config.from_object(config_class)
     
     # Backwards compatibility: if no DATABASE_TYPE set, use SQLite (current behavior)
     if 'SQLALCHEMY_DATABASE_URI' not in app.config or not app.config['SQLALCHEMY_DATABASE_URI']:
         app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///control_room_dsr.db'
     
+    # PostgreSQL pool, health check and timeout settings
+    from app import db_pool
+    db_pool.configure(app)
+    
     # Initialize extensions
     db.init_app(app)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Please log in to access this page.'
     
+    # DSREntry write notifications and their subscribers
+    from app import entry_events
+    entry_events.init_app(app)
+    
+    from app.export_cache import export_cache
+    export_cache.init_app(app)
+    
+    from app import submissions
+    submissions.init_app(app)
+    
+    from app import fulltext
+    fulltext.init_app(app)
+    
+    from app import case_index
+    case_index.init_app(app)
+    
+    from app import rollups
+    rollups.init_app(app)
+    
+    from app.upload_store import upload_store
+    upload_store.init_app(app)
+    
+    from app.user_cache import user_cache
+    user_cache.init_app(app)
+    
+    from app.write_queue import write_queue
+    write_queue.init_app(app)
+    
+    from app.live_feed import live_feed
+    live_feed.init_app(app)
+    
+    from app.jobs import jobs
+    jobs.init_app(app)
+    
+    from app.end_of_day import end_of_day
+    end_of_day.init_app(app)
+    
+    # Fragment cache for schema-derived markup and the compiled template cache
+    from app import template_cache
+    template_cache.init_app(app)
+    
+    # Fingerprinted static URLs (asset_url) and the /assets route
+    from app.assets import assets
+    assets.init_app(app)
+    
     # Register blueprints
     from app.routes import main_bp, auth_bp, admin_bp, district_bp
     app.register_blueprint(main_bp)
@@ -32,6 +81,28 @@ def create_app():
     
     # Create tables
     with app.app_context():
+        # WAL, busy timeout and cache pragmas on every SQLite connection
+        from app import sqlite_profile
+        sqlite_profile.init_app(app)
+        
         db.create_all()
+        
+        # Bring tables created by older versions up to date:
+        # jsonb entry data on PostgreSQL, then any missing indexes
+        from app.models import ensure_json_column, ensure_indexes
+        ensure_json_column()
+        ensure_indexes()
+        
+        # Backfill the daily submission matrix for existing data
+        submissions.ensure_populated()
+        
+        # Full-text search table, filled once for existing entries
+        fulltext.ensure_index()
+        
+        # Backfill the cross-form case index for existing data
+        case_index.ensure_populated()
+        
+        # Backfill the daily rollup of number fields for existing data
+        rollups.ensure_populated()
     
     return app
\ No newline at end of file
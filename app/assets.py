@@ -0,0 +1,227 @@
+"""
+Fingerprinted static assets
+build_assets.py copies every file under app/static into ASSET_BUILD_DIR
+under a name carrying a hash of its content (css/style.3f2a9c1b.css). It
+also writes gzip and brotli copies of text files, and WebP/AVIF copies of
+the header logos and landing image at the widths they are shown at. A
+manifest.json maps the original names to the built files.
+
+Templates use asset_url('css/style.css') instead of
+url_for('static', ...). It returns /assets/<hashed name>, served with
+a one-year immutable Cache-Control and the smallest encoding the browser
+accepts. image_sources() gives the WebP/AVIF srcsets for a <picture>. A
+file missing from the manifest, or changed since the last build, is served
+from /static as before, so the app works without a build.
+
+Pillow is needed for the image variants (AVIF needs a Pillow built with
+libavif) and the brotli package for .br files; without them those steps
+are skipped.
+"""
+
+import os
+import json
+import gzip
+import shutil
+import hashlib
+import logging
+import mimetypes
+from flask import request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from PIL import Image, features
+except ImportError:
+    Image = None
+
+log = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+
+# Served with these encodings when the browser accepts them, best first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# Files worth compressing
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.map')
+
+# Widths (px) rendered for each responsive image; the logos are shown at
+# most 75px high (about 70px wide) and the landing image at up to 540px
+RESPONSIVE_IMAGES = {
+    'images/logo-left.png': (80, 160, 240),
+    'images/logo.png': (80, 160, 240),
+    'images/main-image.png': (480, 768, 1024),
+}
+
+# Image variant formats, in the order browsers should try them
+IMAGE_FORMATS = (('image/avif', 'avif', {'quality': 50}),
+                 ('image/webp', 'webp', {'quality': 80, 'method': 6}))
+
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+mimetypes.add_type('image/avif', '.avif')
+mimetypes.add_type('image/webp', '.webp')
+
+def _digest(path):
+    with open(path, 'rb') as source:
+        return hashlib.sha256(source.read()).hexdigest()
+
+def _fingerprinted(name, digest, suffix=None):
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{digest[:10]}{suffix or ext}"
+
+def _write_compressed(path):
+    """Write .gz (and .br) next to a built file; returns the encodings written"""
+    with open(path, 'rb') as source:
+        data = source.read()
+    written = []
+    variants = [('gzip', '.gz', lambda: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.insert(0, ('br', '.br', lambda: brotli.compress(data, quality=11)))
+    for encoding, suffix, compress in variants:
+        packed = compress()
+        # Not worth a Content-Encoding unless it saves something
+        if len(packed) < len(data) * 0.95:
+            with open(path + suffix, 'wb') as target:
+                target.write(packed)
+            written.append(encoding)
+    return written
+
+def _image_formats():
+    if Image is None:
+        return []
+    available = []
+    for mimetype, fmt, options in IMAGE_FORMATS:
+        try:
+            supported = features.check(fmt)
+        except ValueError:
+            supported = False
+        if supported:
+            available.append((mimetype, fmt, options))
+    return available
+
+def _write_image_variants(source_path, name, digest, widths, output_dir, formats):
+    """Resized copies of one image in each format; returns {mimetype: [[path, width], ...]}"""
+    variants = {}
+    with Image.open(source_path) as image:
+        image.load()
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        for width in sorted({min(width, image.width) for width in widths}):
+            height = round(image.height * width / image.width)
+            resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+            for mimetype, fmt, options in formats:
+                built = _fingerprinted(name, digest, f".{width}w.{fmt}")
+                resized.save(os.path.join(output_dir, built), fmt.upper(), **options)
+                variants.setdefault(mimetype, []).append([built, width])
+    return variants
+
+def build(static_dir, output_dir):
+    """
+    Build fingerprinted copies, compressed copies and image variants of
+    the files under static_dir into output_dir, and write the manifest.
+    Files of earlier builds are kept, for pages still cached by browsers.
+    Returns the manifest.
+    """
+    static_dir = os.path.abspath(static_dir)
+    output_dir = os.path.abspath(output_dir)
+    formats = _image_formats()
+    manifest = {'files': {}, 'digests': {}, 'encodings': {}, 'images': {}}
+
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != output_dir)
+        for filename in sorted(files):
+            if filename.endswith('.md') or filename.startswith('.'):
+                continue
+            source_path = os.path.join(root, filename)
+            name = os.path.relpath(source_path, static_dir).replace(os.sep, '/')
+            digest = _digest(source_path)
+            built = _fingerprinted(name, digest)
+            target = os.path.join(output_dir, built)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source_path, target)
+
+            manifest['files'][name] = built
+            manifest['digests'][name] = digest
+            if filename.endswith(COMPRESSIBLE):
+                manifest['encodings'][built] = _write_compressed(target)
+            if name in RESPONSIVE_IMAGES and formats:
+                manifest['images'][name] = _write_image_variants(
+                    source_path, name, digest, RESPONSIVE_IMAGES[name], output_dir, formats)
+
+    manifest_path = os.path.join(output_dir, MANIFEST)
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as target:
+        json.dump(manifest, target, indent=2, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return manifest
+
+class Assets:
+    """Manifest lookups for templates and the /assets route"""
+
+    def __init__(self, app=None):
+        self.directory = None
+        self.files = {}
+        self.encodings = {}
+        self.images = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = str(app.config['ASSET_BUILD_DIR'])
+        self.load(app.static_folder)
+        app.add_url_rule('/assets/<path:filename>', 'assets', self.send)
+        app.jinja_env.globals.update(asset_url=self.url, image_sources=self.image_sources)
+
+    def load(self, static_dir):
+        """Read the manifest, keeping only files unchanged since the build"""
+        self.files, self.encodings, self.images = {}, {}, {}
+        try:
+            with open(os.path.join(self.directory, MANIFEST), encoding='utf-8') as source:
+                manifest = json.load(source)
+        except FileNotFoundError:
+            return
+        stale = []
+        for name, built in manifest['files'].items():
+            source_path = os.path.join(static_dir, name)
+            if os.path.exists(source_path) and _digest(source_path) == manifest['digests'][name]:
+                self.files[name] = built
+                self.encodings[built] = manifest['encodings'].get(built, [])
+                if name in manifest['images']:
+                    self.images[name] = manifest['images'][name]
+            else:
+                stale.append(name)
+        if stale:
+            log.warning('Static files changed since build_assets.py ran, served unversioned: %s', ', '.join(stale))
+
+    def url(self, filename):
+        """URL of a static file: fingerprinted when built, else the plain /static URL"""
+        built = self.files.get(filename)
+        if built is None:
+            return url_for('static', filename=filename)
+        return url_for('assets', filename=built)
+
+    def image_sources(self, filename):
+        """(mimetype, srcset) of the built variants of an image, best format first"""
+        variants = self.images.get(filename, {})
+        return [(mimetype, ', '.join(f"{url_for('assets', filename=built)} {width}w" for built, width in variants[mimetype]))
+                for mimetype, _, _ in IMAGE_FORMATS if mimetype in variants]
+
+    def send(self, filename):
+        """Serve a built file, precompressed when the browser accepts it, cached for a year"""
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        encoding = next((name for name, _ in ENCODINGS
+                         if name in self.encodings.get(filename, ()) and request.accept_encodings[name]), None)
+        suffix = dict(ENCODINGS)[encoding] if encoding else ''
+
+        response = send_from_directory(self.directory, filename + suffix, mimetype=mimetype,
+                                       max_age=31536000, conditional=True)
+        response.headers['Cache-Control'] = CACHE_CONTROL
+        if self.encodings.get(filename):
+            response.headers['Vary'] = 'Accept-Encoding'
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+assets = Assets()
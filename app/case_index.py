@@ -0,0 +1,161 @@
+"""
+Cross-form case index
+The same case is reported in several forms (fir_no in crime_data,
+sensitive_cases and important_cases, case_no in pd_act_proposals).
+CaseMention maps each normalised identifier to the entries that mention
+it, so a case's full timeline is one indexed query instead of a scan of
+every entry. Mentions are written through entries_changed in the same
+transaction as the entries; rebuild() backfills existing data.
+"""
+
+import re
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import DSREntry, CaseMention, FORM_CONFIGS
+from app.entry_events import entries_changed
+
+# Entry fields holding identifiers, and the key space each one is filed
+# under: FIR and case numbers share one, so "case" finds both
+KEY_FIELDS = {
+    'fir_no': 'case',
+    'case_no': 'case',
+    'unit_name': 'unit'
+}
+
+MAX_TIMELINE = 2000
+REBUILD_CHUNK = 5000
+
+_CASE_PREFIX = re.compile(r'^(?:CR(?:IME)?|FIR|CASE)\s*\.?\s*(?:NO|NUMBER)?\s*[.:#]?\s*')
+_CASE_SEPARATOR = re.compile(r'\s*[-/\\]\s*')
+_LEADING_ZEROS = re.compile(r'\b0+(?=\d)')
+_MULTIPLE_CASES = re.compile(r'\s*(?:[,;&]|\bAND\b)\s*')
+
+def init_app(app):
+    entries_changed.connect(_track_mentions, weak=False)
+
+def normalise(kind, value):
+    """
+    Canonical form of one identifier, or '' if there is none
+    Case numbers drop "Cr.No." / "FIR No." prefixes, spaces and leading
+    zeros and use / as the separator, so "Cr. No. 045 - 2024" and "45/2024"
+    are the same case. Unit names are compared case-insensitively.
+    """
+    value = ' '.join(str(value or '').split()).upper()
+    if kind == 'case':
+        value = _CASE_PREFIX.sub('', value)
+        value = _CASE_SEPARATOR.sub('/', value)
+        value = _LEADING_ZEROS.sub('', value).replace(' ', '')
+    return value[:200]
+
+def identifiers(form_type, data):
+    """(kind, identifier, field) for every identifier in one entry's data"""
+    found = {}
+    for field in FORM_CONFIGS.get(form_type, {}).get('fields', []):
+        kind = KEY_FIELDS.get(field['name'])
+        value = data.get(field['name'])
+        if kind is None or not value:
+            continue
+        # A case field may list several cases: "12/2024, 15/2024"
+        values = _MULTIPLE_CASES.split(str(value).upper()) if kind == 'case' else [value]
+        for item in values:
+            identifier = normalise(kind, item)
+            if identifier:
+                found.setdefault((kind, identifier), field['name'])
+    return [(kind, identifier, field) for (kind, identifier), field in found.items()]
+
+def _mention_rows(entry_id, form_type, district_name, entry_date, data):
+    return [{
+        'kind': kind,
+        'identifier': identifier,
+        'entry_id': entry_id,
+        'field': field,
+        'form_type': form_type,
+        'district_name': district_name,
+        'date': entry_date
+    } for kind, identifier, field in identifiers(form_type, data or {})]
+
+def _track_mentions(session, changes):
+    """Re-index the identifiers of a batch of entry changes"""
+    table = CaseMention.__table__
+    removed = [change.id for change in changes if change.action in ('update', 'delete')]
+    added = []
+    for change in changes:
+        if change.action in ('insert', 'update'):
+            added += _mention_rows(change.id, change.form_type, change.district_name, change.date, change.data)
+
+    connection = session.connection()
+    if removed:
+        connection.execute(table.delete().where(table.c.entry_id.in_(removed)))
+    if added:
+        connection.execute(table.insert(), added)
+
+def rebuild(chunk_size=REBUILD_CHUNK, progress=None):
+    """
+    Re-index every DSREntry, one id range per transaction
+    Entries written meanwhile are indexed by the subscriber, so the
+    application can keep running. progress(done, total) is called per chunk.
+    Returns the number of mentions written.
+    """
+    table = CaseMention.__table__
+    total = db.session.query(func.count(DSREntry.id)).scalar()
+    done = 0
+    written = 0
+    after_id = 0
+    while True:
+        entries = db.session.query(DSREntry.id, DSREntry.form_type, DSREntry.district_name,
+                                   DSREntry.date, DSREntry.data)\
+                            .filter(DSREntry.id > after_id)\
+                            .order_by(DSREntry.id)\
+                            .limit(chunk_size).all()
+        if not entries:
+            break
+        last_id = entries[-1].id
+        rows = []
+        for entry in entries:
+            rows += _mention_rows(entry.id, entry.form_type, entry.district_name, entry.date, entry.data)
+
+        db.session.execute(table.delete().where(table.c.entry_id > after_id, table.c.entry_id <= last_id))
+        if rows:
+            db.session.execute(table.insert(), rows)
+        db.session.commit()
+
+        after_id = last_id
+        done += len(entries)
+        written += len(rows)
+        if progress:
+            progress(done, total)
+    return written
+
+def ensure_populated():
+    """Backfill the index once for databases that predate it"""
+    if db.session.query(CaseMention.entry_id).first() is not None:
+        return
+    if db.session.query(DSREntry.id).first() is None:
+        return
+    try:
+        rebuild()
+    except IntegrityError:
+        # Another worker backfilled concurrently
+        db.session.rollback()
+
+def timeline(kind, value, district_name=None, date_from=None, date_to=None, limit=MAX_TIMELINE):
+    """
+    Every entry mentioning an identifier, oldest first
+    Returns (identifier, mentions, truncated) where mentions are
+    (CaseMention, DSREntry) pairs.
+    """
+    identifier = normalise(kind, value)
+    query = db.session.query(CaseMention, DSREntry)\
+                      .join(DSREntry, DSREntry.id == CaseMention.entry_id)\
+                      .filter(CaseMention.kind == kind, CaseMention.identifier == identifier)
+    if district_name:
+        query = query.filter(CaseMention.district_name == district_name)
+    if date_from:
+        query = query.filter(CaseMention.date >= date_from)
+    if date_to:
+        query = query.filter(CaseMention.date <= date_to)
+
+    limit = max(1, min(limit, MAX_TIMELINE))
+    mentions = query.order_by(CaseMention.date, CaseMention.entry_id).limit(limit + 1).all()
+    return identifier, mentions[:limit], len(mentions) > limit
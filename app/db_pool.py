@@ -0,0 +1,109 @@
+"""
+Connection pool profile and metrics for PostgreSQL
+configure() makes sure the engine gets DatabaseConfig.get_engine_options()
+(pool size, overflow, pre-ping, recycle, statement timeouts) and swaps in
+MeteredQueuePool, which records how long requests wait to obtain a
+connection and how many are in use, so the pool can be sized from
+/admin/db_pool/stats rather than guessed. SQLite keeps its defaults.
+"""
+
+import os
+import time
+import threading
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+from config import DatabaseConfig
+
+# Checkouts slower than this (seconds) had to wait for a free or new connection
+SLOW_CHECKOUT = 0.05
+
+class PoolMetrics:
+    """Checkout counters of one process's pool"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.slow_checkouts = 0
+        self.peak_in_use = 0
+        self._lock = threading.Lock()
+
+    def record(self, wait, in_use):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.peak_in_use = max(self.peak_in_use, in_use)
+            if wait >= SLOW_CHECKOUT:
+                self.slow_checkouts += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that times every checkout, including pre-ping and connecting"""
+
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self.metrics = PoolMetrics()
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record(time.perf_counter() - started, self.checkedout())
+        return connection
+
+    def recreate(self):
+        # Keep counting across dispose() and invalidation
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+def configure(app):
+    """
+    Set the engine options for the app's own SQLALCHEMY_DATABASE_URI (a
+    config subclass may point it elsewhere than the environment does); call
+    before db.init_app. Options given in the config override the profile
+    on PostgreSQL; other databases get none.
+    """
+    database_uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if not database_uri.startswith('postgresql'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {}
+        return
+    options = DatabaseConfig.get_engine_options(database_uri)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    options.setdefault('poolclass', MeteredQueuePool)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+def stats(engine):
+    """Pool configuration, current usage and checkout metrics of this process"""
+    pool = engine.pool
+    result = {'pool': type(pool).__name__, 'pid': os.getpid()}
+    if not isinstance(pool, QueuePool):
+        return result
+
+    result.update({
+        'size': pool.size(),
+        'max_overflow': pool._max_overflow,
+        'timeout_seconds': pool.timeout(),
+        'in_use': pool.checkedout(),
+        'idle': pool.checkedin(),
+        'overflow': max(pool.overflow(), 0)
+    })
+    metrics = getattr(pool, 'metrics', None)
+    if metrics is not None:
+        result.update({
+            'checkouts': metrics.checkouts,
+            'timeouts': metrics.timeouts,
+            'peak_in_use': metrics.peak_in_use,
+            'wait_avg_ms': round(metrics.wait_total / metrics.checkouts * 1000, 2) if metrics.checkouts else None,
+            'wait_max_ms': round(metrics.wait_max * 1000, 2),
+            'slow_checkouts': metrics.slow_checkouts
+        })
+    return result
@@ -0,0 +1,170 @@
+"""
+End-of-day pre-generation of DSR workbooks
+The evening review asks for every district workbook and the statewide
+workbook of the day within minutes of the reporting cutoff. At EOD_CUTOFF
+(IST, the time of ist_now) a pregenerate_dsr job renders the day's district
+workbooks in a process pool, and the statewide workbook in both groupings,
+into the export cache; download_dsr and download_state_dsr then send the
+files from disk.
+
+An entry for today saved or deleted after the cutoff drops its district's
+files and the statewide files from the export cache, as any change does,
+and queues a pregenerate_dsr job for just that district to run
+EOD_REGENERATE_DELAY seconds later, so a burst of edits renders once. A
+change made while that district's rerun is running is queued again once
+the running one has finished.
+
+A scheduler thread in each web process checks the clock every
+EOD_CHECK_INTERVAL seconds; whichever process gets there first queues the
+day's full run.
+"""
+
+import os
+import time
+import logging
+import tempfile
+import threading
+from datetime import datetime
+from flask import current_app
+from app import db
+from app.models import Job, DISTRICTS, ist_now
+from app.entry_events import entries_committed
+from app.export_cache import export_cache
+from app.exports import build_district_workbooks, build_state_workbook, STATE_GROUPINGS
+from app.jobs import jobs, job_kind
+
+log = logging.getLogger(__name__)
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(str(value), '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError('Invalid date format')
+
+def pregenerate(day, districts=None):
+    """
+    Render the workbooks of a date that are not in the export cache yet:
+    those of every district (or of the districts given) and both statewide
+    groupings. Returns the number of workbooks rendered.
+    """
+    max_workers = current_app.config.get('EXPORT_WORKERS')
+    versions = {name: export_cache.data_version(name, day) for name in (districts or DISTRICTS)}
+    stale = [name for name, version in versions.items()
+             if version[1] and not export_cache.exists(name, day, version)]
+
+    rendered = 0
+    if stale:
+        with tempfile.TemporaryDirectory() as directory:
+            for name, path in build_district_workbooks(day, stale, directory, max_workers=max_workers):
+                with open(path, 'rb') as workbook:
+                    export_cache.put(name, day, versions[name], workbook).close()
+                rendered += 1
+
+    version = export_cache.data_version(None, day)
+    for group_by in STATE_GROUPINGS:
+        if version[1] and not export_cache.exists(None, day, version, variant=group_by):
+            output = build_state_workbook(day, group_by, max_workers=max_workers)
+            if output is not None:
+                with output:
+                    export_cache.put(None, day, version, output, variant=group_by).close()
+                rendered += 1
+    return rendered
+
+def _validate_pregenerate(params):
+    districts = params.get('districts')
+    if districts is not None:
+        if not isinstance(districts, list) or any(name not in DISTRICTS for name in districts):
+            raise ValueError('Unknown district')
+        districts = sorted(set(districts))
+    return {'date': _parse_date(params.get('date')).strftime('%Y-%m-%d'), 'districts': districts}
+
+@job_kind('pregenerate_dsr', _validate_pregenerate)
+def pregenerate_dsr(params, path):
+    """Job form of pregenerate(); there is no file to download"""
+    pregenerate(_parse_date(params['date']), params['districts'])
+
+class EndOfDay:
+    """Scheduler that queues pre-generation at the cutoff and after late changes"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.cutoff = None
+        self.delay = 60
+        self.interval = 30
+        self._dirty = {}
+        self._queued_for = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        cutoff = app.config['EOD_CUTOFF']
+        self.cutoff = datetime.strptime(cutoff, '%H:%M').time() if cutoff else None
+        self.delay = app.config['EOD_REGENERATE_DELAY']
+        self.interval = app.config['EOD_CHECK_INTERVAL']
+        if self.cutoff is not None:
+            entries_committed.connect(self._mark_changed, weak=False)
+            app.before_request(self._ensure_started)
+
+    def cutoff_passed(self, now=None):
+        """Whether today's cutoff (IST) has passed"""
+        return self.cutoff is not None and (now or ist_now()).time() >= self.cutoff
+
+    def _mark_changed(self, session, changes):
+        now = ist_now()
+        if not self.cutoff_passed(now):
+            return
+        changed = {change.district_name for change in changes
+                   if change.date == now.date() and change.district_name in DISTRICTS}
+        if changed:
+            with self._lock:
+                self._dirty.setdefault(now.date(), set()).update(changed)
+
+    def tick(self, now=None):
+        """Queue the day's full run once past the cutoff, then reruns for districts changed since"""
+        now = now or ist_now()
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        for changed_day, districts in dirty.items():
+            job = jobs.submit('pregenerate_dsr', {'date': changed_day.strftime('%Y-%m-%d'), 'districts': sorted(districts)},
+                              delay=self.delay)
+            if job.status == 'running':
+                # The same rerun is already rendering and may have read the
+                # entries before this change; try again once it has finished
+                with self._lock:
+                    self._dirty.setdefault(changed_day, set()).update(districts)
+
+        day = now.date()
+        if self._queued_for == day or not self.cutoff_passed(now):
+            return
+        params = {'date': day.strftime('%Y-%m-%d'), 'districts': None}
+        # The day's run is queued once across processes: a finished run is
+        # found here (job rows outlive the day), and processes racing to
+        # queue it get the same row back from submit's ON CONFLICT insert
+        if db.session.query(Job.id).filter(Job.dedupe_key == jobs.dedupe_key('pregenerate_dsr', params)).first() is None:
+            jobs.submit('pregenerate_dsr', params)
+        self._queued_for = day
+
+    def _ensure_started(self):
+        # Started lazily so every forked worker process gets its own scheduler
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._loop, name='dsr-end-of-day', daemon=True).start()
+
+    def _loop(self):
+        with self.app.app_context():
+            while True:
+                try:
+                    self.tick()
+                except Exception:
+                    log.exception('End-of-day scheduling failed')
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+                time.sleep(self.interval)
+
+end_of_day = EndOfDay()
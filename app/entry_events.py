@@ -0,0 +1,123 @@
+"""
+DSREntry write notifications
+Side tables and caches that follow DSREntry subscribe here instead of
+hooking every write path:
+
+- entries_changed is sent inside the transaction that writes the entries
+  (from the ORM flush, or from bulk_insert_entries), so subscribers can
+  write through session.connection() and commit or roll back with them.
+- entries_committed is sent once that transaction has committed.
+
+Both signals are sent with the session as sender and changes=[EntryChange].
+"""
+
+import json
+from collections import namedtuple
+from blinker import Namespace
+from sqlalchemy import event, inspect
+from app import db
+from app.models import DSREntry, ist_now
+
+_signals = Namespace()
+entries_changed = _signals.signal('entries-changed')
+entries_committed = _signals.signal('entries-committed')
+
+# action is 'insert', 'update' or 'delete'; an update that moves an entry to
+# another date, district or form is reported as a delete plus an insert.
+# previous_data is the data an update replaced (None for other actions).
+EntryChange = namedtuple('EntryChange', 'action id date district_name form_type data updated_at previous_data',
+                         defaults=(None,))
+
+# Rows per INSERT statement in bulk_insert_entries (7 bound values per row)
+BULK_INSERT_CHUNK = 500
+
+def init_app(app):
+    if not event.contains(db.session, 'after_flush', _collect_flushed_entries):
+        event.listen(db.session, 'after_flush', _collect_flushed_entries)
+        event.listen(db.session, 'after_commit', _send_committed)
+        event.listen(db.session, 'after_rollback', _discard_pending)
+
+def _change(action, entry, previous=False):
+    values = {}
+    state = inspect(entry)
+    for name in ('date', 'district_name', 'form_type', 'data'):
+        value = getattr(entry, name)
+        if previous:
+            history = state.attrs[name].history
+            if history.deleted:
+                value = history.deleted[0]
+        values[name] = value
+    return EntryChange(action, entry.id, updated_at=entry.updated_at, **values)
+
+def _notify(session, changes):
+    if not changes:
+        return
+    session.info.setdefault('entry_changes', []).extend(changes)
+    entries_changed.send(session, changes=changes)
+
+def _collect_flushed_entries(session, flush_context):
+    changes = []
+    for entry in session.new:
+        if isinstance(entry, DSREntry):
+            changes.append(_change('insert', entry))
+    for entry in session.dirty:
+        if isinstance(entry, DSREntry) and session.is_modified(entry):
+            old, new = _change('delete', entry, previous=True), _change('insert', entry)
+            if old[2:5] == new[2:5]:
+                changes.append(new._replace(action='update', previous_data=old.data))
+            else:
+                changes.extend([old, new])
+    for entry in session.deleted:
+        if isinstance(entry, DSREntry):
+            changes.append(_change('delete', entry, previous=True))
+    _notify(session, changes)
+
+def _send_committed(session):
+    changes = session.info.pop('entry_changes', None)
+    if changes:
+        entries_committed.send(session, changes=changes)
+
+def _discard_pending(session):
+    session.info.pop('entry_changes', None)
+
+def bulk_insert_entries(session, district_name, form_type, entry_date, user_id, rows):
+    """
+    Insert many entries of one district, form and date with multi-row
+    INSERT statements and send the same notifications as an ORM flush
+    rows are data dicts. The caller commits. Returns the new ids in row order.
+    """
+    table = DSREntry.__table__
+    connection = session.connection()
+    now = ist_now()
+    ids = []
+
+    for start in range(0, len(rows), BULK_INSERT_CHUNK):
+        chunk = rows[start:start + BULK_INSERT_CHUNK]
+        values = [{
+            'district_name': district_name,
+            'form_type': form_type,
+            'date': entry_date,
+            'data': data,
+            'created_at': now,
+            'updated_at': now,
+            'user_id': user_id
+        } for data in chunk]
+
+        if connection.dialect.insert_returning:
+            # RETURNING order is not guaranteed, so match ids back by payload
+            # (key order normalised, JSONB reorders keys); rows with identical
+            # payloads are interchangeable
+            returned = {}
+            result = connection.execute(table.insert().values(values).returning(table.c.id, table.c.data))
+            for entry_id, data in result:
+                returned.setdefault(json.dumps(data, sort_keys=True), []).append(entry_id)
+            for ids_for_payload in returned.values():
+                ids_for_payload.sort(reverse=True)
+            ids.extend(returned[json.dumps(data, sort_keys=True)].pop() for data in chunk)
+        else:
+            for row in values:
+                ids.append(connection.execute(table.insert().values(row)).inserted_primary_key[0])
+
+    _notify(session, [EntryChange('insert', entry_id, entry_date, district_name, form_type, data, now)
+                      for entry_id, data in zip(ids, rows)])
+    return ids
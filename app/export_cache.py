@@ -0,0 +1,150 @@
+"""
+Export cache for generated DSR workbooks
+Workbooks are stored on disk under instance/ and addressed by a hash of
+(district, date, latest updated_at, entry count) of the matching DSREntry
+rows, so any change to the data yields a new key. Statewide workbooks use
+district None (every district) and the grouping as variant. Entries written
+or deleted also drop the cached files of their district and date, and the
+statewide files of that date, as soon as the transaction commits.
+"""
+
+import os
+import shutil
+import hashlib
+import threading
+from sqlalchemy import func
+from app import db
+from app.models import DSREntry
+from app.entry_events import entries_committed
+
+class ExportCache:
+    """On-disk LRU cache of district DSR workbooks"""
+
+    def __init__(self, app=None):
+        self.directory = None
+        self.max_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = str(app.config['EXPORT_CACHE_DIR'])
+        self.max_bytes = app.config['EXPORT_CACHE_MAX_BYTES']
+        os.makedirs(self.directory, exist_ok=True)
+        entries_committed.connect(self._invalidate_changed, weak=False)
+
+    # Keys and paths
+
+    @staticmethod
+    def _bucket(district_name, search_date):
+        """Directory name holding every cached version for one district (or the state) and date"""
+        raw = f"{district_name or '*'}|{search_date.isoformat()}".encode('utf-8')
+        return hashlib.sha1(raw).hexdigest()[:16]
+
+    @staticmethod
+    def data_version(district_name, search_date):
+        """Latest updated_at and row count of the entries an export is built from (all districts for None)"""
+        query = db.session.query(func.max(DSREntry.updated_at), func.count(DSREntry.id))\
+                          .filter(DSREntry.date == search_date)
+        if district_name is not None:
+            query = query.filter(DSREntry.district_name == district_name)
+        latest, count = query.one()
+        return latest, count
+
+    def _path(self, district_name, search_date, version, variant=''):
+        latest, count = version
+        raw = f"{district_name or '*'}|{search_date.isoformat()}|{latest.isoformat() if latest else ''}|{count}|{variant}"
+        key = hashlib.sha256(raw.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, self._bucket(district_name, search_date), f"{key}.xlsx")
+
+    # Cache operations
+
+    def exists(self, district_name, search_date, version, variant=''):
+        """Whether this data version is cached, without counting a hit or miss"""
+        return os.path.exists(self._path(district_name, search_date, version, variant))
+
+    def get(self, district_name, search_date, version, variant=''):
+        """
+        Return the cached workbook for this data version opened for reading,
+        or None. The open handle stays valid if the file is evicted meanwhile.
+        """
+        path = self._path(district_name, search_date, version, variant)
+        try:
+            cached = open(path, 'rb')
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        # Touch on hit so eviction is least-recently-used
+        os.utime(path)
+        with self._lock:
+            self.hits += 1
+        return cached
+
+    def put(self, district_name, search_date, version, fileobj, variant=''):
+        """Store a rendered workbook and return it opened for reading"""
+        path = self._path(district_name, search_date, version, variant)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write aside and rename so readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as out:
+            shutil.copyfileobj(fileobj, out)
+        os.replace(tmp_path, path)
+
+        cached = open(path, 'rb')
+        self._evict()
+        return cached
+
+    def invalidate(self, district_name, search_date):
+        """Drop every cached version for a district (or the state, for None) and date"""
+        shutil.rmtree(os.path.join(self.directory, self._bucket(district_name, search_date)),
+                      ignore_errors=True)
+
+    def _cached_files(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.xlsx'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def _evict(self):
+        """Remove least-recently-used workbooks until the cache fits its size cap"""
+        files = sorted(self._cached_files(), key=lambda item: item[2])
+        total = sum(size for _, size, _ in files)
+        for path, size, _ in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def stats(self):
+        """Hit/miss counters of this process and the current cache size"""
+        files = list(self._cached_files())
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            'files': len(files),
+            'bytes': sum(size for _, size, _ in files),
+            'max_bytes': self.max_bytes,
+            'pid': os.getpid()
+        }
+
+    def _invalidate_changed(self, session, changes):
+        for district_name, search_date in {(change.district_name, change.date) for change in changes}:
+            self.invalidate(district_name, search_date)
+        for search_date in {change.date for change in changes}:
+            self.invalidate(None, search_date)
+
+export_cache = ExportCache()
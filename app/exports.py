@@ -0,0 +1,362 @@
+"""
+DSR Excel export engine
+Builds write-only openpyxl workbooks: rows are flushed to disk as they are
+appended and styles are shared named styles, so memory stays flat as the
+number of entries grows.
+"""
+
+import os
+import shutil
+import zipfile
+import itertools
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import NamedStyle, Font, PatternFill, Border, Side
+from openpyxl.utils import get_column_letter
+from app.models import DSREntry, FORM_CONFIGS, DISTRICTS
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Rows fetched per round trip while streaming entries out of the database
+QUERY_CHUNK_SIZE = 500
+
+def _named_styles():
+    """Named styles shared by every cell of a DSR workbook"""
+    thin = Side(style='thin')
+    thin_border = Border(left=thin, right=thin, top=thin, bottom=thin)
+
+    title = NamedStyle(name='dsr_title')
+    title.font = Font(bold=True, size=13)
+
+    form_header = NamedStyle(name='dsr_form_header')
+    form_header.font = Font(bold=True, color="FFFFFF")
+    form_header.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+
+    column_header = NamedStyle(name='dsr_column_header')
+    column_header.font = Font(bold=True)
+    column_header.fill = PatternFill(start_color="E6E6E6", end_color="E6E6E6", fill_type="solid")
+    column_header.border = thin_border
+
+    data_cell = NamedStyle(name='dsr_cell')
+    data_cell.border = thin_border
+
+    return [title, form_header, column_header, data_cell]
+
+# Order in which the named styles are bound to cell formats; fixed so that
+# independently rendered sheets agree on style ids (see build_state_workbook)
+STYLE_ORDER = ['dsr_title', 'dsr_form_header', 'dsr_column_header', 'dsr_cell']
+
+def create_workbook():
+    """Create an empty write-only workbook with the DSR named styles registered"""
+    wb = Workbook(write_only=True)
+    for style in _named_styles():
+        wb.add_named_style(style)
+    return wb
+
+def _bind_styles(ws):
+    """Assign cell format ids to the named styles in STYLE_ORDER"""
+    for style in STYLE_ORDER:
+        cell = WriteOnlyCell(ws)
+        cell.style = style
+        # openpyxl has no public call for this: the style_id getter adds the
+        # cell's format to the workbook's format list (the id is its position)
+        # the first time it is read, which is what fixes the order here
+        _ = cell.style_id
+
+def _styled_row(ws, values, style):
+    """Wrap each value in a write-only cell carrying a named style"""
+    cells = []
+    for value in values:
+        cell = WriteOnlyCell(ws, value=value)
+        cell.style = style
+        cells.append(cell)
+    return cells
+
+def iter_entry_groups(entries):
+    """
+    Group an iterable of DSREntry rows (ordered by form_type) into
+    (form_type, [(time_str, data), ...]) tuples
+    """
+    current_form = None
+    group = []
+    for entry in entries:
+        if entry.form_type != current_form:
+            if group:
+                yield current_form, group
+            current_form = entry.form_type
+            group = []
+        time_str = entry.updated_at.strftime('%H:%M') if entry.updated_at else 'N/A'
+        group.append((time_str, entry.data))
+    if group:
+        yield current_form, group
+
+def district_entries_query(district_name, search_date):
+    """Entries of one district and date, ordered for iter_entry_groups"""
+    return DSREntry.query.filter_by(date=search_date, district_name=district_name)\
+                         .order_by(DSREntry.form_type, DSREntry.created_at)
+
+def write_dsr_sheet(wb, sheet_title, heading, date_str, entry_groups, show_district=False):
+    """
+    Append one DSR sheet to a write-only workbook
+
+    entry_groups is an iterable of (form_type, rows) as produced by
+    iter_entry_groups. With show_district, each rows item is
+    (district, time_str, data) and a District column is added.
+    Returns the number of data rows written.
+    """
+    ws = wb.create_sheet(title=sheet_title)
+    _bind_styles(ws)
+
+    ws.append(_styled_row(ws, [heading], 'dsr_title'))
+    ws.append([f"Date: {date_str}"])
+    ws.merged_cells.add('A1:D1')
+    ws.merged_cells.add('A2:D2')
+    ws.append([])
+    row = 4
+    written = 0
+
+    lead_columns = ["S.No", "District", "Time"] if show_district else ["S.No", "Time"]
+
+    for form_type, rows in entry_groups:
+        form_config = FORM_CONFIGS.get(form_type, {})
+        form_name = form_config.get('name', form_type)
+        entry_count = len(rows)
+
+        # Only keep columns that have a value in at least one entry
+        used_fields = [field for field in form_config.get('fields', [])
+                       if any(item[-1].get(field['name'], '') for item in rows)]
+
+        # Form header with entry count, merged across the table width
+        header_text = f"{form_name} ({entry_count} {'entry' if entry_count == 1 else 'entries'})"
+        end_col = get_column_letter(len(used_fields) + len(lead_columns))
+        ws.append(_styled_row(ws, [header_text], 'dsr_form_header'))
+        ws.merged_cells.add(f'A{row}:{end_col}{row}')
+        row += 1
+
+        # Table headers
+        ws.append(_styled_row(ws, lead_columns + [field['label'] for field in used_fields],
+                              'dsr_column_header'))
+        row += 1
+
+        # Data rows
+        for idx, item in enumerate(rows):
+            data = item[-1]
+            values = [idx + 1] + list(item[:-1])
+            values += [data.get(field['name'], '') or '-' for field in used_fields]
+            ws.append(_styled_row(ws, values, 'dsr_cell'))
+            row += 1
+        written += entry_count
+
+        # Empty row between forms
+        ws.append([])
+        row += 1
+
+    return written
+
+def save_to_tempfile(wb):
+    """Save a workbook into an anonymous temporary file, rewound for streaming"""
+    output = tempfile.TemporaryFile()
+    wb.save(output)
+    output.seek(0)
+    return output
+
+def build_district_workbook(district_name, search_date):
+    """
+    Render the DSR workbook for one district and date
+    Returns an open temporary file positioned at the start, or None when
+    the district has no entries for that date.
+    """
+    date_str = search_date.strftime('%Y-%m-%d')
+    entries = iter(district_entries_query(district_name, search_date).yield_per(QUERY_CHUNK_SIZE))
+
+    # Peek before opening a workbook so an empty export costs one query
+    first = next(entries, None)
+    if first is None:
+        return None
+
+    wb = create_workbook()
+    write_dsr_sheet(wb, f"DSR_{district_name}_{date_str}",
+                    f"Daily Status Report - {district_name}", date_str,
+                    iter_entry_groups(itertools.chain([first], entries)))
+    return save_to_tempfile(wb)
+
+def _render_district_file(path, district_name, date_str, entry_groups):
+    """Process pool worker: render one district workbook from iter_entry_groups output"""
+    wb = create_workbook()
+    write_dsr_sheet(wb, f"DSR_{district_name}_{date_str}",
+                    f"Daily Status Report - {district_name}", date_str, entry_groups)
+    wb.save(path)
+    return path
+
+# Render processes, shared by every export of this process. They come from a
+# fork server (spawn where there is none): forking a web worker that runs
+# background threads can copy a lock one of them holds into the child, which
+# then hangs. The renderers only take picklable rows, so nothing is lost.
+_pool = None
+_pool_key = None
+_pool_lock = threading.Lock()
+
+def _mp_context():
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        # Children only need the renderers, not the app the server was started from
+        context.set_forkserver_preload(['app.exports'])
+        return context
+    return multiprocessing.get_context('spawn')
+
+def _render_pool(max_workers=None, replace=False):
+    global _pool, _pool_key
+    key = (os.getpid(), max_workers)
+    with _pool_lock:
+        if _pool is None or _pool_key != key or replace:
+            if _pool is not None and _pool_key[0] == os.getpid():
+                _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=_mp_context())
+            _pool_key = key
+        return _pool
+
+def _submit(max_workers, fn, *args):
+    """Queue fn(*args) on the shared render pool, replacing the pool if a worker died"""
+    try:
+        return _render_pool(max_workers).submit(fn, *args)
+    except BrokenProcessPool:
+        return _render_pool(max_workers, replace=True).submit(fn, *args)
+
+def build_district_workbooks(search_date, district_names, directory, max_workers=None):
+    """
+    Render the workbooks of several districts for one date in a process pool
+    Entries are read here, one district at a time, and rendered in parallel.
+    Yields (district_name, path) as each file under directory is finished;
+    districts without entries are skipped.
+    """
+    date_str = search_date.strftime('%Y-%m-%d')
+    futures = {}
+    try:
+        for district_name in district_names:
+            entry_groups = list(iter_entry_groups(
+                district_entries_query(district_name, search_date).yield_per(QUERY_CHUNK_SIZE)))
+            if not entry_groups:
+                continue
+            path = os.path.join(directory, f"district_{len(futures)}.xlsx")
+            futures[_submit(max_workers, _render_district_file, path, district_name, date_str, entry_groups)] = district_name
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        # Left over when the caller stops early or a render failed
+        for future in futures:
+            future.cancel()
+        wait(futures)
+
+# Statewide export: one sheet per district or per form type
+
+# Sheet key column and row ordering for each grouping
+STATE_GROUPINGS = {
+    'district': (DSREntry.district_name, (DSREntry.district_name, DSREntry.form_type, DSREntry.created_at)),
+    'form': (DSREntry.form_type, (DSREntry.form_type, DSREntry.district_name, DSREntry.created_at)),
+}
+
+def _render_sheet_part(part_path, sheet_title, heading, date_str, rows, show_district):
+    """
+    Process pool worker: render one sheet into its own single-sheet workbook
+    rows are (form_type, district, time_str, data) ordered by form_type.
+    """
+    def entry_groups():
+        for form_type, items in itertools.groupby(rows, key=lambda item: item[0]):
+            if show_district:
+                yield form_type, [(district, time_str, data)
+                                  for _, district, time_str, data in items]
+            else:
+                yield form_type, [(time_str, data)
+                                  for _, _, time_str, data in items]
+
+    wb = create_workbook()
+    write_dsr_sheet(wb, sheet_title, heading, date_str, entry_groups(), show_district=show_district)
+    wb.save(part_path)
+    return part_path
+
+def _merge_sheet_parts(titles, part_paths):
+    """
+    Merge single-sheet workbooks into one file
+    openpyxl writes a skeleton workbook with every sheet declared; its empty
+    worksheet parts are then swapped for the rendered ones. All parts bind
+    the named styles in STYLE_ORDER, so they share one styles.xml.
+    """
+    skeleton = create_workbook()
+    for title in titles:
+        _bind_styles(skeleton.create_sheet(title=title))
+    skeleton_file = save_to_tempfile(skeleton)
+
+    output = tempfile.TemporaryFile()
+    with zipfile.ZipFile(skeleton_file) as src, \
+         zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as dst:
+        for item in src.infolist():
+            source, name = src, item.filename
+            part = None
+            if name.startswith('xl/worksheets/sheet') and name.endswith('.xml'):
+                part = zipfile.ZipFile(part_paths[int(name[len('xl/worksheets/sheet'):-4]) - 1])
+                source, name = part, 'xl/worksheets/sheet1.xml'
+            elif name == 'xl/styles.xml':
+                part = zipfile.ZipFile(part_paths[0])
+
+            with source.open(name) as reader, dst.open(item.filename, 'w', force_zip64=True) as writer:
+                shutil.copyfileobj(reader, writer)
+            if part is not None:
+                part.close()
+    skeleton_file.close()
+
+    output.seek(0)
+    return output
+
+def _sheet_sort_key(group_by):
+    """Sheets follow the DISTRICTS / FORM_CONFIGS order used across the app"""
+    order = DISTRICTS if group_by == 'district' else list(FORM_CONFIGS)
+    return lambda key: (order.index(key) if key in order else len(order), key)
+
+def build_state_workbook(search_date, group_by='district', max_workers=None):
+    """
+    Render the statewide DSR workbook for one date
+    All entries are read in a single streamed query; each sheet is rendered
+    in a process pool and the parts are merged into one file. Returns an
+    open temporary file positioned at the start, or None without entries.
+    """
+    sheet_column, ordering = STATE_GROUPINGS[group_by]
+    date_str = search_date.strftime('%Y-%m-%d')
+    entries = DSREntry.query.filter_by(date=search_date)\
+                            .order_by(*ordering)\
+                            .with_entities(sheet_column, DSREntry.form_type, DSREntry.district_name,
+                                           DSREntry.updated_at, DSREntry.data)\
+                            .yield_per(QUERY_CHUNK_SIZE)
+
+    futures = {}
+    with tempfile.TemporaryDirectory() as part_dir:
+        try:
+            for key, items in itertools.groupby(entries, key=lambda row: row[0]):
+                rows = [(form_type, district, updated_at.strftime('%H:%M') if updated_at else 'N/A', data)
+                        for _, form_type, district, updated_at, data in items]
+                # Sheet titles are limited to 31 characters
+                title = key[:31]
+                if group_by == 'district':
+                    heading = f"Daily Status Report - {key}"
+                else:
+                    heading = f"{FORM_CONFIGS.get(key, {}).get('name', key)} - All Districts"
+                part_path = os.path.join(part_dir, f"part_{len(futures)}.xlsx")
+                futures[key] = (title, _submit(max_workers, _render_sheet_part, part_path, title, heading,
+                                               date_str, rows, group_by == 'form'))
+
+            if not futures:
+                return None
+
+            keys = sorted(futures, key=_sheet_sort_key(group_by))
+            titles = [futures[key][0] for key in keys]
+            part_paths = [futures[key][1].result() for key in keys]
+            return _merge_sheet_parts(titles, part_paths)
+        finally:
+            # After a failure: drop queued parts, let running ones finish before part_dir goes
+            for _, future in futures.values():
+                future.cancel()
+            wait([future for _, future in futures.values()])
@@ -0,0 +1,215 @@
+"""
+Full-text search over DSR narrative fields
+The text and textarea fields of each entry are indexed as one document:
+an FTS5 table on SQLite, a tsvector column with a GIN index on
+PostgreSQL. The index follows DSREntry through entries_changed, in the
+same transaction as the entry itself, and is backfilled on startup for
+databases that predate it.
+"""
+
+import re
+import html
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import DSREntry, FORM_CONFIGS
+from app.entry_events import entries_changed
+
+TABLE = 'dsr_entry_fts'
+
+# Stemming so that "absconding" also finds "absconded"
+SQLITE_TOKENIZER = 'porter unicode61 remove_diacritics 2'
+PG_TEXT_CONFIG = 'english'
+
+MAX_RESULTS = 100
+REBUILD_CHUNK = 1000
+
+# Snippet highlight markers; replaced by <mark> once the snippet is escaped
+_START, _STOP = '\x02', '\x03'
+_TERMS = re.compile(r'"([^"]*)"|(\S+)')
+
+# Searchable fields of each form
+TEXT_FIELDS = {
+    form_type: [field['name'] for field in config['fields'] if field['type'] in ('text', 'textarea')]
+    for form_type, config in FORM_CONFIGS.items()
+}
+
+def init_app(app):
+    entries_changed.connect(_track_entries, weak=False)
+
+def document(form_type, data):
+    """The searchable text of one entry"""
+    values = (str(data.get(name) or '').strip() for name in TEXT_FIELDS.get(form_type, ()))
+    return '\n'.join(value for value in values if value)
+
+def _insert_statement(dialect_name):
+    if dialect_name == 'postgresql':
+        return text(f"INSERT INTO {TABLE} (entry_id, body, document) "
+                    f"VALUES (:id, :body, to_tsvector('{PG_TEXT_CONFIG}', :body))")
+    return text(f'INSERT INTO {TABLE} (rowid, body) VALUES (:id, :body)')
+
+def _key_column(dialect_name):
+    return 'entry_id' if dialect_name == 'postgresql' else 'rowid'
+
+def _track_entries(session, changes):
+    """Re-index the entries of a batch of changes"""
+    removed = [{'id': change.id} for change in changes if change.action in ('update', 'delete')]
+    added = []
+    for change in changes:
+        if change.action in ('insert', 'update'):
+            body = document(change.form_type, change.data or {})
+            if body:
+                added.append({'id': change.id, 'body': body})
+
+    connection = session.connection()
+    dialect_name = connection.dialect.name
+    if removed:
+        connection.execute(text(f'DELETE FROM {TABLE} WHERE {_key_column(dialect_name)} = :id'), removed)
+    if added:
+        connection.execute(_insert_statement(dialect_name), added)
+
+def ensure_index():
+    """Create the search table if missing and fill it for existing entries"""
+    with db.engine.begin() as connection:
+        if connection.dialect.name == 'postgresql':
+            connection.exec_driver_sql(
+                f'CREATE TABLE IF NOT EXISTS {TABLE} '
+                f'(entry_id INTEGER PRIMARY KEY, body TEXT NOT NULL, document TSVECTOR NOT NULL)'
+            )
+            connection.exec_driver_sql(
+                f'CREATE INDEX IF NOT EXISTS ix_{TABLE}_document ON {TABLE} USING GIN (document)'
+            )
+        else:
+            connection.exec_driver_sql(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5(body, tokenize='{SQLITE_TOKENIZER}')"
+            )
+
+    if db.session.execute(text(f'SELECT 1 FROM {TABLE} LIMIT 1')).first() is not None:
+        return
+    if db.session.query(DSREntry.id).first() is None:
+        return
+    try:
+        rebuild()
+    except IntegrityError:
+        # Another worker backfilled concurrently
+        db.session.rollback()
+
+def rebuild():
+    """Re-index every DSREntry"""
+    connection = db.session.connection()
+    insert = _insert_statement(connection.dialect.name)
+    connection.execute(text(f'DELETE FROM {TABLE}'))
+
+    rows = []
+    entries = db.session.query(DSREntry.id, DSREntry.form_type, DSREntry.data).yield_per(REBUILD_CHUNK)
+    for entry_id, form_type, data in entries:
+        body = document(form_type, data)
+        if body:
+            rows.append({'id': entry_id, 'body': body})
+        if len(rows) >= REBUILD_CHUNK:
+            connection.execute(insert, rows)
+            rows = []
+    if rows:
+        connection.execute(insert, rows)
+    db.session.commit()
+
+def fts5_query(query):
+    """
+    FTS5 MATCH expression for a search box query
+    Follows websearch_to_tsquery on PostgreSQL: every word is required,
+    "quoted words" must appear as a phrase, OR between words accepts
+    either and -word excludes a word. Anything else that FTS5 would read
+    as syntax is matched as plain text. Returns '' when nothing is searchable.
+    """
+    parts = []
+    for phrase, word in _TERMS.findall(query):
+        if not phrase and word.lower() == 'or':
+            if parts and parts[-1] not in ('OR', 'NOT'):
+                parts.append('OR')
+            continue
+        negate = not phrase and word.startswith('-')
+        term = (phrase or word).lstrip('-' if negate else '').replace('"', '')
+        if not re.search(r'\w', term):
+            continue
+        if negate:
+            # FTS5 NOT needs a left operand: "a NOT b" is a AND NOT b
+            if not parts or parts[-1] in ('OR', 'NOT'):
+                continue
+            parts.append('NOT')
+        parts.append(f'"{term}"')
+    while parts and parts[-1] in ('OR', 'NOT'):
+        parts.pop()
+    return ' '.join(parts)
+
+def _highlight(snippet):
+    return html.escape(snippet or '').replace(_START, '<mark>').replace(_STOP, '</mark>')
+
+def search(query, district_name=None, form_type=None, date_from=None, date_to=None, limit=50):
+    """
+    Ranked matches for a query, best first
+    Returns a list of dicts with the entry id, district, form_type, date,
+    an HTML snippet with the matched words in <mark> and the score.
+    """
+    params = {'limit': max(1, min(limit, MAX_RESULTS)), 'start': _START, 'stop': _STOP}
+    filters = []
+    for column, key, value in (('district_name', 'district_name', district_name),
+                               ('form_type', 'form_type', form_type)):
+        if value:
+            filters.append(f'e.{column} = :{key}')
+            params[key] = value
+    if date_from:
+        filters.append('e.date >= :date_from')
+        params['date_from'] = date_from.isoformat()
+    if date_to:
+        filters.append('e.date <= :date_to')
+        params['date_to'] = date_to.isoformat()
+    where = ''.join(f' AND {condition}' for condition in filters)
+
+    if db.engine.dialect.name == 'postgresql':
+        params['query'] = query
+        params['options'] = f'StartSel={_START}, StopSel={_STOP}, MaxWords=30, MinWords=10, MaxFragments=2'
+        # Headlines are only built for the page of results, not every match
+        sql = text(f"""
+            SELECT m.id, m.district_name, m.form_type, m.date, m.score,
+                   ts_headline('{PG_TEXT_CONFIG}', f.body, websearch_to_tsquery('{PG_TEXT_CONFIG}', :query),
+                               :options) AS snippet
+            FROM (
+                SELECT e.id, e.district_name, e.form_type, e.date, ts_rank_cd(f.document, q) AS score
+                FROM {TABLE} f
+                JOIN dsr_entry e ON e.id = f.entry_id,
+                     websearch_to_tsquery('{PG_TEXT_CONFIG}', :query) q
+                WHERE f.document @@ q{where}
+                ORDER BY score DESC, e.date DESC
+                LIMIT :limit
+            ) m
+            JOIN {TABLE} f ON f.entry_id = m.id
+            ORDER BY m.score DESC, m.date DESC
+        """)
+    else:
+        params['query'] = fts5_query(query)
+        if not params['query']:
+            return []
+        # CROSS JOIN keeps the FTS5 match as the outer loop; otherwise the
+        # planner may run the full-text query once per filtered entry
+        sql = text(f"""
+            SELECT e.id, e.district_name, e.form_type, e.date, -{TABLE}.rank AS score,
+                   snippet({TABLE}, 0, :start, :stop, '...', 16) AS snippet
+            FROM {TABLE}
+            CROSS JOIN dsr_entry e ON e.id = {TABLE}.rowid
+            WHERE {TABLE} MATCH :query{where}
+            ORDER BY {TABLE}.rank
+            LIMIT :limit
+        """)
+
+    results = []
+    for row in db.session.execute(sql, params):
+        results.append({
+            'id': row.id,
+            'district': row.district_name,
+            'form_type': row.form_type,
+            'form_name': FORM_CONFIGS.get(row.form_type, {}).get('name', row.form_type),
+            'date': row.date if isinstance(row.date, str) else row.date.strftime('%Y-%m-%d'),
+            'snippet': _highlight(row.snippet),
+            'score': round(float(row.score), 4)
+        })
+    return results
@@ -0,0 +1,168 @@
+"""
+Bulk import of DSR entries from Excel workbooks
+The sheet is read in openpyxl read-only mode, one row at a time, and
+valid rows are inserted and committed in batches of IMPORT_BATCH_SIZE,
+so memory stays flat however long the sheet is. Columns are matched to
+form fields by label (or field name); unmatched columns are ignored.
+"""
+
+import re
+from datetime import date, datetime, time
+from zipfile import BadZipFile
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.exceptions import InvalidFileException
+from app.entry_events import bulk_insert_entries
+from app.validation import validate_row
+from app.write_queue import write_queue
+
+# Valid rows inserted and committed together
+IMPORT_BATCH_SIZE = 500
+
+# Rows scanned for the header row (title lines may sit above it)
+HEADER_SEARCH_ROWS = 10
+
+# Row errors listed in full in the summary; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+class WorkbookImportError(ValueError):
+    """The workbook cannot be imported at all (unreadable, no matching header)"""
+
+def _normalise(text):
+    """Compare headers case-insensitively, ignoring spacing, punctuation and a trailing '*'"""
+    return re.sub(r'[^a-z0-9]+', ' ', str(text).lower()).strip()
+
+def _header_lookup(form_config):
+    lookup = {}
+    for field in form_config['fields']:
+        lookup.setdefault(_normalise(field['label']), field['name'])
+        lookup.setdefault(_normalise(field['name']), field['name'])
+    return lookup
+
+def map_headers(form_config, header_row):
+    """
+    Match header cells to form fields
+    Returns (columns, ignored): columns maps cell index -> field name,
+    ignored lists the headers that match no field.
+    Raises WorkbookImportError when two columns map to the same field.
+    """
+    lookup = _header_lookup(form_config)
+    labels = {field['name']: field['label'] for field in form_config['fields']}
+    columns = {}
+    ignored = []
+    for index, header in enumerate(header_row):
+        if header is None or not str(header).strip():
+            continue
+        name = lookup.get(_normalise(header))
+        if name is None:
+            ignored.append(str(header).strip())
+        elif name in columns.values():
+            raise WorkbookImportError(f"More than one column matches '{labels[name]}'")
+        else:
+            columns[index] = name
+    return columns, ignored
+
+def _cell_value(value):
+    """Convert a cell to the string form the entry forms submit"""
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d') if value.time() == time() else value.strftime('%Y-%m-%d %H:%M')
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, time):
+        return value.strftime('%H:%M')
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def _open_sheet(fileobj, sheet_name=None):
+    try:
+        wb = load_workbook(fileobj, read_only=True, data_only=True)
+    except (BadZipFile, InvalidFileException, KeyError, OSError):
+        raise WorkbookImportError('File is not a readable .xlsx workbook')
+    if sheet_name:
+        if sheet_name not in wb.sheetnames:
+            wb.close()
+            raise WorkbookImportError(f"Workbook has no sheet named '{sheet_name}'")
+        return wb, wb[sheet_name]
+    return wb, wb.active
+
+def import_workbook(fileobj, form_type, form_config, district_name, entry_date, user_id,
+                    dry_run=False, sheet_name=None):
+    """
+    Import one sheet of entries for a form, district and date
+
+    Rows that fail validation are skipped and reported with their sheet
+    row number; blank rows are skipped silently. With dry_run nothing is
+    written and the summary shows what an import would do.
+    Raises WorkbookImportError when the sheet cannot be read or mapped.
+    """
+    wb, ws = _open_sheet(fileobj, sheet_name)
+    summary = {
+        'sheet': ws.title,
+        'dry_run': dry_run,
+        'header_row': None,
+        'columns': {},
+        'ignored_columns': [],
+        'missing_fields': [],
+        'rows': 0,
+        'valid': 0,
+        'inserted': 0,
+        'failed': 0,
+        'errors': []
+    }
+    batch = []
+
+    def flush():
+        if batch and not dry_run:
+            rows = list(batch)
+            write_queue.run(lambda session: bulk_insert_entries(
+                session, district_name, form_type, entry_date, user_id, rows))
+            summary['inserted'] += len(rows)
+        batch.clear()
+
+    try:
+        columns = None
+        for row_number, values in enumerate(ws.iter_rows(values_only=True), start=1):
+            if columns is None:
+                if row_number > HEADER_SEARCH_ROWS:
+                    break
+                mapped, ignored = map_headers(form_config, values)
+                if mapped:
+                    columns = mapped
+                    summary['header_row'] = row_number
+                    summary['ignored_columns'] = ignored
+                continue
+
+            row = {}
+            for index, name in columns.items():
+                value = values[index] if index < len(values) else None
+                if value is not None:
+                    row[name] = _cell_value(value)
+            if not any(str(value).strip() for value in row.values()):
+                continue
+
+            summary['rows'] += 1
+            data, errors = validate_row(form_config, row)
+            if errors:
+                summary['failed'] += 1
+                if len(summary['errors']) < MAX_REPORTED_ERRORS:
+                    summary['errors'].append({'row': row_number, 'errors': errors})
+                continue
+
+            summary['valid'] += 1
+            batch.append(data)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                flush()
+        flush()
+    finally:
+        wb.close()
+
+    if columns is None:
+        raise WorkbookImportError(f'No header row matching the {form_config["name"]} fields '
+                                  f'in the first {HEADER_SEARCH_ROWS} rows')
+
+    labels = {field['name']: field['label'] for field in form_config['fields']}
+    summary['columns'] = {labels[name]: get_column_letter(index + 1) for index, name in columns.items()}
+    summary['missing_fields'] = [field['label'] for field in form_config['fields']
+                                 if field['name'] not in columns.values()]
+    return summary
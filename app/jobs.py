@@ -0,0 +1,411 @@
+"""
+Background jobs for exports and heavy reports
+A job is a row in the job table. Runner threads claim queued rows with a
+conditional UPDATE, so any number of threads and processes can share the
+queue in the application database. Each web process runs JOB_WORKERS
+runner threads, started with its first request; alternatively set
+JOB_WORKERS=0 and run run_jobs.py next to the application. Submitting a
+job identical to a queued or running one returns that job; a partial
+unique index on the job table makes this hold across processes.
+
+A claimed job is leased for JOB_TIMEOUT seconds, and the runner renews
+the lease every third of that while the job runs, so long exports keep
+it. Once the lease runs out (the runner's process died) the job is
+requeued, or failed on its last attempt. Other failures are retried up to JOB_MAX_ATTEMPTS times with
+a doubling delay, except JobError which fails at once. Cancelling a queued
+job takes effect immediately; a running job is left to finish and its
+result is discarded. Results are files under JOB_RESULTS_DIR, removed with
+their job after JOB_RESULT_TTL seconds.
+"""
+
+import os
+import json
+import time
+import shutil
+import socket
+import hashlib
+import logging
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func, update
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from app.models import Job, ACTIVE_JOB, DISTRICTS
+from app.export_cache import export_cache
+from app.exports import build_district_workbook, build_state_workbook, STATE_GROUPINGS, XLSX_MIMETYPE
+
+log = logging.getLogger(__name__)
+
+class JobError(Exception):
+    """A job failure that retrying cannot fix (no data, bad parameters)"""
+
+# validate(params) returns the cleaned params or raises ValueError;
+# run(params, path) writes the result file and returns (download name, mimetype),
+# or returns None for jobs without a downloadable result
+JobKind = namedtuple('JobKind', 'validate run')
+KINDS = {}
+
+ACTIVE = ('queued', 'running')
+FINISHED = ('succeeded', 'failed', 'cancelled')
+
+def job_kind(name, validate):
+    """Register a job function under a kind name"""
+    def register(run):
+        KINDS[name] = JobKind(validate, run)
+        return run
+    return register
+
+def _timestamp(value):
+    return value.isoformat(timespec='seconds') if value else None
+
+def _elapsed_ms(start, end):
+    return round((end - start).total_seconds() * 1000) if start and end else None
+
+class JobRunner:
+    """Queue operations and the runner threads of this process"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.workers = 0
+        self.poll_interval = 2.0
+        self.timeout = 900
+        self.max_attempts = 3
+        self.retry_delay = 30
+        self.results_dir = None
+        self.result_ttl = 24 * 60 * 60
+        self.succeeded = 0
+        self.failed = 0
+        self._pid = None
+        self._threads = []
+        self._next_maintenance = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config['JOB_WORKERS']
+        self.poll_interval = app.config['JOB_POLL_INTERVAL']
+        self.timeout = app.config['JOB_TIMEOUT']
+        self.max_attempts = app.config['JOB_MAX_ATTEMPTS']
+        self.retry_delay = app.config['JOB_RETRY_DELAY']
+        self.results_dir = str(app.config['JOB_RESULTS_DIR'])
+        self.result_ttl = app.config['JOB_RESULT_TTL']
+        os.makedirs(self.results_dir, exist_ok=True)
+        if self.workers:
+            app.before_request(self._ensure_started)
+
+    # Queue operations (request side)
+
+    @staticmethod
+    def dedupe_key(kind, params):
+        """Identity of a job: kind and validated params"""
+        return hashlib.sha256(f"{kind}|{json.dumps(params, sort_keys=True)}".encode('utf-8')).hexdigest()
+
+    def submit(self, kind, params, user_id=None, delay=0):
+        """
+        Queue a job, to start no earlier than delay seconds from now, and
+        return it; a queued or running job of the same kind and params is
+        returned instead of queueing a duplicate.
+        Raises ValueError for an unknown kind or invalid params.
+        """
+        if kind not in KINDS:
+            raise ValueError('Unknown job kind')
+        params = KINDS[kind].validate(params)
+        key = self.dedupe_key(kind, params)
+
+        dialect = postgresql if db.session.get_bind().dialect.name == 'postgresql' else sqlite
+        while True:
+            existing = Job.query.filter(Job.dedupe_key == key, Job.status.in_(ACTIVE),
+                                        Job.cancel_requested.is_(False)).first()
+            if existing is not None:
+                return existing
+
+            # The unique index ux_job_active settles a race between processes
+            # submitting the same job: the loser inserts nothing and loops to
+            # return the winner's row
+            job_id = db.session.execute(
+                dialect.insert(Job).values(kind=kind, params=params, dedupe_key=key, max_attempts=self.max_attempts,
+                                           user_id=user_id, run_after=datetime.utcnow() + timedelta(seconds=delay))
+                .on_conflict_do_nothing(index_elements=[Job.dedupe_key], index_where=ACTIVE_JOB)
+                .returning(Job.id)).scalar()
+            db.session.commit()
+            if job_id is not None:
+                break
+        with self._wakeup:
+            self._wakeup.notify()
+        return db.session.get(Job, job_id)
+
+    def cancel(self, job):
+        """Cancel a queued job, or flag a running one; False when it has already finished"""
+        if job.status in FINISHED:
+            return False
+        result = db.session.execute(update(Job).where(Job.id == job.id, Job.status == 'queued')
+                                    .values(status='cancelled', finished_at=datetime.utcnow()))
+        if not result.rowcount:
+            db.session.execute(update(Job).where(Job.id == job.id, Job.status == 'running')
+                               .values(cancel_requested=True))
+        db.session.commit()
+        db.session.refresh(job)
+        return job.status != 'succeeded'
+
+    def result_path(self, job):
+        return os.path.join(self.results_dir, f"job_{job.id}")
+
+    def describe(self, job):
+        """JSON-ready status of a job with its timing"""
+        return {
+            'id': job.id,
+            'kind': job.kind,
+            'params': job.params,
+            'status': job.status,
+            'attempts': job.attempts,
+            'max_attempts': job.max_attempts,
+            'cancel_requested': job.cancel_requested,
+            'error': job.error,
+            'created_at': _timestamp(job.created_at),
+            'started_at': _timestamp(job.started_at),
+            'finished_at': _timestamp(job.finished_at),
+            'queued_ms': _elapsed_ms(job.created_at, job.started_at),
+            'run_ms': _elapsed_ms(job.started_at, job.finished_at),
+            'result': {
+                'name': job.result_name,
+                'mimetype': job.result_mimetype,
+                'bytes': job.result_bytes
+            } if job.status == 'succeeded' and job.result_name else None
+        }
+
+    def stats(self):
+        """Jobs per status in the queue and what this process's runners have done"""
+        counts = dict(db.session.query(Job.status, func.count(Job.id)).group_by(Job.status).all())
+        return {
+            'jobs': {status: counts.get(status, 0) for status in ACTIVE + FINISHED},
+            'runner_threads': sum(thread.is_alive() for thread in self._threads) if self._pid == os.getpid() else 0,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'pid': os.getpid()
+        }
+
+    # Runner threads
+
+    def start(self, workers):
+        """Start runner threads in this process (once per process)"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._threads = [threading.Thread(target=self._work, name=f'dsr-job-{number}', daemon=True)
+                             for number in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def _ensure_started(self):
+        # Started lazily so every forked worker process gets its own runners
+        if self._pid != os.getpid():
+            self.start(self.workers)
+
+    def _work(self):
+        with self.app.app_context():
+            while True:
+                claimed = None
+                try:
+                    self._maintain()
+                    claimed = self._claim()
+                except Exception:
+                    log.exception('Job queue poll failed')
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+                if claimed is None:
+                    with self._wakeup:
+                        self._wakeup.wait(timeout=self.poll_interval)
+                    continue
+                try:
+                    self._run(*claimed)
+                except Exception:
+                    log.exception('Job %s could not be recorded', claimed[0])
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+    def _claim(self):
+        """Take the oldest runnable job; returns (job id, worker token) or None"""
+        now = datetime.utcnow()
+        candidates = db.session.query(Job.id).filter(Job.status == 'queued', Job.run_after <= now)\
+                                             .order_by(Job.id).limit(5).all()
+        db.session.rollback()
+        for (job_id,) in candidates:
+            token = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}:{os.urandom(4).hex()}"
+            result = db.session.execute(update(Job).where(Job.id == job_id, Job.status == 'queued').values(
+                status='running', attempts=Job.attempts + 1, worker=token, started_at=now,
+                finished_at=None, lease_until=now + timedelta(seconds=self.timeout)))
+            db.session.commit()
+            if result.rowcount:
+                return job_id, token
+        return None
+
+    def _run(self, job_id, token):
+        job = db.session.get(Job, job_id)
+        kind, params = KINDS.get(job.kind), dict(job.params)
+        # End the read transaction before the long-running work
+        db.session.commit()
+
+        path = self.result_path(job)
+        partial = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._renew_lease, args=(db.engine, job_id, token, done),
+                                     name=f'dsr-job-lease-{job_id}', daemon=True)
+        heartbeat.start()
+        try:
+            if kind is None:
+                raise JobError(f"Unknown job kind {job.kind}")
+            result_file = kind.run(params, partial)
+        except Exception as e:
+            db.session.rollback()
+            if os.path.exists(partial):
+                os.remove(partial)
+            self._record_failure(job_id, token, e)
+            return
+        finally:
+            done.set()
+            heartbeat.join()
+
+        # Publish the file only while this runner still holds the job
+        now = datetime.utcnow()
+        name, mimetype = result_file or (None, None)
+        result = db.session.execute(update(Job).where(Job.id == job_id, Job.worker == token,
+                                                      Job.status == 'running', Job.cancel_requested.is_(False)).values(
+            status='succeeded', finished_at=now, lease_until=None, error=None, result_name=name,
+            result_mimetype=mimetype, result_bytes=os.path.getsize(partial) if result_file else None))
+        if result.rowcount:
+            if result_file:
+                os.replace(partial, path)
+            db.session.commit()
+            self.succeeded += 1
+            return
+
+        if os.path.exists(partial):
+            os.remove(partial)
+        db.session.execute(update(Job).where(Job.id == job_id, Job.worker == token, Job.status == 'running')
+                           .values(status='cancelled', finished_at=now, lease_until=None))
+        db.session.commit()
+
+    def _renew_lease(self, engine, job_id, token, done):
+        """Extend the lease of a running job every third of JOB_TIMEOUT until done is set"""
+        while not done.wait(self.timeout / 3):
+            try:
+                with engine.begin() as connection:
+                    connection.execute(update(Job).where(Job.id == job_id, Job.worker == token,
+                                                         Job.status == 'running').values(
+                        lease_until=datetime.utcnow() + timedelta(seconds=self.timeout)))
+            except Exception:
+                # The next renewal may get through before the lease runs out
+                log.exception('Could not renew the lease of job %s', job_id)
+
+    def _record_failure(self, job_id, token, error):
+        job = db.session.get(Job, job_id)
+        if job is None or job.worker != token or job.status != 'running':
+            return
+        now = datetime.utcnow()
+        job.error = str(error) or error.__class__.__name__
+        job.lease_until = None
+        if job.cancel_requested:
+            job.status, job.finished_at = 'cancelled', now
+        elif isinstance(error, JobError) or job.attempts >= job.max_attempts:
+            job.status, job.finished_at = 'failed', now
+            self.failed += 1
+        else:
+            job.status = 'queued'
+            job.run_after = now + timedelta(seconds=self.retry_delay * 2 ** (job.attempts - 1))
+        db.session.commit()
+        if not isinstance(error, JobError):
+            log.warning('Job %s (%s) attempt %s failed: %s', job_id, job.kind, job.attempts, job.error)
+
+    def _maintain(self):
+        """Requeue jobs whose lease ran out and drop expired results, once a minute per process"""
+        with self._lock:
+            if time.monotonic() < self._next_maintenance:
+                return
+            self._next_maintenance = time.monotonic() + 60
+
+        now = datetime.utcnow()
+        expired = Job.query.filter(Job.status == 'running', Job.lease_until < now).all()
+        for job in expired:
+            job.error = f"Timed out after {self.timeout} seconds"
+            job.worker, job.lease_until = None, None
+            if job.attempts >= job.max_attempts or job.cancel_requested:
+                job.status, job.finished_at = ('cancelled' if job.cancel_requested else 'failed'), now
+            else:
+                job.status, job.run_after = 'queued', now
+
+        old = Job.query.filter(Job.status.in_(FINISHED),
+                               Job.finished_at < now - timedelta(seconds=self.result_ttl)).all()
+        for job in old:
+            if os.path.exists(self.result_path(job)):
+                os.remove(self.result_path(job))
+            db.session.delete(job)
+        db.session.commit()
+
+jobs = JobRunner()
+
+# Export jobs
+
+def _parse_date(params):
+    try:
+        return datetime.strptime(str(params.get('date')), '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError('Invalid date format')
+
+def _validate_district_dsr(params):
+    if params.get('district') not in DISTRICTS:
+        raise ValueError('Unknown district')
+    return {'district': params['district'], 'date': _parse_date(params).strftime('%Y-%m-%d')}
+
+def _validate_state_dsr(params):
+    group_by = params.get('group_by') or 'district'
+    if group_by not in STATE_GROUPINGS:
+        raise ValueError('Invalid grouping')
+    return {'date': _parse_date(params).strftime('%Y-%m-%d'), 'group_by': group_by}
+
+@job_kind('district_dsr', _validate_district_dsr)
+def district_dsr(params, path):
+    """District DSR workbook, through the export cache like download_dsr"""
+    district_name, search_date = params['district'], _parse_date(params)
+    version = export_cache.data_version(district_name, search_date)
+    if not version[1]:
+        raise JobError('No data found for the selected date')
+
+    cached = export_cache.get(district_name, search_date, version)
+    if cached is None:
+        output = build_district_workbook(district_name, search_date)
+        if output is None:
+            raise JobError('No data found for the selected date')
+        with output:
+            cached = export_cache.put(district_name, search_date, version, output)
+    with cached, open(path, 'wb') as out:
+        shutil.copyfileobj(cached, out)
+    return f"DSR_{district_name}_{params['date']}.xlsx", XLSX_MIMETYPE
+
+@job_kind('state_dsr', _validate_state_dsr)
+def state_dsr(params, path):
+    """Statewide DSR workbook, one sheet per district or per form, through the export cache"""
+    search_date, group_by = _parse_date(params), params['group_by']
+    version = export_cache.data_version(None, search_date)
+    if not version[1]:
+        raise JobError('No data found for the selected date')
+
+    cached = export_cache.get(None, search_date, version, variant=group_by)
+    if cached is None:
+        output = build_state_workbook(search_date, group_by,
+                                      max_workers=current_app.config.get('EXPORT_WORKERS'))
+        if output is None:
+            raise JobError('No data found for the selected date')
+        with output:
+            cached = export_cache.put(None, search_date, version, output, variant=group_by)
+    with cached, open(path, 'wb') as out:
+        shutil.copyfileobj(cached, out)
+    return f"DSR_State_{params['date']}.xlsx", XLSX_MIMETYPE
@@ -0,0 +1,110 @@
+"""
+Typed access to fields inside DSREntry.data
+DSREntry.data is a native JSON column: JSONB on PostgreSQL, JSON text read
+through the JSON1 functions on SQLite. json_field(column, name) is the SQL
+expression for one field as text and is always rendered the same way
+(the field name is inlined, not bound), so the expression indexes declared
+in models.py can serve filters on it. field_filter() builds the criterion
+for the form_view field filter.
+"""
+
+import re
+from sqlalchemy import Numeric, String, and_, literal_column
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+FIELD_NAME = re.compile(r'^[a-z_][a-z0-9_]*$')
+
+# Text that json_number reads as a number, for fullmatch(): an optional
+# sign, digits and an optional fraction (the PostgreSQL regex below)
+NUMBER = re.compile(r'\s*[-+]?[0-9]+(\.[0-9]+)?\s*')
+
+# Filter operators offered by form_view
+FILTER_OPS = {
+    'eq': 'equals',
+    'contains': 'contains',
+    'gte': 'at least',
+    'lte': 'at most'
+}
+
+class json_field(FunctionElement):
+    """data ->> 'name' as text (NULL when the key is missing)"""
+    type = String()
+    inherit_cache = True
+
+    def __init__(self, column, name):
+        if not FIELD_NAME.match(name):
+            raise ValueError(f"Invalid field name '{name}'")
+        super().__init__(column, literal_column(name))
+
+class json_number(FunctionElement):
+    """A json_field as a number; NULL when empty or not numeric"""
+    type = Numeric()
+    inherit_cache = True
+
+    def __init__(self, column, name):
+        if not FIELD_NAME.match(name):
+            raise ValueError(f"Invalid field name '{name}'")
+        super().__init__(column, literal_column(name))
+
+def _parts(element, compiler, **kw):
+    column, name = element.clauses
+    return compiler.process(column, **kw), name.name
+
+@compiles(json_field)
+def _compile_json_field(element, compiler, **kw):
+    column, name = _parts(element, compiler, **kw)
+    return f"json_extract({column}, '$.{name}')"
+
+@compiles(json_field, 'postgresql')
+def _compile_json_field_pg(element, compiler, **kw):
+    column, name = _parts(element, compiler, **kw)
+    return f"({column} ->> '{name}')"
+
+@compiles(json_number)
+def _compile_json_number(element, compiler, **kw):
+    column, name = _parts(element, compiler, **kw)
+    # Same test as the PostgreSQL regex below, spelt with GLOB: an optional
+    # sign, digits, and at most one '.' with digits on both sides
+    text = f"trim(json_extract({column}, '$.{name}'), ' ' || char(9, 10, 11, 12, 13))"
+    return (f"(CASE WHEN ({text} GLOB '[0-9]*' OR {text} GLOB '[-+][0-9]*') "
+            f"AND substr({text}, 2) NOT GLOB '*[^0-9.]*' "
+            f"AND {text} NOT GLOB '*.*.*' AND {text} NOT GLOB '*.' "
+            f"THEN CAST({text} AS REAL) END)")
+
+@compiles(json_number, 'postgresql')
+def _compile_json_number_pg(element, compiler, **kw):
+    column, name = _parts(element, compiler, **kw)
+    value = f"({column} ->> '{name}')"
+    return (f"(CASE WHEN {value} ~ '^\\s*[-+]?[0-9]+(\\.[0-9]+)?\\s*$' "
+            f"THEN CAST({value} AS NUMERIC) END)")
+
+def field_filter(column, form_config, name, op, value):
+    """
+    SQL criterion for one form field filter
+    Number fields compare numerically for gte/lte; other fields compare as
+    text, which also orders YYYY-MM-DD dates. Raises ValueError for an
+    unknown field or operator, or a non-numeric bound on a number field.
+    """
+    fields = {field['name']: field for field in form_config['fields']}
+    if name not in fields:
+        raise ValueError(f"Unknown field '{name}'")
+    if op not in FILTER_OPS:
+        raise ValueError(f"Unknown filter '{op}'")
+
+    field = json_field(column, name)
+    if op == 'eq':
+        return field == value
+    if op == 'contains':
+        escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return field.ilike(f'%{escaped}%', escape='\\')
+
+    if fields[name]['type'] == 'number':
+        try:
+            bound = float(value)
+        except ValueError:
+            raise ValueError(f"'{value}' is not a number")
+        number = json_number(column, name)
+        return number >= bound if op == 'gte' else number <= bound
+    # Empty values are not "at most" anything
+    return and_(field != '', field >= value if op == 'gte' else field <= value)
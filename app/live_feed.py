@@ -0,0 +1,279 @@
+"""
+Live dashboard feed over Server-Sent Events
+Dashboards subscribe to /live instead of reloading. Saved and deleted
+entries (through entries_changed) and new control room uploads (record())
+write a small LiveEvent row in the same transaction as the change, and
+once it commits the event goes to this process's subscribers straight
+away. One poller thread per process reads the LiveEvent rows written by
+other worker processes, only while someone here is subscribed, and hands
+them to its own subscribers; rows are pruned after LIVE_FEED_RETENTION.
+
+Subscribers wait on a condition variable between events, so an idle
+connection costs a sleeping thread and a comment line every
+LIVE_FEED_HEARTBEAT seconds. Each connection still holds a worker thread,
+so a response ends after LIVE_FEED_MAX_STREAM seconds and the browser
+reconnects; with sync Gunicorn workers this hands the worker back to
+other requests. The SSE id of an event is its LiveEvent id, which lets a
+reconnecting browser resume from the log (or reload when it has missed
+too much).
+"""
+
+import os
+import json
+import time
+import socket
+import logging
+import threading
+from collections import deque, namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from app import db
+from app.models import LiveEvent, FORM_CONFIGS
+from app.entry_events import entries_changed
+
+log = logging.getLogger(__name__)
+
+# Ids re-read behind the poll cursor
+POLL_LOOKBACK = 50
+
+# seq orders events within this process; id is the LiveEvent row id
+FeedEvent = namedtuple('FeedEvent', 'seq id kind payload')
+
+class LiveFeed:
+    """In-process publish/subscribe broker fed by the LiveEvent log"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.poll_interval = 1.0
+        self.heartbeat = 20
+        self.retention = 600
+        self.max_stream = 300
+        self.published = 0
+        self.received = 0
+        self._events = deque()
+        self._seq = 0
+        self._subscribers = 0
+        self._cursor = None
+        self._next_prune = 0
+        self._seen = deque(maxlen=POLL_LOOKBACK * 10)
+        self._pid = None
+        self._origin = None
+        self._origin_pid = None
+        self._cond = threading.Condition()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.poll_interval = app.config['LIVE_FEED_POLL_INTERVAL']
+        self.heartbeat = app.config['LIVE_FEED_HEARTBEAT']
+        self.retention = app.config['LIVE_FEED_RETENTION']
+        self.max_stream = app.config['LIVE_FEED_MAX_STREAM']
+        self._events = deque(maxlen=app.config['LIVE_FEED_BACKLOG'])
+        entries_changed.connect(self._record_entries, weak=False)
+        if not event.contains(db.session, 'after_commit', self._deliver_committed):
+            event.listen(db.session, 'after_commit', self._deliver_committed)
+            event.listen(db.session, 'after_rollback', self._discard_pending)
+
+    # Publishing
+
+    def record(self, session, kind, payload):
+        """
+        Write an event in the session's transaction; subscribers get it once
+        the transaction commits, and never if it rolls back
+        """
+        connection = session.connection()
+        now = datetime.utcnow()
+        result = connection.execute(LiveEvent.__table__.insert().values(
+            created_at=now, origin=self._process_origin(), kind=kind, payload=payload))
+        session.info.setdefault('live_events', []).append((result.inserted_primary_key[0], kind, payload))
+
+        if time.monotonic() >= self._next_prune:
+            self._next_prune = time.monotonic() + 60
+            table = LiveEvent.__table__
+            connection.execute(table.delete().where(table.c.created_at < now - timedelta(seconds=self.retention)))
+
+    def _record_entries(self, session, changes):
+        """One 'entries' event per action, district, form and date of a batch"""
+        groups = {}
+        for change in changes:
+            if None in (change.date, change.district_name, change.form_type):
+                continue
+            key = (change.action, change.district_name, change.form_type, change.date)
+            group = groups.setdefault(key, {'count': 0, 'updated_at': None})
+            group['count'] += 1
+            if change.updated_at and (group['updated_at'] is None or change.updated_at > group['updated_at']):
+                group['updated_at'] = change.updated_at
+
+        for (action, district_name, form_type, entry_date), group in groups.items():
+            self.record(session, 'entries', {
+                'action': action,
+                'district': district_name,
+                'form_type': form_type,
+                'form_name': FORM_CONFIGS.get(form_type, {}).get('name', form_type),
+                'date': entry_date.strftime('%Y-%m-%d'),
+                'count': group['count'],
+                'updated_at': group['updated_at'].strftime('%d-%m-%Y %H:%M') if group['updated_at'] else None
+            })
+
+    def _deliver_committed(self, session):
+        pending = session.info.pop('live_events', None)
+        if pending:
+            self._append(pending)
+            self.published += len(pending)
+
+    def _discard_pending(self, session):
+        session.info.pop('live_events', None)
+
+    def _append(self, events):
+        with self._cond:
+            for event_id, kind, payload in events:
+                self._seq += 1
+                self._events.append(FeedEvent(self._seq, event_id, kind, payload))
+            self._cond.notify_all()
+
+    # Subscribing
+
+    def subscribe(self, accept, last_event_id=None):
+        """
+        Generator of SSE text for the events accept(kind, payload) allows
+        Yields a heartbeat comment when nothing happened for a while and a
+        'resync' event when events were missed (the page should reload).
+        Call it inside the request: the catch-up after last_event_id is read
+        from the log here, before the response starts streaming.
+        """
+        with self._cond:
+            cursor = self._seq
+        if last_event_id is None:
+            missed, position = [], db.session.query(db.func.max(LiveEvent.id)).scalar() or 0
+        else:
+            missed, position = self._missed_since(last_event_id), last_event_id
+        return self._stream(accept, cursor, missed, position)
+
+    def _stream(self, accept, cursor, missed, position):
+        with self._cond:
+            self._subscribers += 1
+            self._cond.notify_all()
+        self._ensure_poller()
+
+        try:
+            yield f'retry: {int(self.poll_interval * 1000) + 2000}\n\n'
+            if missed is None:
+                yield self._format('resync', {}, None)
+                missed = []
+            replayed = set()
+            for event_id, kind, payload in missed:
+                replayed.add(event_id)
+                position = max(position, event_id)
+                if accept(kind, payload):
+                    yield self._format(kind, payload, event_id)
+
+            deadline = time.monotonic() + self.max_stream
+            while time.monotonic() < deadline:
+                with self._cond:
+                    if self._seq == cursor:
+                        self._cond.wait(timeout=min(self.heartbeat, max(deadline - time.monotonic(), 0)))
+                    oldest = self._events[0].seq if self._events else self._seq + 1
+                    pending = [feed_event for feed_event in self._events if feed_event.seq > cursor]
+                    overflowed = oldest > cursor + 1
+                    cursor = self._seq
+
+                if overflowed:
+                    yield self._format('resync', {}, None)
+                if not pending:
+                    yield ': keepalive\n\n'
+                for feed_event in pending:
+                    position = max(position, feed_event.id)
+                    if feed_event.id not in replayed and accept(feed_event.kind, feed_event.payload):
+                        yield self._format(feed_event.kind, feed_event.payload, feed_event.id)
+
+            # An id without data sends no event but becomes the browser's
+            # Last-Event-ID, so the reconnect resumes here even when no
+            # event passed the filter; then end the response (see retry)
+            yield f'id: {position}\n\n'
+        finally:
+            with self._cond:
+                self._subscribers -= 1
+
+    def _missed_since(self, last_event_id):
+        """Logged events after last_event_id, or None when the log no longer reaches back that far"""
+        table = LiveEvent.__table__
+        limit = self._events.maxlen
+        rows = db.session.execute(table.select().where(table.c.id > last_event_id)
+                                  .order_by(table.c.id).limit(limit + 1)).all()
+        oldest = db.session.query(db.func.min(LiveEvent.id)).scalar()
+        if len(rows) > limit or oldest is None or oldest > last_event_id + 1:
+            return None
+        return [(row.id, row.kind, row.payload) for row in rows]
+
+    @staticmethod
+    def _format(kind, payload, event_id):
+        lines = [f'event: {kind}']
+        if event_id is not None:
+            lines.append(f'id: {event_id}')
+        lines.append(f'data: {json.dumps(payload, separators=(",", ":"))}')
+        return '\n'.join(lines) + '\n\n'
+
+    # Fan-out from other worker processes
+
+    def _process_origin(self):
+        if self._origin_pid != os.getpid():
+            self._origin = f'{socket.gethostname()}:{os.getpid()}'
+            self._origin_pid = os.getpid()
+        return self._origin
+
+    def _ensure_poller(self):
+        # Started lazily so every forked worker process gets its own poller
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._cursor = None
+        threading.Thread(target=self._poller, name='dsr-live-feed', daemon=True).start()
+
+    def _poller(self):
+        # Reads a few ids behind the cursor: on PostgreSQL a row can commit
+        # after rows with higher ids have already been read
+        table = LiveEvent.__table__
+        origin = self._process_origin()
+        with self.app.app_context():
+            while True:
+                with self._cond:
+                    while not self._subscribers:
+                        # Nobody listening in this process: stop reading the log
+                        self._cursor = None
+                        self._cond.wait()
+                try:
+                    if self._cursor is None:
+                        # Start at the end of the log; events already visible in the
+                        # lookback window are old news, only late commits there are new
+                        self._cursor = db.session.query(db.func.max(LiveEvent.id)).scalar() or 0
+                        self._seen.extend(db.session.scalars(
+                            db.select(LiveEvent.id).where(LiveEvent.id > self._cursor - POLL_LOOKBACK)))
+                    rows = db.session.execute(table.select().where(table.c.id > self._cursor - POLL_LOOKBACK)
+                                              .order_by(table.c.id).limit(500)).all()
+                    seen = set(self._seen)
+                    fresh = [row for row in rows if row.id not in seen]
+                    if fresh:
+                        self._cursor = max(self._cursor, fresh[-1].id)
+                        self._seen.extend(row.id for row in fresh)
+                        others = [(row.id, row.kind, row.payload) for row in fresh if row.origin != origin]
+                        if others:
+                            self._append(others)
+                            self.received += len(others)
+                except Exception:
+                    log.exception('Live feed poll failed')
+                finally:
+                    db.session.remove()
+                time.sleep(self.poll_interval)
+
+    def stats(self):
+        return {
+            'subscribers': self._subscribers,
+            'published': self.published,
+            'received': self.received,
+            'buffered': len(self._events),
+            'pid': os.getpid()
+        }
+
+live_feed = LiveFeed()
@@ -1,9 +1,14 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
+import json
 import pytz
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.dialects.postgresql import JSONB
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import db
+from app.json_fields import json_field
 
 # Indian Standard Time timezone
 IST = pytz.timezone('Asia/Kolkata')
@@ -43,15 +48,80 @@ class User(UserMixin, db.Model):
         self.set_password(password)
 
 class DSREntry(db.Model):
+    # Composite indexes matching the access paths in routes.py
+    # (district/form/date filters, sorted by date, updated_at or created_at).
+    # ix_dsr_entry_district_date_form also serves a district's day ordered
+    # by form and time (the DSR download)
+    __table_args__ = (
+        db.Index('ix_dsr_entry_district_date', 'district_name', 'date'),
+        db.Index('ix_dsr_entry_district_date_form', 'district_name', 'date', 'form_type', 'created_at'),
+        db.Index('ix_dsr_entry_district_updated', 'district_name', 'updated_at'),
+        db.Index('ix_dsr_entry_form_date', 'form_type', 'date'),
+        db.Index('ix_dsr_entry_date', 'date'),
+        db.Index('ix_dsr_entry_updated', 'updated_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     district_name = db.Column(db.String(100), nullable=False)
     form_type = db.Column(db.String(50), nullable=False)
     date = db.Column(db.Date, nullable=False)
-    data = db.Column(db.Text, nullable=False)  # JSON string of form data
+    data = db.Column(db.JSON().with_variant(JSONB(), 'postgresql'), nullable=False)  # form data dict
     created_at = db.Column(db.DateTime, default=ist_now)
     updated_at = db.Column(db.DateTime, default=ist_now, onupdate=ist_now)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    def field_values(self):
+        """data in FORM_CONFIGS field order (JSONB does not keep key order)"""
+        fields = FORM_CONFIGS.get(self.form_type, {}).get('fields', [])
+        ordered = {field['name']: self.data[field['name']] for field in fields if field['name'] in self.data}
+        ordered.update((key, value) for key, value in self.data.items() if key not in ordered)
+        return ordered
+
+    @property
+    def data_json(self):
+        """field_values() as a JSON string, for data attributes in templates"""
+        return json.dumps(self.field_values())
+
+# Expression indexes on the most filtered fields inside data, per form and date
+INDEXED_FIELDS = ('fir_no', 'unit_name', 'risk_flag')
+for _name in INDEXED_FIELDS:
+    db.Index(f'ix_dsr_entry_field_{_name}', DSREntry.form_type, json_field(DSREntry.data, _name), DSREntry.date)
+
+class DailySubmission(db.Model):
+    # Entry count per (date, district, form), kept in step with DSREntry by
+    # app/submissions.py so compliance views never scan DSREntry
+    date = db.Column(db.Date, primary_key=True)
+    district_name = db.Column(db.String(100), primary_key=True)
+    form_type = db.Column(db.String(50), primary_key=True)
+    entry_count = db.Column(db.Integer, nullable=False, default=0)
+    last_updated = db.Column(db.DateTime)
+
+class DailyRollup(db.Model):
+    # Sum of each number field per (form, field, date, district), kept in step
+    # with DSREntry by app/rollups.py so trends and totals never decode entries
+    form_type = db.Column(db.String(50), primary_key=True)
+    field = db.Column(db.String(100), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    district_name = db.Column(db.String(100), primary_key=True)
+    total = db.Column(db.Float, nullable=False, default=0)
+    entry_count = db.Column(db.Integer, nullable=False, default=0)
+
+class CaseMention(db.Model):
+    # FIR / case numbers and unit names found in entry data, kept in step with
+    # DSREntry by app/case_index.py so a case timeline is one indexed query
+    __table_args__ = (
+        db.Index('ix_case_mention_timeline', 'kind', 'identifier', 'date', 'entry_id'),
+        db.Index('ix_case_mention_entry', 'entry_id'),
+    )
+
+    kind = db.Column(db.String(10), primary_key=True)  # 'case' or 'unit'
+    identifier = db.Column(db.String(200), primary_key=True)  # normalised value
+    entry_id = db.Column(db.Integer, db.ForeignKey('dsr_entry.id', ondelete='CASCADE'), primary_key=True)
+    field = db.Column(db.String(50), nullable=False)
+    form_type = db.Column(db.String(50), nullable=False)
+    district_name = db.Column(db.String(100), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+
 class ControlRoomUpload(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.Date, nullable=False)
@@ -62,6 +132,82 @@ class ControlRoomUpload(db.Model):
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+# Rows of Job counted as active for deduplication (index predicate of
+# ux_job_active, repeated as the conflict target of jobs.submit)
+ACTIVE_JOB = db.text("status IN ('queued', 'running') AND NOT cancel_requested")
+
+class Job(db.Model):
+    # Background job queue run by app/jobs.py; a runner claims a queued row
+    # with a conditional UPDATE and holds it until lease_until. At most one
+    # active job per dedupe_key: submit inserts with ON CONFLICT DO NOTHING
+    __table_args__ = (
+        db.Index('ix_job_claim', 'status', 'run_after'),
+        db.Index('ix_job_dedupe', 'dedupe_key', 'status'),
+        db.Index('ux_job_active', 'dedupe_key', unique=True,
+                 sqlite_where=ACTIVE_JOB, postgresql_where=ACTIVE_JOB),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.JSON, nullable=False)
+    dedupe_key = db.Column(db.String(64), nullable=False)  # sha256 of kind and params
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued/running/succeeded/failed/cancelled
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=1)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    lease_until = db.Column(db.DateTime)
+    worker = db.Column(db.String(100))  # host:pid:thread:attempt of the runner holding the job
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    error = db.Column(db.Text)
+    result_name = db.Column(db.String(255))
+    result_mimetype = db.Column(db.String(100))
+    result_bytes = db.Column(db.Integer)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+class LiveEvent(db.Model):
+    # Short-lived log of dashboard events written with the change they
+    # describe; app/live_feed.py polls it to fan events out to other workers
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    origin = db.Column(db.String(100), nullable=False)  # host:pid of the writing process
+    kind = db.Column(db.String(20), nullable=False)  # 'entries' or 'upload'
+    payload = db.Column(db.JSON, nullable=False)
+
+def ensure_json_column():
+    """Convert a PostgreSQL dsr_entry.data column created as text to jsonb
+    
+    SQLite needs no change: its JSON columns are text read through JSON1.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        return
+    columns = {column['name']: column for column in inspect(db.engine).get_columns('dsr_entry')}
+    if isinstance(columns['data']['type'], JSONB):
+        return
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql('ALTER TABLE dsr_entry ALTER COLUMN data TYPE jsonb USING data::jsonb')
+
+# Indexes replaced by a declared one, dropped by ensure_indexes()
+OBSOLETE_INDEXES = ['ix_dsr_entry_district_form_date']
+
+def ensure_indexes():
+    """Create any declared indexes missing from an existing database
+    
+    db.create_all() only creates indexes together with new tables, so
+    databases created before the indexes were declared need this step.
+    Works on both SQLite and PostgreSQL (CREATE INDEX IF NOT EXISTS;
+    SQLite does not reflect expression indexes, so checkfirst cannot tell).
+    Indexes listed in OBSOLETE_INDEXES are dropped.
+    """
+    with db.engine.begin() as connection:
+        for name in OBSOLETE_INDEXES:
+            connection.exec_driver_sql(f'DROP INDEX IF EXISTS {name}')
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                connection.execute(CreateIndex(index, if_not_exists=True))
+
 # Form configurations
 FORM_CONFIGS = {
     'crime_data': {
@@ -0,0 +1,53 @@
+"""
+Keyset pagination for DSREntry history views
+Pages are ordered newest first on (date, id) and continue from a cursor
+"<date>_<id>" naming the last entry already shown, so every page is a
+bounded index range scan no matter how deep the history goes.
+"""
+
+from datetime import datetime
+from sqlalchemy import tuple_
+from app.models import DSREntry
+
+PAGE_SIZE = 50
+
+def encode_cursor(entry):
+    return f"{entry.date.strftime('%Y-%m-%d')}_{entry.id}"
+
+def decode_cursor(cursor):
+    """Parse a cursor into (date, id); raises ValueError when malformed"""
+    date_str, _, entry_id = cursor.partition('_')
+    return datetime.strptime(date_str, '%Y-%m-%d').date(), int(entry_id)
+
+def parse_date(value):
+    """Parse an optional YYYY-MM-DD query parameter; raises ValueError when malformed"""
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+def keyset_page(query, cursor=None, from_date=None, per_page=PAGE_SIZE, complete_last_date=False):
+    """
+    Fetch one page of a DSREntry query, newest first
+
+    cursor continues after the entry it names; from_date jumps to the
+    newest entries on or before that date. With complete_last_date, the
+    page is extended with up to per_page more entries of its last date, so
+    a date is split across pages only when it has more entries than that;
+    the cursor then continues inside the date.
+    Returns (entries, next_cursor) where next_cursor is None on the last page.
+    """
+    if cursor:
+        cursor_date, cursor_id = decode_cursor(cursor)
+        query = query.filter(tuple_(DSREntry.date, DSREntry.id) < tuple_(cursor_date, cursor_id))
+    elif from_date:
+        query = query.filter(DSREntry.date <= from_date)
+
+    query = query.order_by(DSREntry.date.desc(), DSREntry.id.desc())
+    entries = query.limit(per_page + 1).all()
+
+    if len(entries) <= per_page:
+        return entries, None
+
+    entries = entries[:per_page]
+    if complete_last_date:
+        last = entries[-1]
+        entries += query.filter(DSREntry.date == last.date, DSREntry.id < last.id).limit(per_page).all()
+    return entries, encode_cursor(entries[-1])
@@ -0,0 +1,176 @@
+"""
+Daily rollup of numeric form fields
+DailyRollup holds the sum of every number field (and the number of
+entries) per form, field, date and district. It is updated through
+entries_changed inside the transaction that writes the entries, so trend
+charts and state totals read a few rows per day however much history
+there is. rebuild() recomputes it from DSREntry.
+"""
+
+from datetime import timedelta
+from sqlalchemy import func, text
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from app.models import DSREntry, DailyRollup
+from app.entry_events import entries_changed
+from app.totals import NUMBER_FIELDS
+from app.json_fields import NUMBER
+
+REBUILD_WINDOW_DAYS = 31
+
+# PostgreSQL advisory lock key serializing the startup backfill
+BACKFILL_LOCK = 0x44525231
+
+# Default range of /admin/trends
+TREND_DAYS = 90
+
+def init_app(app):
+    entries_changed.connect(_track_rollups, weak=False)
+
+def field_values(form_type, data):
+    """The number fields of one entry as floats, in NUMBER_FIELDS order"""
+    values = []
+    for field in NUMBER_FIELDS.get(form_type, ()):
+        # Same test as json_number on both backends; anything else counts as 0
+        value = str((data or {}).get(field['name']) or '')
+        values.append(float(value) if NUMBER.fullmatch(value) else 0.0)
+    return values
+
+def _add(deltas, form_type, entry_date, district_name, data, sign=1, count=0):
+    if form_type not in NUMBER_FIELDS or entry_date is None or district_name is None:
+        return
+    key = (form_type, entry_date, district_name)
+    delta = deltas.setdefault(key, [[0.0] * len(NUMBER_FIELDS[form_type]), 0])
+    for index, value in enumerate(field_values(form_type, data)):
+        delta[0][index] += sign * value
+    delta[1] += count
+
+def _track_rollups(session, changes):
+    """Fold a batch of entry changes into DailyRollup"""
+    deltas = {}
+    for change in changes:
+        key = (change.form_type, change.date, change.district_name)
+        if change.action == 'insert':
+            _add(deltas, *key, change.data, count=1)
+        elif change.action == 'delete':
+            _add(deltas, *key, change.data, sign=-1, count=-1)
+        else:
+            _add(deltas, *key, change.data)
+            _add(deltas, *key, change.previous_data, sign=-1)
+    if deltas:
+        apply(session.connection(), deltas)
+
+def apply(connection, deltas):
+    """Upsert {(form_type, date, district): [field totals, entry count]} deltas"""
+    dialect = postgresql if connection.dialect.name == 'postgresql' else sqlite
+    table = DailyRollup.__table__
+    for (form_type, entry_date, district_name), (totals, count) in deltas.items():
+        for field, total in zip(NUMBER_FIELDS[form_type], totals):
+            if not total and not count:
+                continue
+            stmt = dialect.insert(table).values(
+                form_type=form_type,
+                field=field['name'],
+                date=entry_date,
+                district_name=district_name,
+                total=total,
+                entry_count=max(count, 0)
+            )
+            connection.execute(stmt.on_conflict_do_update(
+                index_elements=[table.c.form_type, table.c.field, table.c.date, table.c.district_name],
+                set_={'total': table.c.total + total, 'entry_count': table.c.entry_count + count}
+            ))
+        if count < 0:
+            # The last entry of that day is gone
+            connection.execute(table.delete().where(table.c.form_type == form_type,
+                                                    table.c.date == entry_date,
+                                                    table.c.district_name == district_name,
+                                                    table.c.entry_count <= 0))
+
+def rebuild(date_from=None, date_to=None, progress=None):
+    """
+    Recompute DailyRollup from DSREntry, for a date range or everything
+    Works through REBUILD_WINDOW_DAYS at a time, each window in its own
+    transaction. progress(window_start, window_end) is called per window.
+    """
+    forms = list(NUMBER_FIELDS)
+    bounds = db.session.query(func.min(DSREntry.date), func.max(DSREntry.date))\
+                       .filter(DSREntry.form_type.in_(forms)).one()
+    date_from = date_from or bounds[0]
+    date_to = date_to or bounds[1]
+    if date_from is None or date_to is None:
+        return
+
+    table = DailyRollup.__table__
+    start = date_from
+    while start <= date_to:
+        end = min(start + timedelta(days=REBUILD_WINDOW_DAYS - 1), date_to)
+        db.session.execute(table.delete().where(table.c.date >= start, table.c.date <= end))
+
+        deltas = {}
+        entries = db.session.query(DSREntry.form_type, DSREntry.date, DSREntry.district_name, DSREntry.data)\
+                            .filter(DSREntry.form_type.in_(forms), DSREntry.date >= start, DSREntry.date <= end)\
+                            .yield_per(1000)
+        for form_type, entry_date, district_name, data in entries:
+            _add(deltas, form_type, entry_date, district_name, data, count=1)
+        apply(db.session.connection(), deltas)
+        db.session.commit()
+
+        if progress:
+            progress(start, end)
+        start = end + timedelta(days=1)
+
+def ensure_populated():
+    """
+    Backfill the rollup once for databases that predate it
+    Every worker calls this at startup. The emptiness check runs under a
+    lock held until rebuild() commits its first window, which always adds
+    rows, so workers arriving meanwhile wait and then find the rollup
+    filled; two concurrent rebuilds would add their upserts together.
+    """
+    db.session.commit()
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': BACKFILL_LOCK})
+    else:
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+    if db.session.query(DailyRollup.date).first() is not None or \
+            db.session.query(DSREntry.id).filter(DSREntry.form_type.in_(list(NUMBER_FIELDS))).first() is None:
+        db.session.commit()
+        return
+    rebuild()
+
+def trend(form_type, date_from, date_to, fields=None, district_name=None, by_district=False):
+    """
+    Daily series of number fields from DailyRollup only
+    Returns (dates, series) where series is a list of dicts with field,
+    label, district (None for statewide) and values aligned with dates;
+    days without a report are None.
+    """
+    config_fields = [field for field in NUMBER_FIELDS[form_type] if not fields or field['name'] in fields]
+    labels = {field['name']: field['label'] for field in config_fields}
+    query = db.session.query(DailyRollup.field, DailyRollup.date, DailyRollup.district_name, DailyRollup.total)\
+                      .filter(DailyRollup.form_type == form_type,
+                              DailyRollup.field.in_(list(labels)),
+                              DailyRollup.date >= date_from,
+                              DailyRollup.date <= date_to)
+    if district_name:
+        query = query.filter(DailyRollup.district_name == district_name)
+
+    dates = [date_from + timedelta(days=offset) for offset in range((date_to - date_from).days + 1)]
+    position = {day: index for index, day in enumerate(dates)}
+    series = {}
+    for field, day, district, total in query:
+        key = (field, district if by_district else None)
+        values = series.setdefault(key, [None] * len(dates))
+        values[position[day]] = (values[position[day]] or 0) + total
+
+    order = {field['name']: index for index, field in enumerate(config_fields)}
+    return dates, [{
+        'field': field,
+        'label': labels[field],
+        'district': district,
+        'values': [None if value is None else (int(value) if value.is_integer() else round(value, 2))
+                   for value in values]
+    } for (field, district), values in sorted(series.items(), key=lambda item: (order[item[0][0]], item[0][1] or ''))]
@@ -1,15 +1,25 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session, send_file
+from flask import Blueprint, Response, render_template, request, redirect, url_for, flash, jsonify, session, send_file, stream_with_context, current_app
 from flask_login import login_required, current_user, login_user, logout_user
 from werkzeug.security import check_password_hash, generate_password_hash
 from werkzeug.utils import secure_filename
-from app.models import User, DSREntry, ControlRoomUpload, FORM_CONFIGS, DISTRICTS
-from app import db, login_manager
-import json
-from datetime import datetime, date
+from app.models import User, DSREntry, ControlRoomUpload, Job, FORM_CONFIGS, DISTRICTS
+from app.export_cache import export_cache
+from app.exports import build_district_workbook, build_state_workbook, STATE_GROUPINGS, XLSX_MIMETYPE
+from app.pagination import keyset_page, parse_date
+from app.validation import validate_row
+from app.entry_events import bulk_insert_entries
+from app.imports import import_workbook, WorkbookImportError
+from app.json_fields import field_filter, FILTER_OPS
+from app.upload_store import upload_store, send_upload, UploadError
+from app.user_cache import user_cache
+from app.template_cache import fragment_cache
+from app.write_queue import write_queue
+from app.live_feed import live_feed
+from app.jobs import jobs
+from app import case_index, db, db_pool, fulltext, login_manager, rollups, stream_exports, submissions, totals
+from datetime import datetime, date, timedelta
 import os
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Border, Side, Alignment
-import io
+import time
 
 # Blueprint definitions
 main_bp = Blueprint('main', __name__)
@@ -17,16 +27,38 @@ auth_bp = Blueprint('auth', __name__)
 admin_bp = Blueprint('admin', __name__)
 district_bp = Blueprint('district', __name__)
 
+# Largest number of rows accepted by one batch submission
+MAX_BATCH_ROWS = 500
+
 # User loader for Flask-Login
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.load(int(user_id))
 
 # Main routes
 @main_bp.route('/')
 def index():
     return render_template('index.html')
 
+@main_bp.route('/live')
+@login_required
+def live():
+    """
+    Server-Sent Events feed for the dashboards
+    Admins get entry and upload events, control room users their own uploads.
+    """
+    if current_user.user_type == 'admin':
+        accept = lambda kind, payload: True
+    elif current_user.user_type == 'controlroom':
+        user_id = current_user.id
+        accept = lambda kind, payload: kind == 'upload' and payload.get('user_id') == user_id
+    else:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    return Response(live_feed.subscribe(accept, last_event_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 # Authentication routes
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
@@ -74,19 +106,136 @@ def dashboard():
     total_districts = 26  # Changed from len(DISTRICTS) to show 26 instead of 28
     total_forms = len(FORM_CONFIGS)
     today = date.today()
-    today_entries = DSREntry.query.filter_by(date=today).count()
+    
+    # Today's submissions come from the DailySubmission summary, not DSREntry
+    matrix = submissions.compliance_matrix(today)
+    today_entries = submissions.entries_on(today)
     
     return render_template('admin/dashboard.html', 
                          districts=DISTRICTS, 
                          forms=FORM_CONFIGS,
                          recent_entries=recent_entries,
                          recent_uploads=recent_uploads,
+                         compliance_matrix=matrix,
+                         late_filers=submissions.late_filers(today, matrix),
+                         today=today.strftime('%Y-%m-%d'),
                          stats={
                              'total_districts': total_districts,
                              'total_forms': total_forms,
                              'today_entries': today_entries
                          })
 
+@admin_bp.route('/compliance')
+@login_required
+def compliance():
+    if current_user.user_type != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    date_str = request.args.get('date')
+    try:
+        day = datetime.strptime(date_str, '%Y-%m-%d').date() if date_str else date.today()
+    except ValueError:
+        return jsonify({'error': 'Invalid date format'}), 400
+    
+    matrix = submissions.compliance_matrix(day)
+    late = submissions.late_filers(day, matrix)
+    for item in late:
+        item['last_updated'] = item['last_updated'].strftime('%d-%m-%Y %H:%M') if item['last_updated'] else None
+    
+    return jsonify({
+        'date': day.strftime('%Y-%m-%d'),
+        'matrix': matrix,
+        'late_filers': late
+    })
+
+def _totals_args(default_days=totals.DEFAULT_DAYS):
+    """Form type and date range of a state totals request; raises ValueError when invalid"""
+    form_type = request.args.get('form') or next(iter(totals.NUMBER_FIELDS))
+    if form_type not in totals.NUMBER_FIELDS:
+        raise ValueError('Form has no number fields')
+    
+    try:
+        date_to = parse_date(request.args.get('to')) or date.today()
+        date_from = parse_date(request.args.get('from')) or date_to - timedelta(days=default_days - 1)
+    except ValueError:
+        raise ValueError('Invalid date format')
+    if date_from > date_to:
+        raise ValueError('Start date is after end date')
+    if (date_to - date_from).days >= totals.MAX_RANGE_DAYS:
+        raise ValueError(f'Date range is limited to {totals.MAX_RANGE_DAYS} days')
+    return form_type, date_from, date_to
+
+@admin_bp.route('/totals')
+@login_required
+def state_totals():
+    """Statewide and per-district totals of the number fields of a form"""
+    if current_user.user_type != 'admin':
+        flash('Access denied', 'error')
+        return redirect(url_for('main.index'))
+    
+    try:
+        form_type, date_from, date_to = _totals_args()
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('admin.state_totals'))
+    
+    return render_template('admin/state_totals.html',
+                         summary=totals.summarise(form_type, date_from, date_to),
+                         forms={name: FORM_CONFIGS[name]['name'] for name in totals.NUMBER_FIELDS})
+
+@admin_bp.route('/totals/data')
+@login_required
+def state_totals_data():
+    if current_user.user_type != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    try:
+        form_type, date_from, date_to = _totals_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    started = time.perf_counter()
+    summary = totals.summarise(form_type, date_from, date_to)
+    summary['took_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return jsonify(summary)
+
+@admin_bp.route('/trends')
+@login_required
+def trends():
+    """Daily trend series of number fields, read from the rollup table only"""
+    if current_user.user_type != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    try:
+        form_type, date_from, date_to = _totals_args(default_days=rollups.TREND_DAYS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    fields = request.args.getlist('field')
+    known = {field['name'] for field in totals.NUMBER_FIELDS[form_type]}
+    if any(field not in known for field in fields):
+        return jsonify({'error': 'Unknown number field'}), 400
+    group_by = request.args.get('group_by', 'state')
+    if group_by not in ('state', 'district'):
+        return jsonify({'error': 'group_by must be state or district'}), 400
+    district_name = request.args.get('district')
+    if district_name and district_name not in DISTRICTS:
+        return jsonify({'error': 'Unknown district'}), 400
+    
+    started = time.perf_counter()
+    dates, series = rollups.trend(form_type, date_from, date_to, fields=fields,
+                                  district_name=district_name, by_district=group_by == 'district')
+    return jsonify({
+        'form_type': form_type,
+        'from': date_from.strftime('%Y-%m-%d'),
+        'to': date_to.strftime('%Y-%m-%d'),
+        'district': district_name,
+        'group_by': group_by,
+        'dates': [day.strftime('%Y-%m-%d') for day in dates],
+        'series': series,
+        'took_ms': round((time.perf_counter() - started) * 1000, 1)
+    })
+
 @admin_bp.route('/district/<district_name>')
 @login_required
 def district_view(district_name):
@@ -94,8 +243,16 @@ def district_view(district_name):
         flash('Access denied', 'error')
         return redirect(url_for('main.index'))
     
-    # Get all DSR entries for this district
-    entries = DSREntry.query.filter_by(district_name=district_name).order_by(DSREntry.date.desc()).all()
+    # One keyset page of this district's entries, newest first; a date is
+    # split across pages only when it has more than two pages' worth
+    try:
+        entries, next_cursor = keyset_page(DSREntry.query.filter_by(district_name=district_name),
+                                           cursor=request.args.get('cursor'),
+                                           from_date=parse_date(request.args.get('from')),
+                                           complete_last_date=True)
+    except ValueError:
+        flash('Invalid date format', 'error')
+        return redirect(url_for('admin.district_view', district_name=district_name))
     
     # Group entries by date
     entries_by_date = {}
@@ -105,10 +262,22 @@ def district_view(district_name):
             entries_by_date[date_str] = []
         entries_by_date[date_str].append(entry)
     
+    # "Load more" requests only need the next slice of accordion items
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify({
+            'html': render_template('admin/_district_entries.html',
+                                    district_name=district_name,
+                                    entries_by_date=entries_by_date,
+                                    forms=FORM_CONFIGS),
+            'next_cursor': next_cursor
+        })
+    
     return render_template('admin/district_view.html', 
                          district_name=district_name,
                          entries_by_date=entries_by_date,
-                         forms=FORM_CONFIGS)
+                         forms=FORM_CONFIGS,
+                         next_cursor=next_cursor,
+                         jump_date=request.args.get('from', ''))
 
 @admin_bp.route('/form/<form_type>')
 @login_required
@@ -121,40 +290,112 @@ def form_view(form_type):
         flash('Invalid form type', 'error')
         return redirect(url_for('admin.dashboard'))
     
-    # Check for date filter parameter
+    # Check for date and field filter parameters
     filter_date = request.args.get('date')
+    field_filter_args = {
+        'field': request.args.get('field', ''),
+        'op': request.args.get('op', 'eq'),
+        'value': request.args.get('value', '').strip()
+    }
     
-    # Get entries for this form type with optional date filter
+    # Get entries for this form type with optional date and field filters
     query = DSREntry.query.filter_by(form_type=form_type)
     
-    if filter_date:
+    # Filter on one field inside the JSON data, evaluated by the database
+    if field_filter_args['field'] and field_filter_args['value']:
         try:
-            # Parse the date string to ensure it's valid
-            from datetime import datetime
-            parsed_date = datetime.strptime(filter_date, '%Y-%m-%d').date()
-            query = query.filter_by(date=parsed_date)
-        except ValueError:
-            flash('Invalid date format', 'error')
-            return redirect(url_for('admin.dashboard'))
+            query = query.filter(field_filter(DSREntry.data, FORM_CONFIGS[form_type],
+                                              field_filter_args['field'], field_filter_args['op'],
+                                              field_filter_args['value']))
+        except ValueError as e:
+            flash(f'Invalid filter: {e}', 'error')
+            return redirect(url_for('admin.form_view', form_type=form_type))
     
-    entries = query.order_by(DSREntry.date.desc()).all()
+    try:
+        if filter_date:
+            # Parse the date string to ensure it's valid
+            query = query.filter_by(date=parse_date(filter_date))
+        
+        # Only this page's slice is fetched and decoded
+        entries, next_cursor = keyset_page(query,
+                                           cursor=request.args.get('cursor'),
+                                           from_date=parse_date(request.args.get('from')))
+    except ValueError:
+        flash('Invalid date format', 'error')
+        return redirect(url_for('admin.dashboard'))
     
     # Prepare data for display
     form_data = []
     for entry in entries:
-        data = json.loads(entry.data)
         form_data.append({
             'district': entry.district_name,
             'date': entry.date,
-            'data': data,
+            'date_display': entry.date.strftime('%d-%m-%Y'),
+            'data': entry.data,
             'id': entry.id
         })
     
+    # "Load more" requests get the next page as JSON
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify({'entries': form_data, 'next_cursor': next_cursor})
+    
     return render_template('admin/form_view.html', 
                          form_type=form_type,
                          form_config=FORM_CONFIGS[form_type],
                          form_data=form_data,
-                         filter_date=filter_date)
+                         filter_date=filter_date,
+                         field_filter=field_filter_args,
+                         filter_ops=FILTER_OPS,
+                         next_cursor=next_cursor,
+                         jump_date=request.args.get('from', ''))
+
+@admin_bp.route('/form/<form_type>/export')
+@login_required
+def export_form(form_type):
+    """
+    Stream every entry of a form over a date range as CSV or NDJSON
+    Takes date= for one day or from=/to= (default the last 30 days), plus
+    the district and field filters of form_view.
+    """
+    if current_user.user_type != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    if form_type not in FORM_CONFIGS:
+        return jsonify({'error': 'Invalid form type'}), 400
+    
+    export_format = request.args.get('format', 'csv')
+    if export_format not in stream_exports.FORMATS:
+        return jsonify({'error': 'Format must be csv or ndjson'}), 400
+    
+    district_name = request.args.get('district')
+    if district_name and district_name not in DISTRICTS:
+        return jsonify({'error': 'Unknown district'}), 400
+    
+    try:
+        day = parse_date(request.args.get('date'))
+        date_to = day or parse_date(request.args.get('to')) or date.today()
+        date_from = day or parse_date(request.args.get('from')) \
+            or date_to - timedelta(days=stream_exports.DEFAULT_DAYS - 1)
+    except ValueError:
+        return jsonify({'error': 'Invalid date format'}), 400
+    if date_from > date_to:
+        return jsonify({'error': 'Start date is after end date'}), 400
+    
+    data_filter = None
+    if request.args.get('field') and request.args.get('value', '').strip():
+        try:
+            data_filter = field_filter(DSREntry.data, FORM_CONFIGS[form_type], request.args['field'],
+                                       request.args.get('op', 'eq'), request.args['value'].strip())
+        except ValueError as e:
+            return jsonify({'error': f'Invalid filter: {e}'}), 400
+    
+    query = stream_exports.form_entries_query(form_type, date_from, date_to, district_name, data_filter)
+    filename = f"{form_type}_{date_from.strftime('%Y-%m-%d')}_{date_to.strftime('%Y-%m-%d')}.{export_format}"
+    # The request context stays open while the body is sent, so the query streams from the session
+    return Response(stream_with_context(stream_exports.stream(query, form_type, export_format)),
+                    mimetype=stream_exports.FORMATS[export_format],
+                    headers={'Content-Disposition': f'attachment; filename={filename}',
+                             'X-Accel-Buffering': 'no'})
 
 @admin_bp.route('/search')
 @login_required
@@ -177,16 +418,93 @@ def search():
     
     result = []
     for entry in entries:
-        data = json.loads(entry.data)
         result.append({
             'form_type': entry.form_type,
             'form_name': FORM_CONFIGS.get(entry.form_type, {}).get('name', entry.form_type),
-            'data': data,
+            'data': entry.data,
             'id': entry.id
         })
     
     return jsonify(result)
 
+@admin_bp.route('/search/text')
+@login_required
+def search_text():
+    """Ranked full-text search over the narrative fields of all entries"""
+    if current_user.user_type != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Search text required'}), 400
+    
+    form_type = request.args.get('form') or None
+    if form_type and form_type not in FORM_CONFIGS:
+        return jsonify({'error': 'Invalid form type'}), 400
+    
+    try:
+        date_from = parse_date(request.args.get('from'))
+        date_to = parse_date(request.args.get('to'))
+    except ValueError:
+        return jsonify({'error': 'Invalid date format'}), 400
+    
+    started = time.perf_counter()
+    results = fulltext.search(query,
+                              district_name=request.args.get('district') or None,
+                              form_type=form_type,
+                              date_from=date_from,
+                              date_to=date_to,
+                              limit=request.args.get('limit', 50, type=int))
+    
+    return jsonify({
+        'query': query,
+        'count': len(results),
+        'results': results,
+        'took_ms': round((time.perf_counter() - started) * 1000, 1)
+    })
+
+@admin_bp.route('/cases/timeline')
+@login_required
+def case_timeline():
+    """Every entry mentioning a FIR / case number (?case=) or unit (?unit=), oldest first"""
+    if current_user.user_type != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    kind = 'case' if request.args.get('case') else 'unit' if request.args.get('unit') else None
+    if kind is None:
+        return jsonify({'error': 'case or unit required'}), 400
+    
+    try:
+        date_from = parse_date(request.args.get('from'))
+        date_to = parse_date(request.args.get('to'))
+    except ValueError:
+        return jsonify({'error': 'Invalid date format'}), 400
+    
+    identifier, mentions, truncated = case_index.timeline(
+        kind, request.args.get(kind),
+        district_name=request.args.get('district') or None,
+        date_from=date_from,
+        date_to=date_to,
+        limit=request.args.get('limit', case_index.MAX_TIMELINE, type=int)
+    )
+    
+    return jsonify({
+        'kind': kind,
+        'identifier': identifier,
+        'count': len(mentions),
+        'truncated': truncated,
+        'mentions': [{
+            'entry_id': entry.id,
+            'date': mention.date.strftime('%Y-%m-%d'),
+            'district': mention.district_name,
+            'form_type': mention.form_type,
+            'form_name': FORM_CONFIGS.get(mention.form_type, {}).get('name', mention.form_type),
+            'field': mention.field,
+            'updated_at': entry.updated_at.strftime('%d-%m-%Y %H:%M') if entry.updated_at else None,
+            'data': entry.data
+        } for mention, entry in mentions]
+    })
+
 @admin_bp.route('/download_dsr/<district_name>/<date_str>')
 @login_required
 def download_dsr(district_name, date_str):
@@ -200,181 +518,223 @@ def download_dsr(district_name, date_str):
         flash('Invalid date format', 'error')
         return redirect(url_for('admin.dashboard'))
     
-    entries = DSREntry.query.filter_by(date=search_date, district_name=district_name).all()
+    filename = f"DSR_{district_name}_{date_str}.xlsx"
     
-    if not entries:
+    # Serve from the export cache while the underlying entries are unchanged
+    version = export_cache.data_version(district_name, search_date)
+    if not version[1]:
         flash('No data found for the selected date', 'error')
         return redirect(url_for('admin.dashboard'))
     
-    # Create Excel file
-    output = io.BytesIO()
-    wb = Workbook()
-    ws = wb.active
-    ws.title = f"DSR_{district_name}_{date_str}"
-    
-    # Header style
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    thin_border = Border(
-        left=Side(style='thin'), right=Side(style='thin'),
-        top=Side(style='thin'), bottom=Side(style='thin')
+    cached = export_cache.get(district_name, search_date, version)
+    if cached is None and _export_async(version[1]):
+        return _queue_export('district_dsr', {'district': district_name, 'date': date_str})
+    if cached is None:
+        # Write-only workbook rendered into a temporary file
+        output = build_district_workbook(district_name, search_date)
+        if output is None:
+            flash('No data found for the selected date', 'error')
+            return redirect(url_for('admin.dashboard'))
+        with output:
+            cached = export_cache.put(district_name, search_date, version, output)
+    
+    return send_file(
+        cached,
+        mimetype=XLSX_MIMETYPE,
+        as_attachment=True,
+        download_name=filename
     )
+
+@admin_bp.route('/download_state_dsr/<date_str>')
+@login_required
+def download_state_dsr(date_str):
+    if current_user.user_type != 'admin':
+        flash('Access denied', 'error')
+        return redirect(url_for('main.index'))
     
-    # Add title
-    ws['A1'] = f"Daily Status Report - {district_name}"
-    ws['A2'] = f"Date: {date_str}"
-    ws.merge_cells('A1:D1')
-    ws.merge_cells('A2:D2')
+    try:
+        search_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+    except ValueError:
+        flash('Invalid date format', 'error')
+        return redirect(url_for('admin.dashboard'))
     
-    # Group entries by form type (same logic as web interface)
-    entries_by_form = {}
-    for entry in entries:
-        form_type = entry.form_type
-        if form_type not in entries_by_form:
-            entries_by_form[form_type] = []
-        entries_by_form[form_type].append(entry)
-    
-    row = 4
-    for form_type, form_entries in entries_by_form.items():
-        form_config = FORM_CONFIGS.get(form_type, {})
-        form_name = form_config.get('name', form_type)
-        entry_count = len(form_entries)
-        
-        # Form header with entry count
-        header_text = f"{form_name} ({entry_count} {'entry' if entry_count == 1 else 'entries'})"
-        ws[f'A{row}'] = header_text
-        ws[f'A{row}'].font = header_font
-        ws[f'A{row}'].fill = header_fill
-        
-        # Use horizontal table format for all entries (consistent professional format)
-        # Get field names and filter fields that have values
-        fields = form_config.get('fields', [])
-        used_fields = []
-        for field in fields:
-            field_name = field['name']
-            has_value = any(json.loads(entry.data).get(field_name, '') for entry in form_entries)
-            if has_value:
-                used_fields.append(field)
-        
-        # Calculate merge range for header
-        max_col = len(used_fields) + 2  # +2 for S.No and Time columns
-        end_col = chr(ord('A') + max_col - 1)
-        ws.merge_cells(f'A{row}:{end_col}{row}')
-        row += 1
-        
-        # Table headers
-        col = 0
-        ws.cell(row=row, column=col+1, value="S.No").font = Font(bold=True)
-        ws.cell(row=row, column=col+1).fill = PatternFill(start_color="E6E6E6", end_color="E6E6E6", fill_type="solid")
-        ws.cell(row=row, column=col+1).border = thin_border
-        col += 1
-        
-        ws.cell(row=row, column=col+1, value="Time").font = Font(bold=True)
-        ws.cell(row=row, column=col+1).fill = PatternFill(start_color="E6E6E6", end_color="E6E6E6", fill_type="solid")
-        ws.cell(row=row, column=col+1).border = thin_border
-        col += 1
-        
-        for field in used_fields:
-            ws.cell(row=row, column=col+1, value=field['label']).font = Font(bold=True)
-            ws.cell(row=row, column=col+1).fill = PatternFill(start_color="E6E6E6", end_color="E6E6E6", fill_type="solid")
-            ws.cell(row=row, column=col+1).border = thin_border
-            col += 1
-        row += 1
-        
-        # Data rows (works for both single and multiple entries)
-        for idx, entry in enumerate(form_entries):
-            data = json.loads(entry.data)
-            col = 0
-            
-            # Serial number
-            ws.cell(row=row, column=col+1, value=idx+1).border = thin_border
-            col += 1
-            
-            # Time (extract from updated_at)
-            time_str = entry.updated_at.strftime('%H:%M') if entry.updated_at else 'N/A'
-            ws.cell(row=row, column=col+1, value=time_str).border = thin_border
-            col += 1
-            
-            # Field values
-            for field in used_fields:
-                field_name = field['name']
-                value = data.get(field_name, '')
-                ws.cell(row=row, column=col+1, value=value or '-').border = thin_border
-                col += 1
-            row += 1
-            # Multiple entries: Use horizontal table format
-            # Get field names from first entry to determine column count
-            first_entry_data = json.loads(form_entries[0].data)
-            fields = form_config.get('fields', [])
-            
-            # Filter fields that have values in at least one entry
-            used_fields = []
-            for field in fields:
-                field_name = field['name']
-                has_value = any(json.loads(entry.data).get(field_name, '') for entry in form_entries)
-                if has_value:
-                    used_fields.append(field)
-            
-            # Calculate merge range for header
-            max_col = len(used_fields) + 2  # +2 for S.No and Time columns
-            end_col = chr(ord('A') + max_col - 1)
-            ws.merge_cells(f'A{row}:{end_col}{row}')
-            row += 1
-            
-            # Table headers
-            col = 0
-            ws.cell(row=row, column=col+1, value="S.No").font = Font(bold=True)
-            ws.cell(row=row, column=col+1).fill = PatternFill(start_color="E6E6E6", end_color="E6E6E6", fill_type="solid")
-            ws.cell(row=row, column=col+1).border = thin_border
-            col += 1
-            
-            ws.cell(row=row, column=col+1, value="Time").font = Font(bold=True)
-            ws.cell(row=row, column=col+1).fill = PatternFill(start_color="E6E6E6", end_color="E6E6E6", fill_type="solid")
-            ws.cell(row=row, column=col+1).border = thin_border
-            col += 1
-            
-            for field in used_fields:
-                ws.cell(row=row, column=col+1, value=field['label']).font = Font(bold=True)
-                ws.cell(row=row, column=col+1).fill = PatternFill(start_color="E6E6E6", end_color="E6E6E6", fill_type="solid")
-                ws.cell(row=row, column=col+1).border = thin_border
-                col += 1
-            row += 1
-            
-            # Data rows
-            for idx, entry in enumerate(form_entries):
-                data = json.loads(entry.data)
-                col = 0
-                
-                # Serial number
-                ws.cell(row=row, column=col+1, value=idx+1).border = thin_border
-                col += 1
-                
-                # Time (extract from updated_at)
-                time_str = entry.updated_at.strftime('%H:%M') if entry.updated_at else 'N/A'
-                ws.cell(row=row, column=col+1, value=time_str).border = thin_border
-                col += 1
-                
-                # Field values
-                for field in used_fields:
-                    field_name = field['name']
-                    value = data.get(field_name, '')
-                    ws.cell(row=row, column=col+1, value=value or '-').border = thin_border
-                    col += 1
-                row += 1
-        
-        row += 1  # Empty row between forms
+    # One sheet per district (default) or one sheet per form type
+    group_by = request.args.get('group_by', 'district')
+    if group_by not in STATE_GROUPINGS:
+        flash('Invalid grouping', 'error')
+        return redirect(url_for('admin.dashboard'))
     
-    wb.save(output)
-    output.seek(0)
+    # Served from the export cache (pre-generated after the end-of-day cutoff)
+    # while the day's entries are unchanged
+    version = export_cache.data_version(None, search_date)
+    if not version[1]:
+        flash('No data found for the selected date', 'error')
+        return redirect(url_for('admin.dashboard'))
     
-    filename = f"DSR_{district_name}_{date_str}.xlsx"
+    cached = export_cache.get(None, search_date, version, variant=group_by)
+    if cached is None and _export_async(version[1]):
+        return _queue_export('state_dsr', {'date': date_str, 'group_by': group_by})
+    if cached is None:
+        output = build_state_workbook(search_date, group_by,
+                                      max_workers=current_app.config.get('EXPORT_WORKERS'))
+        if output is None:
+            flash('No data found for the selected date', 'error')
+            return redirect(url_for('admin.dashboard'))
+        with output:
+            cached = export_cache.put(None, search_date, version, output, variant=group_by)
+    
+    filename = f"DSR_State_{date_str}.xlsx"
     return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        cached,
+        mimetype=XLSX_MIMETYPE,
         as_attachment=True,
         download_name=filename
     )
 
+def _export_async(row_count):
+    """Run an export as a background job when asked to or when it is large"""
+    return request.args.get('async') == '1' or row_count >= current_app.config['EXPORT_ASYNC_ROWS']
+
+def _queue_export(kind, params):
+    """Queue an export job and send the browser to its progress page"""
+    job = jobs.submit(kind, params, user_id=current_user.id)
+    if 'application/json' in request.headers.get('Accept', ''):
+        return jsonify(_job_status(job)), 202
+    return redirect(url_for('admin.job_view', job_id=job.id))
+
+def _job_status(job):
+    status = jobs.describe(job)
+    status['status_url'] = url_for('admin.job_status', job_id=job.id)
+    if job.status == 'succeeded' and job.result_name:
+        status['result_url'] = url_for('admin.job_result', job_id=job.id)
+    return status
+
+@admin_bp.route('/jobs', methods=['POST'])
+@login_required
+def submit_job():
+    """Queue a background job: JSON {"kind": ..., "params": {...}}"""
+    if current_user.user_type != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    payload = request.get_json(silent=True) or {}
+    try:
+        job = jobs.submit(payload.get('kind'), payload.get('params') or {}, user_id=current_user.id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(_job_status(job)), 202
+
+@admin_bp.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    if current_user.user_type != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(_job_status(job))
+
+@admin_bp.route('/jobs/<int:job_id>/view')
+@login_required
+def job_view(job_id):
+    """Progress page of a background export; downloads the result when ready"""
+    if current_user.user_type != 'admin':
+        flash('Access denied', 'error')
+        return redirect(url_for('main.index'))
+    
+    job = db.session.get(Job, job_id)
+    if job is None:
+        flash('Job not found', 'error')
+        return redirect(url_for('admin.dashboard'))
+    return render_template('admin/job_status.html', job=_job_status(job))
+
+@admin_bp.route('/jobs/<int:job_id>/result')
+@login_required
+def job_result(job_id):
+    if current_user.user_type != 'admin':
+        flash('Access denied', 'error')
+        return redirect(url_for('main.index'))
+    
+    job = db.session.get(Job, job_id)
+    if job is None or job.status != 'succeeded':
+        flash('Export is not ready', 'error')
+        return redirect(url_for('admin.dashboard'))
+    try:
+        return send_file(jobs.result_path(job), mimetype=job.result_mimetype,
+                         as_attachment=True, download_name=job.result_name)
+    except FileNotFoundError:
+        flash('Export has expired, please download it again', 'error')
+        return redirect(url_for('admin.dashboard'))
+
+@admin_bp.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_job(job_id):
+    if current_user.user_type != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if not jobs.cancel(job):
+        return jsonify({'error': f'Job already {job.status}'}), 409
+    return jsonify(_job_status(job))
+
+@admin_bp.route('/jobs/stats')
+@login_required
+def job_stats():
+    if current_user.user_type != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    return jsonify(jobs.stats())
+
+@admin_bp.route('/export_cache/stats')
+@login_required
+def export_cache_stats():
+    if current_user.user_type != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    return jsonify(export_cache.stats())
+
+@admin_bp.route('/user_cache/stats')
+@login_required
+def user_cache_stats():
+    if current_user.user_type != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    return jsonify(user_cache.stats())
+
+@admin_bp.route('/template_cache/stats')
+@login_required
+def template_cache_stats():
+    if current_user.user_type != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    return jsonify(fragment_cache.stats())
+
+@admin_bp.route('/write_queue/stats')
+@login_required
+def write_queue_stats():
+    if current_user.user_type != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    return jsonify(write_queue.stats())
+
+@admin_bp.route('/live_feed/stats')
+@login_required
+def live_feed_stats():
+    if current_user.user_type != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    return jsonify(live_feed.stats())
+
+@admin_bp.route('/db_pool/stats')
+@login_required
+def db_pool_stats():
+    if current_user.user_type != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    return jsonify(db_pool.stats(db.engine))
+
 @admin_bp.route('/uploads')
 @login_required
 def uploads_view():
@@ -478,11 +838,7 @@ def download_upload(upload_id):
     upload = ControlRoomUpload.query.get_or_404(upload_id)
     
     try:
-        return send_file(
-            upload.file_path,
-            as_attachment=True,
-            download_name=upload.original_filename
-        )
+        return send_upload(upload, as_attachment=True)
     except FileNotFoundError:
         flash('File not found on server', 'error')
         return redirect(url_for('admin.dashboard'))
@@ -498,11 +854,7 @@ def view_upload(upload_id):
     
     try:
         # Serve file inline (view in browser) instead of download
-        return send_file(
-            upload.file_path,
-            as_attachment=False,  # This makes it view instead of download
-            download_name=upload.original_filename
-        )
+        return send_upload(upload, as_attachment=False)
     except FileNotFoundError:
         flash('File not found on server', 'error')
         return redirect(url_for('admin.dashboard'))
@@ -576,33 +928,39 @@ def form_entry(form_type):
         
         # Check if updating existing entry
         entry_id = request.form.get('entry_id')
+        district_name = current_user.district_name
+        user_id = current_user.id
         
         if entry_id:
             # Update existing entry
-            existing_entry = DSREntry.query.filter_by(
-                id=entry_id,
-                district_name=current_user.district_name,
-                form_type=form_type
-            ).first()
+            def update_entry(session):
+                existing_entry = session.query(DSREntry).filter_by(
+                    id=entry_id,
+                    district_name=district_name,
+                    form_type=form_type
+                ).first()
+                if not existing_entry:
+                    return False
+                # updated_at is set by onupdate=ist_now; export cache keys depend on it
+                existing_entry.data = form_data
+                return True
             
-            if existing_entry:
-                existing_entry.data = json.dumps(form_data)
-                existing_entry.updated_at = datetime.utcnow()
-                db.session.commit()
+            if write_queue.run(update_entry):
                 flash('Entry updated successfully', 'success')
             else:
                 flash('Entry not found', 'error')
         else:
             # Create new entry (multiple entries allowed per date)
-            new_entry = DSREntry(
-                district_name=current_user.district_name,
-                form_type=form_type,
-                date=entry_date_obj,
-                data=json.dumps(form_data),
-                user_id=current_user.id
-            )
-            db.session.add(new_entry)
-            db.session.commit()
+            def add_entry(session):
+                session.add(DSREntry(
+                    district_name=district_name,
+                    form_type=form_type,
+                    date=entry_date_obj,
+                    data=form_data,
+                    user_id=user_id
+                ))
+            
+            write_queue.run(add_entry)
             flash('New entry added successfully', 'success')
         
         # Handle AJAX requests (check for XMLHttpRequest header or JSON response preference)
@@ -621,16 +979,98 @@ def form_entry(form_type):
         date=today
     ).order_by(DSREntry.created_at.desc()).all()
     
-    # Add parsed data to entries for display
-    for entry in existing_entries:
-        entry.data_dict = json.loads(entry.data)
-    
     return render_template('district/form_entry.html', 
                          form_type=form_type, 
                          form_config=form_config,
                          existing_entries=existing_entries,
                          today=today.strftime('%Y-%m-%d'))
 
+@district_bp.route('/form/<form_type>/batch', methods=['POST'])
+@login_required
+def batch_entry(form_type):
+    """Insert many rows of one form and date in a single transaction"""
+    if current_user.user_type != 'district':
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    
+    if form_type not in FORM_CONFIGS:
+        return jsonify({'success': False, 'message': 'Invalid form type'}), 400
+    
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('rows'), list):
+        return jsonify({'success': False, 'message': 'Expected JSON with entry_date and a rows array'}), 400
+    
+    try:
+        entry_date_obj = datetime.strptime(payload.get('entry_date') or '', '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid date format'}), 400
+    
+    rows = payload['rows']
+    if not rows:
+        return jsonify({'success': False, 'message': 'No rows submitted'}), 400
+    if len(rows) > MAX_BATCH_ROWS:
+        return jsonify({'success': False, 'message': f'At most {MAX_BATCH_ROWS} rows per batch'}), 400
+    
+    # Validate every row first; only valid rows are inserted
+    form_config = FORM_CONFIGS[form_type]
+    results = []
+    valid_rows = []
+    for index, row in enumerate(rows):
+        data, errors = validate_row(form_config, row)
+        if errors:
+            results.append({'row': index, 'success': False, 'errors': errors})
+        else:
+            results.append({'row': index, 'success': True})
+            valid_rows.append(data)
+    
+    # Multi-row INSERT and a single commit for the whole batch
+    if valid_rows:
+        district_name, user_id = current_user.district_name, current_user.id
+        new_ids = iter(write_queue.run(lambda session: bulk_insert_entries(
+            session, district_name, form_type, entry_date_obj, user_id, valid_rows)))
+        for result in results:
+            if result['success']:
+                result['id'] = next(new_ids)
+    
+    return jsonify({
+        'success': len(valid_rows) == len(rows),
+        'inserted': len(valid_rows),
+        'failed': len(rows) - len(valid_rows),
+        'results': results
+    })
+
+@district_bp.route('/form/<form_type>/import', methods=['POST'])
+@login_required
+def import_entries(form_type):
+    """Import entries of one form and date from an uploaded .xlsx sheet"""
+    if current_user.user_type != 'district':
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    
+    if form_type not in FORM_CONFIGS:
+        return jsonify({'success': False, 'message': 'Invalid form type'}), 400
+    
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'success': False, 'message': 'No file selected'}), 400
+    if not upload.filename.lower().endswith('.xlsx'):
+        return jsonify({'success': False, 'message': 'Only .xlsx workbooks can be imported'}), 400
+    
+    try:
+        entry_date_obj = datetime.strptime(request.form.get('entry_date') or '', '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid date format'}), 400
+    
+    dry_run = request.form.get('dry_run', '').lower() in ('1', 'true', 'on', 'yes')
+    
+    try:
+        summary = import_workbook(upload.stream, form_type, FORM_CONFIGS[form_type],
+                                  current_user.district_name, entry_date_obj, current_user.id,
+                                  dry_run=dry_run, sheet_name=request.form.get('sheet') or None)
+    except WorkbookImportError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    summary['success'] = summary['failed'] == 0 and summary['rows'] > 0
+    return jsonify(summary)
+
 @district_bp.route('/form/<form_type>/edit/<int:entry_id>')
 @login_required
 def edit_entry(form_type, entry_id):
@@ -648,7 +1088,7 @@ def edit_entry(form_type, entry_id):
     
     return jsonify({
         'success': True,
-        'entry_data': json.loads(entry.data)
+        'entry_data': entry.data
     })
 
 @district_bp.route('/form/<form_type>/delete/<int:entry_id>', methods=['DELETE'])
@@ -657,17 +1097,21 @@ def delete_entry(form_type, entry_id):
     if current_user.user_type != 'district':
         return jsonify({'success': False, 'message': 'Access denied'})
     
-    entry = DSREntry.query.filter_by(
-        id=entry_id,
-        district_name=current_user.district_name,
-        form_type=form_type
-    ).first()
+    district_name = current_user.district_name
     
-    if not entry:
-        return jsonify({'success': False, 'message': 'Entry not found'})
+    def remove_entry(session):
+        entry = session.query(DSREntry).filter_by(
+            id=entry_id,
+            district_name=district_name,
+            form_type=form_type
+        ).first()
+        if not entry:
+            return False
+        session.delete(entry)
+        return True
     
-    db.session.delete(entry)
-    db.session.commit()
+    if not write_queue.run(remove_entry):
+        return jsonify({'success': False, 'message': 'Entry not found'})
     
     return jsonify({'success': True, 'message': 'Entry deleted successfully'})
 
@@ -697,37 +1141,141 @@ def upload_file():
             flash('Invalid date format', 'error')
             return render_template('district/upload.html')
         
-        # Secure filename
-        filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        new_filename = f"{upload_type}_{timestamp}_{filename}"
-        
-        # Ensure upload directory exists
-        from flask import current_app
-        upload_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'controlroom')
-        os.makedirs(upload_path, exist_ok=True)
-        
-        file_path = os.path.join(upload_path, new_filename)
-        file.save(file_path)
-        
-        # Save to database
-        upload_record = ControlRoomUpload(
-            date=upload_date_obj,
-            upload_type=upload_type,
-            filename=new_filename,
-            original_filename=filename,
-            file_path=file_path,
-            user_id=current_user.id
-        )
+        # Store by content hash; an identical file already on disk is reused
+        try:
+            digest, blob_path, _ = upload_store.save_stream(file.stream)
+        except UploadError as e:
+            flash(str(e), 'error')
+            return render_template('district/upload.html')
         
-        db.session.add(upload_record)
-        db.session.commit()
+        _record_upload(upload_date_obj, upload_type, file.filename, digest, blob_path)
         
         flash('File uploaded successfully', 'success')
         return redirect(url_for('district.controlroom_dashboard'))
     
     return render_template('district/upload.html')
 
+def _record_upload(upload_date, upload_type, filename, digest, blob_path):
+    """Create the ControlRoomUpload row for a stored blob"""
+    upload_record = ControlRoomUpload(
+        date=upload_date,
+        upload_type=upload_type,
+        filename=digest,
+        original_filename=secure_filename(filename),
+        file_path=blob_path,
+        user_id=current_user.id
+    )
+    db.session.add(upload_record)
+    db.session.flush()
+    live_feed.record(db.session, 'upload', {
+        'id': upload_record.id,
+        'user_id': upload_record.user_id,
+        'date': upload_record.date.strftime('%d-%m-%Y'),
+        'upload_type': upload_record.upload_type,
+        'original_filename': upload_record.original_filename,
+        'uploaded_at': upload_record.uploaded_at.strftime('%d-%m-%Y %H:%M')
+    })
+    db.session.commit()
+    return upload_record
+
+def _upload_error(e):
+    body = {'success': False, 'message': str(e)}
+    if e.offset is not None:
+        body['offset'] = e.offset
+    return jsonify(body), e.status
+
+@district_bp.route('/upload/chunked', methods=['POST'])
+@login_required
+def start_chunked_upload():
+    """
+    Open a resumable upload session
+    JSON: upload_date, upload_type, filename, size and optionally sha256.
+    A file this user has uploaded before (same sha256) completes at once.
+    """
+    if current_user.user_type != 'controlroom':
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    
+    payload = request.get_json(silent=True) or {}
+    upload_type = payload.get('upload_type')
+    filename = payload.get('filename')
+    size = payload.get('size')
+    sha256 = payload.get('sha256') or None
+    if not all([payload.get('upload_date'), upload_type, filename]) or not isinstance(size, int):
+        return jsonify({'success': False, 'message': 'All fields are required'}), 400
+    if sha256 is not None and (not isinstance(sha256, str) or len(sha256) != 64):
+        return jsonify({'success': False, 'message': 'Invalid sha256'}), 400
+    
+    try:
+        upload_date_obj = datetime.strptime(payload['upload_date'], '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid date format'}), 400
+    
+    if sha256:
+        sha256 = sha256.lower()
+        seen = ControlRoomUpload.query.filter_by(filename=sha256, user_id=current_user.id).first()
+        if seen and upload_store.has_blob(sha256):
+            upload_record = _record_upload(upload_date_obj, upload_type, filename, sha256, seen.file_path)
+            flash('File uploaded successfully', 'success')
+            return jsonify({'success': True, 'complete': True, 'deduplicated': True, 'id': upload_record.id})
+    
+    try:
+        session_info = upload_store.create_session(current_user.id, size, {
+            'upload_date': payload['upload_date'],
+            'upload_type': upload_type,
+            'filename': filename
+        }, sha256=sha256)
+    except UploadError as e:
+        return _upload_error(e)
+    
+    return jsonify({
+        'success': True,
+        'complete': False,
+        'upload_id': session_info['upload_id'],
+        'offset': 0,
+        'chunk_size': upload_store.chunk_size
+    }), 201
+
+@district_bp.route('/upload/chunked/<upload_id>', methods=['GET', 'PUT', 'DELETE'])
+@login_required
+def chunked_upload(upload_id):
+    """
+    GET reports the offset to resume from, PUT appends the request body at
+    the offset given in the Upload-Offset header, DELETE abandons the upload.
+    The PUT that completes the file creates the ControlRoomUpload row.
+    """
+    if current_user.user_type != 'controlroom':
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    
+    try:
+        session_info = upload_store.get_session(upload_id, current_user.id)
+        
+        if request.method == 'GET':
+            return jsonify({'success': True, 'offset': session_info['offset'], 'size': session_info['size']})
+        
+        if request.method == 'DELETE':
+            upload_store.cancel_session(session_info)
+            return jsonify({'success': True})
+        
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Upload-Offset header is required'}), 400
+        
+        offset = upload_store.write_chunk(session_info, offset, request.stream)
+        if offset < session_info['size']:
+            return jsonify({'success': True, 'complete': False, 'offset': offset})
+        
+        digest, blob_path, deduplicated = upload_store.finish_session(session_info)
+    except UploadError as e:
+        return _upload_error(e)
+    
+    meta = session_info['metadata']
+    upload_record = _record_upload(datetime.strptime(meta['upload_date'], '%Y-%m-%d').date(),
+                                  meta['upload_type'], meta['filename'], digest, blob_path)
+    flash('File uploaded successfully', 'success')
+    return jsonify({'success': True, 'complete': True, 'deduplicated': deduplicated,
+                    'offset': offset, 'id': upload_record.id})
+
 @district_bp.route('/download_upload/<int:upload_id>')
 @login_required
 def download_upload(upload_id):
@@ -743,11 +1291,7 @@ def download_upload(upload_id):
         return redirect(url_for('district.controlroom_dashboard'))
     
     try:
-        return send_file(
-            upload.file_path,
-            as_attachment=True,
-            download_name=upload.original_filename
-        )
+        return send_upload(upload, as_attachment=True)
     except FileNotFoundError:
         flash('File not found', 'error')
         return redirect(url_for('district.controlroom_dashboard'))
@@ -768,11 +1312,7 @@ def view_upload(upload_id):
     
     try:
         # Serve file inline (view in browser) instead of download
-        return send_file(
-            upload.file_path,
-            as_attachment=False,  # This makes it view instead of download
-            download_name=upload.original_filename
-        )
+        return send_upload(upload, as_attachment=False)
     except FileNotFoundError:
         flash('File not found', 'error')
         return redirect(url_for('district.controlroom_dashboard'))
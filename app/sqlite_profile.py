@@ -0,0 +1,40 @@
+"""
+SQLite runtime profile
+Applied to every new SQLite connection: WAL journaling so readers never
+block the writer, a busy timeout so concurrent writers wait for the lock
+instead of failing with "database is locked", and the synchronous / cache
+settings from SQLITE_PRAGMAS. Does nothing for PostgreSQL.
+"""
+
+import weakref
+from sqlalchemy import event
+from app import db
+
+_configured = weakref.WeakSet()
+
+def init_app(app):
+    """Install the connection hook; call inside an app context before first use"""
+    engine = db.engine
+    if engine.dialect.name != 'sqlite' or engine in _configured:
+        return
+
+    statements = [f"PRAGMA busy_timeout = {int(app.config['SQLITE_BUSY_TIMEOUT_MS'])}"]
+    statements += [f'PRAGMA {name} = {value}' for name, value in app.config['SQLITE_PRAGMAS'].items()]
+
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+    _configured.add(engine)
+    # Connections opened before the hook are replaced by tuned ones
+    engine.dispose()
+
+def pragma_values(names=('journal_mode', 'busy_timeout', 'synchronous', 'cache_size')):
+    """Current settings of a pooled connection, for checking the profile is active"""
+    with db.engine.connect() as connection:
+        return {name: connection.exec_driver_sql(f'PRAGMA {name}').scalar() for name in names}
@@ -0,0 +1,107 @@
+"""
+Streaming CSV and NDJSON exports of one form over a date range
+Entries are read in QUERY_CHUNK_SIZE batches of plain column tuples (no
+ORM objects) and written out as the response is sent, so a year of a busy
+form never sits in the worker's memory. Columns are the entry id, district,
+date and time of the last update, then the form's fields in FORM_CONFIGS
+order.
+
+The query's transaction stays open until the last chunk is sent. On
+PostgreSQL it is idle whenever the client is slow to read, so the export
+raises idle_in_transaction_session_timeout for its own transaction to
+EXPORT_STREAM_IDLE_TIMEOUT_MS; a client that stalls longer is cut off.
+CSV cells that Excel would read as a formula are prefixed with a quote.
+"""
+
+import io
+import csv
+import json
+import itertools
+from flask import current_app
+from sqlalchemy import text
+from app import db
+from app.models import DSREntry, FORM_CONFIGS
+from app.exports import QUERY_CHUNK_SIZE
+from app.json_fields import NUMBER
+
+# Export format -> response mimetype
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Days exported when no date range is given
+DEFAULT_DAYS = 30
+
+# Output is sent in pieces of about this many bytes rather than row by row
+FLUSH_BYTES = 64 * 1024
+
+LEAD_COLUMNS = ['id', 'district', 'date', 'updated_at']
+
+# Leading characters that make a spreadsheet evaluate a cell
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+def columns(form_type):
+    """Column names of a form's export, in output order"""
+    return LEAD_COLUMNS + [field['name'] for field in FORM_CONFIGS[form_type]['fields']]
+
+def form_entries_query(form_type, date_from, date_to, district_name=None, data_filter=None):
+    """Entries of a form between two dates (inclusive), oldest first"""
+    query = db.session.query(DSREntry.id, DSREntry.district_name, DSREntry.date,
+                             DSREntry.updated_at, DSREntry.data)\
+                      .filter(DSREntry.form_type == form_type,
+                              DSREntry.date >= date_from, DSREntry.date <= date_to)
+    if district_name:
+        query = query.filter(DSREntry.district_name == district_name)
+    if data_filter is not None:
+        query = query.filter(data_filter)
+    return query.order_by(DSREntry.date, DSREntry.id)
+
+def _records(query, field_names):
+    if db.session.get_bind().dialect.name == 'postgresql':
+        # SET LOCAL: this request's transaction only, reset when it ends
+        timeout = int(current_app.config['EXPORT_STREAM_IDLE_TIMEOUT_MS'])
+        db.session.execute(text(f'SET LOCAL idle_in_transaction_session_timeout = {timeout}'))
+    for entry_id, district_name, entry_date, updated_at, data in query.yield_per(QUERY_CHUNK_SIZE):
+        data = data or {}
+        yield ([entry_id, district_name, entry_date.strftime('%Y-%m-%d'),
+                updated_at.strftime('%Y-%m-%d %H:%M:%S') if updated_at else '']
+               + [data.get(name, '') for name in field_names])
+
+def _buffered(lines):
+    """Join short strings into pieces of about FLUSH_BYTES"""
+    buffer = io.StringIO()
+    for line in lines:
+        buffer.write(line)
+        if buffer.tell() >= FLUSH_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def _csv_cell(value):
+    """A value made safe to open in a spreadsheet; plain numbers such as -5 are left alone"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES) and not NUMBER.fullmatch(value):
+        return "'" + value
+    return value
+
+def _csv_lines(query, form_type):
+    names = columns(form_type)
+    line = io.StringIO()
+    writer = csv.writer(line)
+    for record in itertools.chain([names], _records(query, names[len(LEAD_COLUMNS):])):
+        line.seek(0)
+        line.truncate()
+        writer.writerow([_csv_cell(value) for value in record])
+        yield line.getvalue()
+
+def _ndjson_lines(query, form_type):
+    names = columns(form_type)
+    for record in _records(query, names[len(LEAD_COLUMNS):]):
+        yield json.dumps(dict(zip(names, record)), ensure_ascii=False) + '\n'
+
+def stream(query, form_type, export_format):
+    """Generate the export of a form_entries_query in export_format, in chunks of text"""
+    lines = _csv_lines if export_format == 'csv' else _ndjson_lines
+    return _buffered(lines(query, form_type))
@@ -0,0 +1,129 @@
+"""
+Daily submission matrix (district x form)
+DailySubmission holds the entry count and last update time for every
+(date, district, form_type). It is updated inside the transaction that
+writes DSREntry rows, so the summary commits or rolls back together with them.
+"""
+
+from collections import defaultdict
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import DSREntry, DailySubmission, FORM_CONFIGS, DISTRICTS
+from app.entry_events import entries_changed
+
+def init_app(app):
+    entries_changed.connect(_track_submissions, weak=False)
+
+def _track_submissions(session, changes):
+    """Fold a batch of entry changes into DailySubmission"""
+    deltas = defaultdict(int)
+    stamps = {}
+    for change in changes:
+        key = (change.date, change.district_name, change.form_type)
+        if change.action == 'delete':
+            deltas[key] -= 1
+            continue
+        deltas[key] += 1 if change.action == 'insert' else 0
+        if change.updated_at:
+            stamps[key] = change.updated_at
+
+    if not deltas:
+        return
+
+    connection = session.connection()
+    dialect = postgresql if connection.dialect.name == 'postgresql' else sqlite
+    table = DailySubmission.__table__
+
+    for (entry_date, district_name, form_type), delta in deltas.items():
+        if None in (entry_date, district_name, form_type):
+            continue
+        stamp = stamps.get((entry_date, district_name, form_type))
+        stmt = dialect.insert(table).values(
+            date=entry_date,
+            district_name=district_name,
+            form_type=form_type,
+            entry_count=max(delta, 0),
+            last_updated=stamp
+        )
+        updates = {'entry_count': table.c.entry_count + delta}
+        if stamp is not None:
+            updates['last_updated'] = stmt.excluded.last_updated
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c.date, table.c.district_name, table.c.form_type],
+            set_=updates
+        ))
+
+def rebuild(entry_date=None):
+    """Recompute DailySubmission from DSREntry, for one date or for all dates"""
+    delete = DailySubmission.__table__.delete()
+    source = db.session.query(DSREntry.date, DSREntry.district_name, DSREntry.form_type,
+                              func.count(DSREntry.id), func.max(DSREntry.updated_at))
+    if entry_date is not None:
+        delete = delete.where(DailySubmission.date == entry_date)
+        source = source.filter(DSREntry.date == entry_date)
+    source = source.group_by(DSREntry.date, DSREntry.district_name, DSREntry.form_type)
+
+    db.session.execute(delete)
+    db.session.execute(DailySubmission.__table__.insert().from_select(
+        ['date', 'district_name', 'form_type', 'entry_count', 'last_updated'],
+        source.statement
+    ))
+    db.session.commit()
+
+def ensure_populated():
+    """Backfill the summary once for databases that predate it"""
+    if db.session.query(DailySubmission.date).first() is not None:
+        return
+    if db.session.query(DSREntry.id).first() is None:
+        return
+    try:
+        rebuild()
+    except IntegrityError:
+        # Another worker backfilled concurrently
+        db.session.rollback()
+
+def compliance_matrix(day):
+    """
+    Return {district: {form_type: entry_count}} for a date, for every district
+    in DISTRICTS and every form in FORM_CONFIGS (0 when nothing was filed)
+    """
+    matrix = {district: {form_type: 0 for form_type in FORM_CONFIGS} for district in DISTRICTS}
+    rows = DailySubmission.query.filter(DailySubmission.date == day,
+                                        DailySubmission.entry_count > 0).all()
+    for row in rows:
+        matrix.setdefault(row.district_name, {form_type: 0 for form_type in FORM_CONFIGS})
+        matrix[row.district_name][row.form_type] = row.entry_count
+    return matrix
+
+def late_filers(day, matrix=None):
+    """
+    Districts that have not filed every form for a date, fewest forms filed
+    first, with the forms still missing and their last submission time
+    """
+    if matrix is None:
+        matrix = compliance_matrix(day)
+    last_seen = dict(db.session.query(DailySubmission.district_name, func.max(DailySubmission.last_updated))
+                               .filter(DailySubmission.date == day, DailySubmission.entry_count > 0)
+                               .group_by(DailySubmission.district_name).all())
+
+    result = []
+    for district in DISTRICTS:
+        counts = matrix.get(district, {})
+        missing = [form_type for form_type in FORM_CONFIGS if not counts.get(form_type)]
+        if missing:
+            result.append({
+                'district': district,
+                'filed': len(FORM_CONFIGS) - len(missing),
+                'missing': missing,
+                'last_updated': last_seen.get(district)
+            })
+    result.sort(key=lambda item: (item['filed'], item['district']))
+    return result
+
+def entries_on(day):
+    """Total entries for a date, read from the summary"""
+    total = db.session.query(func.sum(DailySubmission.entry_count))\
+                      .filter(DailySubmission.date == day).scalar()
+    return total or 0
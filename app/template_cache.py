@@ -0,0 +1,121 @@
+"""
+Template caches
+The form, dashboard and form view pages spend most of their render time on
+markup derived from FORM_CONFIGS and DISTRICTS (form fields, table headers,
+district and form lists), which only changes with a code change. Such parts
+are wrapped in a {% fragment %} block:
+
+    {% fragment form_type %} ... {% endfragment %}
+
+The block renders once per worker process and key, and is then served from
+memory. The key is the block's place in the template, the arguments given
+(anything the block reads besides FORM_CONFIGS and DISTRICTS), and the
+schema version, a hash of FORM_CONFIGS and DISTRICTS. A template that is
+reloaded after an edit gets new keys. Only cache markup that does not
+depend on the user, the request or the data.
+
+Compiled templates are also kept in TEMPLATE_BYTECODE_CACHE_DIR, so a new
+worker loads them instead of compiling every template again.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from jinja2 import nodes, FileSystemBytecodeCache
+from jinja2.ext import Extension
+from markupsafe import Markup
+from app.models import FORM_CONFIGS, DISTRICTS
+
+# Most fragments kept per worker process; least recently used go first
+MAX_FRAGMENTS = 1024
+
+def schema_version():
+    """Short hash of FORM_CONFIGS and DISTRICTS"""
+    raw = json.dumps([FORM_CONFIGS, DISTRICTS], sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:12]
+
+class FragmentCache:
+    """In-memory LRU store of rendered template fragments"""
+
+    def __init__(self, max_items=MAX_FRAGMENTS):
+        self.enabled = True
+        self.max_items = max_items
+        self.version = schema_version()
+        self.hits = 0
+        self.misses = 0
+        self._fragments = OrderedDict()
+        self._lock = threading.Lock()
+
+    def render(self, key, render):
+        """Return the fragment stored under key, rendering it with render() on a miss"""
+        if not self.enabled:
+            return render()
+        key = (self.version,) + key
+        with self._lock:
+            markup = self._fragments.get(key)
+            if markup is not None:
+                self._fragments.move_to_end(key)
+                self.hits += 1
+                return markup
+            self.misses += 1
+
+        markup = Markup(render())
+        with self._lock:
+            self._fragments[key] = markup
+            while len(self._fragments) > self.max_items:
+                self._fragments.popitem(last=False)
+        return markup
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'schema_version': self.version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'fragments': len(self._fragments),
+                'pid': os.getpid()
+            }
+
+fragment_cache = FragmentCache()
+
+class FragmentCacheExtension(Extension):
+    """The {% fragment [arg, ...] %} ... {% endfragment %} tag"""
+
+    tags = {'fragment'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        # Fixed when the template is compiled (and kept in the bytecode
+        # cache), so an edited and reloaded template does not match old keys
+        place = f"{parser.name}:{lineno}:{time.time_ns()}"
+
+        args = [nodes.Const(place)]
+        while parser.stream.current.type != 'block_end':
+            if len(args) > 1:
+                parser.stream.expect('comma')
+            args.append(parser.parse_expression())
+
+        body = parser.parse_statements(('name:endfragment',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.List(args)]), [], [], body).set_lineno(lineno)
+
+    def _render(self, key, caller):
+        return fragment_cache.render(tuple(key), caller)
+
+def init_app(app):
+    fragment_cache.enabled = app.config['TEMPLATE_FRAGMENT_CACHE']
+    app.jinja_env.add_extension(FragmentCacheExtension)
+
+    directory = app.config['TEMPLATE_BYTECODE_CACHE_DIR']
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(str(directory))
@@ -0,0 +1,125 @@
+"""
+Statewide numeric totals for count-type forms
+Number fields are stored as strings inside DSREntry.data. Their sums per
+(date, district) are kept in the DailyRollup table (app/rollups.py), so
+summarise() reads that small date x district grid instead of the entries
+and derives statewide and per-district sums, daily averages and
+day-over-day deltas from it.
+"""
+
+from datetime import timedelta
+from app import db
+from app.models import DailyRollup, FORM_CONFIGS
+
+# Forms with at least one number field, and those fields
+NUMBER_FIELDS = {
+    form_type: [field for field in config['fields'] if field['type'] == 'number']
+    for form_type, config in FORM_CONFIGS.items()
+    if any(field['type'] == 'number' for field in config['fields'])
+}
+
+DEFAULT_DAYS = 30
+MAX_RANGE_DAYS = 366
+
+def _number(value):
+    value = float(value or 0)
+    return int(value) if value.is_integer() else round(value, 2)
+
+def _values(names, values):
+    return {name: _number(value) for name, value in zip(names, values)}
+
+def _deltas(names, current, previous):
+    if previous is None:
+        return None
+    return {name: _number(now - before) for name, now, before in zip(names, current, previous)}
+
+def grid(form_type, date_from, date_to):
+    """
+    Summed number fields per (date, district)
+    Returns {(date, district): (entry_count, [sum per field])}, fields in
+    NUMBER_FIELDS order; empty and non-numeric values count as 0.
+    """
+    position = {field['name']: index for index, field in enumerate(NUMBER_FIELDS[form_type])}
+    rows = db.session.query(DailyRollup.date, DailyRollup.district_name, DailyRollup.field,
+                            DailyRollup.entry_count, DailyRollup.total)\
+                     .filter(DailyRollup.form_type == form_type,
+                             DailyRollup.date >= date_from,
+                             DailyRollup.date <= date_to)
+    cells = {}
+    for day, district, field, count, total in rows:
+        if field not in position:
+            continue
+        cell = cells.setdefault((day, district), [0, [0.0] * len(position)])
+        cell[0] = max(cell[0], count)
+        cell[1][position[field]] = float(total or 0)
+    return {key: (count, values) for key, (count, values) in cells.items()}
+
+def summarise(form_type, date_from, date_to):
+    """
+    State and district totals of a form's number fields over a date range
+    Averages are per reporting day (days with at least one entry); deltas
+    compare a day with the previous day (statewide) or a district's latest
+    reporting day with its previous one.
+    """
+    fields = NUMBER_FIELDS[form_type]
+    names = [field['name'] for field in fields]
+    cells = grid(form_type, date_from, date_to)
+    zero = [0.0] * len(names)
+
+    days = [date_from + timedelta(days=offset) for offset in range((date_to - date_from).days + 1)]
+    by_district = {}
+    for (day, district), cell in cells.items():
+        by_district.setdefault(district, {})[day] = cell
+
+    daily = []
+    state_sum = list(zero)
+    reporting_days = 0
+    previous = None
+    for day in days:
+        day_cells = [reports[day] for reports in by_district.values() if day in reports]
+        day_sum = [sum(column) for column in zip(*(values for _, values in day_cells))] or list(zero)
+        if day_cells:
+            reporting_days += 1
+        state_sum = [total + value for total, value in zip(state_sum, day_sum)]
+        daily.append({
+            'date': day.strftime('%Y-%m-%d'),
+            'districts_reported': len(day_cells),
+            'entries': sum(count for count, _ in day_cells),
+            'totals': _values(names, day_sum),
+            'delta': _deltas(names, day_sum, previous)
+        })
+        previous = day_sum
+
+    districts = []
+    for district in sorted(by_district):
+        reports = by_district[district]
+        reported = sorted(reports)
+        district_sum = [sum(column) for column in zip(*(reports[day][1] for day in reported))]
+        latest = reports[reported[-1]][1]
+        before = reports[reported[-2]][1] if len(reported) > 1 else None
+        districts.append({
+            'district': district,
+            'entries': sum(reports[day][0] for day in reported),
+            'days_reported': len(reported),
+            'totals': _values(names, district_sum),
+            'averages': _values(names, [value / len(reported) for value in district_sum]),
+            'latest_date': reported[-1].strftime('%Y-%m-%d'),
+            'latest': _values(names, latest),
+            'delta': _deltas(names, latest, before)
+        })
+
+    return {
+        'form_type': form_type,
+        'form_name': FORM_CONFIGS[form_type]['name'],
+        'from': date_from.strftime('%Y-%m-%d'),
+        'to': date_to.strftime('%Y-%m-%d'),
+        'fields': [{'name': field['name'], 'label': field['label']} for field in fields],
+        'state': {
+            'entries': sum(count for count, _ in cells.values()),
+            'reporting_days': reporting_days,
+            'totals': _values(names, state_sum),
+            'averages': _values(names, [value / reporting_days if reporting_days else 0 for value in state_sum])
+        },
+        'daily': daily,
+        'districts': districts
+    }
@@ -0,0 +1,307 @@
+"""
+Content-addressed storage for control room uploads
+Files are hashed (SHA-256) while they are written and kept once under
+<UPLOAD_FOLDER>/blobs/<hash[:2]>/<hash>, so uploading the same file again
+reuses the existing blob; ControlRoomUpload.file_path points at the blob
+and ControlRoomUpload.filename holds the hash.
+
+Large files can be sent in chunks over several requests. An upload
+session keeps the bytes received so far under <UPLOAD_FOLDER>/partial,
+so a client whose link drops asks for the current offset and resumes
+from there instead of starting over.
+
+send_upload serves a stored file after the route's access check, either
+through the front-end proxy (X-Accel-Redirect / X-Sendfile) or from
+Python with ETag, conditional GET and byte ranges.
+"""
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from urllib.parse import quote
+from flask import current_app, request
+from werkzeug.utils import send_file
+
+# Bytes read from the request body and the disk per write/hash step
+COPY_BUFFER = 64 * 1024
+
+class UploadError(Exception):
+    """A chunk or upload session request that cannot be honoured"""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+class UploadStore:
+    """Blob store plus resumable upload sessions"""
+
+    def __init__(self, app=None):
+        self.blob_dir = None
+        self.partial_dir = None
+        self.chunk_size = 0
+        self.max_bytes = 0
+        self.session_ttl = 0
+        # upload_id -> (offset, running hash) for sessions this process has
+        # been receiving; rebuilt from the partial file after a restart or
+        # when another worker took the previous chunk
+        self._hashers = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.blob_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'blobs')
+        self.partial_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'partial')
+        self.chunk_size = app.config['UPLOAD_CHUNK_SIZE']
+        self.max_bytes = app.config['UPLOAD_MAX_BYTES']
+        self.session_ttl = app.config['UPLOAD_SESSION_TTL']
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.partial_dir, exist_ok=True)
+
+    # Blobs
+
+    def blob_path(self, digest):
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def has_blob(self, digest):
+        return os.path.exists(self.blob_path(digest))
+
+    def _store_blob(self, digest, path):
+        """Move a fully written file into place; returns (blob_path, deduplicated)"""
+        target = self.blob_path(digest)
+        if os.path.exists(target):
+            os.remove(path)
+            return target, True
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+        return target, False
+
+    def save_stream(self, stream):
+        """Store a whole file from a stream; returns (digest, blob_path, deduplicated)"""
+        tmp_path = os.path.join(self.partial_dir, f"{uuid.uuid4().hex}.tmp")
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as out:
+                while True:
+                    block = stream.read(COPY_BUFFER)
+                    if not block:
+                        break
+                    size += len(block)
+                    if size > self.max_bytes:
+                        raise UploadError('File is larger than the upload limit', status=413)
+                    hasher.update(block)
+                    out.write(block)
+        except BaseException:
+            _remove(tmp_path)
+            raise
+        digest = hasher.hexdigest()
+        return (digest,) + self._store_blob(digest, tmp_path)
+
+    # Upload sessions
+
+    def _meta_path(self, upload_id):
+        return os.path.join(self.partial_dir, f"{upload_id}.json")
+
+    def _part_path(self, upload_id):
+        return os.path.join(self.partial_dir, f"{upload_id}.part")
+
+    def create_session(self, user_id, size, metadata, sha256=None):
+        """Start a chunked upload of size bytes; returns the session dict"""
+        if size <= 0:
+            raise UploadError('File is empty')
+        if size > self.max_bytes:
+            raise UploadError('File is larger than the upload limit', status=413)
+        self.expire_sessions()
+
+        upload_id = uuid.uuid4().hex
+        session = {
+            'upload_id': upload_id,
+            'user_id': user_id,
+            'size': size,
+            'sha256': sha256.lower() if sha256 else None,
+            'metadata': metadata,
+            'created': time.time()
+        }
+        open(self._part_path(upload_id), 'wb').close()
+        with open(self._meta_path(upload_id), 'w') as out:
+            json.dump(session, out)
+        return session
+
+    def get_session(self, upload_id, user_id):
+        """Load a session owned by user_id with its current offset"""
+        if not upload_id.isalnum():
+            raise UploadError('Upload not found', status=404)
+        try:
+            with open(self._meta_path(upload_id)) as meta:
+                session = json.load(meta)
+            session['offset'] = os.path.getsize(self._part_path(upload_id))
+        except (FileNotFoundError, ValueError):
+            raise UploadError('Upload not found', status=404)
+        if session['user_id'] != user_id:
+            raise UploadError('Upload not found', status=404)
+        return session
+
+    def write_chunk(self, session, offset, stream):
+        """
+        Write a chunk at offset, which must equal the bytes received so far
+        Returns the new offset. Re-sending a chunk that was already stored
+        fails with status 409 and the offset to resume from.
+        """
+        upload_id = session['upload_id']
+        path = self._part_path(upload_id)
+        current = os.path.getsize(path)
+        if offset != current:
+            raise UploadError('Offset does not match the bytes received', status=409, offset=current)
+
+        with self._lock:
+            cached = self._hashers.pop(upload_id, None)
+        hasher = cached[1] if cached and cached[0] == offset else self._hash_prefix(path, offset)
+
+        written = offset
+        with open(path, 'r+b') as out:
+            out.seek(offset)
+            while True:
+                block = stream.read(COPY_BUFFER)
+                if not block:
+                    break
+                if written + len(block) > session['size']:
+                    out.truncate(offset)
+                    raise UploadError('Chunk runs past the declared file size', offset=offset)
+                hasher.update(block)
+                out.write(block)
+                written += len(block)
+
+        # Keep an active session from expiring while it is still receiving
+        os.utime(self._meta_path(upload_id))
+        with self._lock:
+            self._hashers[upload_id] = (written, hasher)
+        return written
+
+    def finish_session(self, session):
+        """
+        Turn a fully received session into a blob
+        Returns (digest, blob_path, deduplicated); the session is removed.
+        """
+        upload_id = session['upload_id']
+        path = self._part_path(upload_id)
+        if os.path.getsize(path) != session['size']:
+            raise UploadError('Upload is incomplete', status=409, offset=os.path.getsize(path))
+
+        # Claim the file so a concurrent request for the last chunk cannot finish it twice
+        claimed = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        try:
+            os.replace(path, claimed)
+        except FileNotFoundError:
+            raise UploadError('Upload is already being completed', status=409)
+
+        with self._lock:
+            cached = self._hashers.pop(upload_id, None)
+        hasher = cached[1] if cached and cached[0] == session['size'] else self._hash_prefix(claimed, session['size'])
+        digest = hasher.hexdigest()
+        _remove(self._meta_path(upload_id))
+
+        if session['sha256'] and session['sha256'] != digest:
+            _remove(claimed)
+            raise UploadError('File checksum does not match, please upload it again')
+        return (digest,) + self._store_blob(digest, claimed)
+
+    def cancel_session(self, session):
+        upload_id = session['upload_id']
+        with self._lock:
+            self._hashers.pop(upload_id, None)
+        _remove(self._part_path(upload_id))
+        _remove(self._meta_path(upload_id))
+
+    def expire_sessions(self):
+        """Remove sessions and stray temp files older than the session TTL"""
+        cutoff = time.time() - self.session_ttl
+        for name in os.listdir(self.partial_dir):
+            path = os.path.join(self.partial_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            for upload_id in list(self._hashers):
+                if not os.path.exists(self._meta_path(upload_id)):
+                    del self._hashers[upload_id]
+
+    @staticmethod
+    def _hash_prefix(path, length):
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as source:
+            remaining = length
+            while remaining:
+                block = source.read(min(COPY_BUFFER, remaining))
+                if not block:
+                    break
+                hasher.update(block)
+                remaining -= len(block)
+        return hasher
+
+def _content_etag(upload):
+    """Blob-backed uploads use their content hash as a strong ETag"""
+    digest = upload.filename
+    if len(digest) == 64 and upload.file_path.endswith(digest):
+        return digest
+    return True
+
+def send_upload(upload, as_attachment):
+    """
+    Response for a ControlRoomUpload; raises FileNotFoundError when the file is gone
+    UPLOAD_SEND_MODE selects who transfers the bytes: '' streams them from
+    this worker, 'x-accel-redirect' hands the file to nginx through the
+    internal location UPLOAD_ACCEL_PREFIX (mapped to UPLOAD_FOLDER) and
+    'x-sendfile' hands the absolute path to Apache or lighttpd.
+    """
+    path = upload.file_path
+    if not os.path.isfile(path):
+        raise FileNotFoundError(path)
+
+    config = current_app.config
+    mode = config['UPLOAD_SEND_MODE']
+    upload_root = os.path.abspath(config['UPLOAD_FOLDER'])
+    relative = os.path.relpath(os.path.abspath(path), upload_root)
+    if mode == 'x-accel-redirect' and relative.startswith(os.pardir):
+        # Only files under UPLOAD_FOLDER are reachable through the internal location
+        mode = ''
+
+    response = send_file(
+        path,
+        request.environ,
+        as_attachment=as_attachment,
+        download_name=upload.original_filename,
+        conditional=not mode,
+        etag=_content_etag(upload),
+        use_x_sendfile=bool(mode),
+        response_class=current_app.response_class
+    )
+    # Access-controlled content: browsers may keep and revalidate it, shared caches may not
+    response.cache_control.private = True
+
+    if mode:
+        # The proxy serves ranges itself; the app still answers revalidation with 304
+        response = response.make_conditional(request.environ)
+        sendfile_path = response.headers.pop('X-Sendfile')
+        response.content_length = 0
+        if response.status_code != 304:
+            if mode == 'x-accel-redirect':
+                prefix = config['UPLOAD_ACCEL_PREFIX'].rstrip('/')
+                response.headers['X-Accel-Redirect'] = quote(f"{prefix}/{relative.replace(os.sep, '/')}")
+            else:
+                response.headers['X-Sendfile'] = sendfile_path
+    return response
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+upload_store = UploadStore()
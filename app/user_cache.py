@@ -0,0 +1,108 @@
+"""
+Per-process cache for the Flask-Login user loader
+Every authenticated request loads its user by primary key. The cache keeps
+each user's column values for USER_CACHE_TTL seconds and re-attaches them
+to the request's session with merge(load=False), which issues no SELECT;
+the loaded user behaves like a queried one (changes to it still commit).
+
+A commit that updates or deletes a User (set_password, is_active, ...)
+drops it from this process's cache. Other worker processes only see the
+change once their entry expires, so the TTL bounds how stale they can be.
+"""
+
+import os
+import time
+import threading
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
+from app import db
+from app.models import User
+
+class UserCache:
+    """TTL cache of User rows keyed by id"""
+
+    def __init__(self, app=None):
+        self.ttl = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._generations = {}  # user id (None for all) -> invalidations so far
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config['USER_CACHE_TTL']
+        if not event.contains(db.session, 'after_flush', self._collect_changed_users):
+            event.listen(db.session, 'after_flush', self._collect_changed_users)
+            event.listen(db.session, 'after_commit', self._invalidate_committed)
+            event.listen(db.session, 'after_rollback', self._discard_pending)
+
+    def load(self, user_id):
+        """Return the User for user_id attached to the current session, or None"""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(user_id)
+            if cached and cached[0] > now:
+                self.hits += 1
+                values = cached[1]
+            else:
+                self.misses += 1
+                values = None
+                generation = (self._generations.get(user_id, 0), self._generations.get(None, 0))
+
+        if values is not None:
+            user = User(**values)
+            make_transient_to_detached(user)
+            return db.session.merge(user, load=False)
+
+        user = db.session.get(User, user_id)
+        if user is not None and self.ttl > 0:
+            values = {column.key: getattr(user, column.key) for column in inspect(User).column_attrs}
+            with self._lock:
+                # Not if the user was invalidated while it was being read:
+                # the values may predate that commit
+                if generation == (self._generations.get(user_id, 0), self._generations.get(None, 0)):
+                    self._entries[user_id] = (now + self.ttl, values)
+        return user
+
+    def invalidate(self, user_id=None):
+        """Drop one user, or every user when user_id is None"""
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def stats(self):
+        """Hit/miss counters and size of this process's cache"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            'cached_users': len(self._entries),
+            'ttl_seconds': self.ttl,
+            'pid': os.getpid()
+        }
+
+    # Invalidation follows the transaction: a change is dropped from the
+    # cache once it is committed. A load that read the user before that
+    # commit sees the invalidation's generation bump and does not cache
+
+    def _collect_changed_users(self, session, flush_context):
+        changed = {user.id for user in session.dirty
+                   if isinstance(user, User) and session.is_modified(user)}
+        changed.update(user.id for user in session.deleted if isinstance(user, User))
+        if changed:
+            session.info.setdefault('changed_users', set()).update(changed)
+
+    def _invalidate_committed(self, session):
+        for user_id in session.info.pop('changed_users', ()):
+            self.invalidate(user_id)
+
+    def _discard_pending(self, session):
+        session.info.pop('changed_users', None)
+
+user_cache = UserCache()
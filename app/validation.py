@@ -0,0 +1,47 @@
+"""
+Validation of DSR entry rows against FORM_CONFIGS
+Used by the batch and import paths, which accept many rows at once and
+report errors per row instead of failing the whole submission.
+"""
+
+from datetime import datetime
+from app.json_fields import NUMBER
+
+def validate_row(form_config, row):
+    """
+    Check one row (a dict of field name -> value) against a form config
+    Returns (data, errors): data holds every configured field as a string,
+    the way form_entry stores them; errors is a list of messages.
+    """
+    if not isinstance(row, dict):
+        return None, ['Row must be an object of field values']
+
+    fields = {field['name']: field for field in form_config['fields']}
+    errors = [f"Unknown field '{name}'" for name in row if name not in fields]
+
+    data = {}
+    for name, field in fields.items():
+        value = row.get(name, '')
+        if value is None:
+            value = ''
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            errors.append(f"{field['label']}: unsupported value")
+            continue
+        value = str(value).strip()
+
+        if value and field['type'] == 'number':
+            # Only what totals and rollups count (no 'nan', '1e3' or '.5')
+            if not NUMBER.fullmatch(value):
+                errors.append(f"{field['label']}: '{value}' is not a number")
+        elif value and field['type'] == 'date':
+            try:
+                datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                errors.append(f"{field['label']}: '{value}' is not a date (YYYY-MM-DD)")
+
+        data[name] = value
+
+    if not errors and not any(data.values()):
+        errors.append('Row has no values')
+
+    return data, errors
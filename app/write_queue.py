@@ -0,0 +1,135 @@
+"""
+Serialized write queue with group commit
+On SQLite only one connection can write at a time, and each commit pays
+for a WAL sync. With SQLITE_WRITE_QUEUE on, request handlers hand their
+write jobs to one writer thread per process. The writer runs the jobs
+that have queued up in a single BEGIN IMMEDIATE transaction, each job in
+its own savepoint, and commits them together.
+
+A job is a callable taking the writer's session; it must not use
+current_user or request data directly (capture them first) and should
+return plain values, since ORM objects are detached once it commits.
+A failing job only rolls back its own savepoint and its exception is
+raised to its caller. With the queue off (or on PostgreSQL) run() calls
+the job with db.session and commits straight away.
+"""
+
+import os
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from app import db
+
+log = logging.getLogger(__name__)
+
+# session.info lists of notifications sent once the transaction commits
+PENDING_NOTIFICATIONS = ('entry_changes', 'live_events')
+
+class WriteQueue:
+    """Single writer thread per process that batches write jobs"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.max_batch = 1
+        self.batches = 0
+        self.jobs = 0
+        self._queue = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = (app.config['SQLITE_WRITE_QUEUE']
+                        and app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'))
+        self.max_batch = app.config['SQLITE_GROUP_COMMIT_MAX']
+
+    def run(self, job):
+        """Run job(session) in a write transaction and return its result once committed"""
+        if not self.enabled:
+            try:
+                result = job(db.session)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            return result
+
+        future = Future()
+        self._writer_queue().put((job, future))
+        return future.result()
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'batches': self.batches,
+            'jobs': self.jobs,
+            'jobs_per_commit': round(self.jobs / self.batches, 2) if self.batches else None,
+            'pid': os.getpid()
+        }
+
+    def _writer_queue(self):
+        # Started lazily so every forked worker process gets its own writer
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                threading.Thread(target=self._writer, args=(self._queue,),
+                                 name='dsr-writer', daemon=True).start()
+            return self._queue
+
+    def _writer(self, jobs):
+        with self.app.app_context():
+            while True:
+                batch = [jobs.get()]
+                while len(batch) < self.max_batch:
+                    try:
+                        batch.append(jobs.get_nowait())
+                    except queue.Empty:
+                        break
+                try:
+                    self._run_batch(batch)
+                except Exception:
+                    log.exception('Write batch failed')
+                finally:
+                    db.session.remove()
+
+    def _run_batch(self, batch):
+        session = db.session
+        done = []
+        try:
+            # Take the write lock up front: waits up to busy_timeout for other
+            # processes instead of failing later when a read lock is upgraded
+            session.connection().exec_driver_sql('BEGIN IMMEDIATE')
+            for job, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                marks = {key: len(session.info.get(key) or ()) for key in PENDING_NOTIFICATIONS}
+                try:
+                    with session.begin_nested():
+                        result = job(session)
+                except Exception as e:
+                    # Forget the notifications of the rolled back savepoint
+                    for key, mark in marks.items():
+                        if session.info.get(key):
+                            del session.info[key][mark:]
+                    future.set_exception(e)
+                else:
+                    done.append((future, result))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            raise
+
+        self.batches += 1
+        self.jobs += len(done)
+        for future, result in done:
+            future.set_result(result)
+
+write_queue = WriteQueue()
@@ -0,0 +1,38 @@
+"""
+Case Index Backfill
+Rebuilds the cross-form case index (CaseMention) from every DSR entry, one
+id range per transaction. The application fills an empty index on startup;
+run this after changing the identifier fields or normalisation in
+app/case_index.py, or to repair the index. It is safe to run while the
+application is serving requests.
+
+Usage:
+    python backfill_case_index.py
+    python backfill_case_index.py --chunk-size 10000
+"""
+
+import sys
+import time
+import argparse
+
+from app import create_app, case_index
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Rebuild the cross-form case index')
+    parser.add_argument('--chunk-size', type=int, default=case_index.REBUILD_CHUNK,
+                        help=f'entries per transaction (default {case_index.REBUILD_CHUNK})')
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    started = time.perf_counter()
+
+    def progress(done, total):
+        print(f"{done}/{total} entries, {done / (time.perf_counter() - started):,.0f} entries/s", flush=True)
+
+    with app.app_context():
+        written = case_index.rebuild(chunk_size=args.chunk_size, progress=progress)
+    print(f"Done: {written} mentions in {time.perf_counter() - started:.1f}s")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
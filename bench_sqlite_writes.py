@@ -0,0 +1,165 @@
+"""
+SQLite Write Concurrency Benchmark
+Runs several worker processes (like gunicorn -w 4), each with several
+threads posting DSR entries through the form_entry route as fast as they
+can, and reports sustained submissions per second, latency and failures
+("database is locked") for each SQLite profile:
+
+    default     no pragmas, 5s busy timeout, no write queue (settings before the profile)
+    wal         SQLITE_PRAGMAS and SQLITE_BUSY_TIMEOUT_MS, direct commits
+    wal+queue   the full profile: WAL plus the per-process write queue with group commit
+
+Usage:
+    python bench_sqlite_writes.py
+    python bench_sqlite_writes.py --processes 4 --threads 8 --seconds 20 --modes wal,wal+queue
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+import multiprocessing
+
+from config import Config
+
+MODES = ('default', 'wal', 'wal+queue')
+FORM_TYPE = 'nbw_status'
+PASSWORD = 'bench-pass'
+
+def mode_config(mode, database_uri):
+    """Config class for one benchmark mode"""
+    settings = {'SQLALCHEMY_DATABASE_URI': database_uri}
+    if mode == 'default':
+        settings.update(SQLITE_PRAGMAS={}, SQLITE_BUSY_TIMEOUT_MS=5000, SQLITE_WRITE_QUEUE=False)
+    elif mode == 'wal':
+        settings.update(SQLITE_WRITE_QUEUE=False)
+    else:
+        settings.update(SQLITE_WRITE_QUEUE=True)
+    return type('BenchConfig', (Config,), settings)
+
+def prepare_database(mode, database_uri, processes):
+    """Create the schema and one district user per worker process"""
+    from app import create_app, db
+    from app.models import User, DISTRICTS
+
+    app = create_app(mode_config(mode, database_uri))
+    with app.app_context():
+        for index in range(processes):
+            user = User(username=f'bench_{index}', user_type='district',
+                        district_name=DISTRICTS[index % len(DISTRICTS)])
+            user.set_password(PASSWORD)
+            db.session.add(user)
+        db.session.commit()
+        db.engine.dispose()
+
+def worker_process(index, mode, database_uri, threads, seconds, barrier, results):
+    """One app instance; its threads post entries until the time is up"""
+    from app import create_app
+    from app.models import FORM_CONFIGS
+
+    app = create_app(mode_config(mode, database_uri))
+    app.logger.disabled = True
+    form_data = {field['name']: '1' for field in FORM_CONFIGS[FORM_TYPE]['fields']}
+    form_data['entry_date'] = time.strftime('%Y-%m-%d')
+
+    clients = []
+    for _ in range(threads):
+        client = app.test_client()
+        client.post('/auth/login', data={'username': f'bench_{index}', 'password': PASSWORD,
+                                         'user_type': 'district'})
+        clients.append(client)
+
+    latencies = []
+    failures = [0]
+    lock = threading.Lock()
+
+    def post_entries(client, deadline):
+        own_latencies = []
+        own_failures = 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                response = client.post(f'/district/form/{FORM_TYPE}', data=form_data,
+                                       headers={'X-Requested-With': 'XMLHttpRequest'})
+                ok = response.status_code == 200 and response.get_json().get('success')
+            except Exception:
+                ok = False
+            if ok:
+                own_latencies.append(time.perf_counter() - started)
+            else:
+                own_failures += 1
+        with lock:
+            latencies.extend(own_latencies)
+            failures[0] += own_failures
+
+    barrier.wait()
+    deadline = time.perf_counter() + seconds
+    workers = [threading.Thread(target=post_entries, args=(client, deadline)) for client in clients]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    results.put((latencies, failures[0]))
+
+def run_mode(mode, processes, threads, seconds):
+    handle, scratch_file = tempfile.mkstemp(suffix='.db')
+    os.close(handle)
+    os.remove(scratch_file)
+    database_uri = f'sqlite:///{scratch_file}'
+
+    try:
+        prepare_database(mode, database_uri, processes)
+        context = multiprocessing.get_context('spawn')
+        barrier = context.Barrier(processes)
+        results = context.Queue()
+        workers = [context.Process(target=worker_process,
+                                   args=(index, mode, database_uri, threads, seconds, barrier, results))
+                   for index in range(processes)]
+        for worker in workers:
+            worker.start()
+        collected = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(scratch_file + suffix):
+                os.remove(scratch_file + suffix)
+
+    latencies = sorted(latency for part, _ in collected for latency in part)
+    failures = sum(failed for _, failed in collected)
+    percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0
+    return {
+        'mode': mode,
+        'saved': len(latencies),
+        'failed': failures,
+        'per_second': len(latencies) / seconds,
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99)
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='SQLite write concurrency benchmark')
+    parser.add_argument('--processes', type=int, default=4, help='worker processes (default 4)')
+    parser.add_argument('--threads', type=int, default=8, help='writer threads per process (default 8)')
+    parser.add_argument('--seconds', type=float, default=10, help='duration of each run (default 10)')
+    parser.add_argument('--modes', default=','.join(MODES), help=f"comma separated, from {', '.join(MODES)}")
+    args = parser.parse_args(argv)
+
+    modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown:
+        parser.error(f"unknown mode(s): {', '.join(unknown)}")
+
+    print(f"{args.processes} processes x {args.threads} threads, {args.seconds:g}s per mode\n")
+    print(f"{'mode':<11} {'saved':>7} {'failed':>7} {'per sec':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for mode in modes:
+        result = run_mode(mode, args.processes, args.threads, args.seconds)
+        print(f"{result['mode']:<11} {result['saved']:>7} {result['failed']:>7} {result['per_second']:>9.1f} "
+              f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
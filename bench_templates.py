@@ -0,0 +1,163 @@
+"""
+Template Render Benchmark
+Requests the pages built on district/form_entry.html, admin/form_view.html
+and admin/dashboard.html against a scratch SQLite database and reports,
+per template:
+
+    load      compiling the template and base.html from source in a new worker
+    bytecode  the same, loaded from a warm TEMPLATE_BYTECODE_CACHE_DIR
+    nocache   render time per request with TEMPLATE_FRAGMENT_CACHE off
+    fragment  render time per request with the fragment cache on
+
+Render time is measured between Flask's before_render_template and
+template_rendered signals, so the database queries of the route are not
+counted.
+
+Usage:
+    python bench_templates.py
+    python bench_templates.py --requests 500 --form crime_data
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from datetime import date, datetime, timedelta
+
+from flask import before_render_template, template_rendered
+from config import Config
+
+PASSWORD = 'bench-pass'
+TEMPLATES = ('district/form_entry.html', 'admin/form_view.html', 'admin/dashboard.html')
+
+def bench_config(database_uri, bytecode_dir, fragments):
+    return type('BenchConfig', (Config,), {
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        'TEMPLATE_BYTECODE_CACHE_DIR': bytecode_dir,
+        'TEMPLATE_FRAGMENT_CACHE': fragments,
+        'JOB_WORKERS': 0,
+        'EOD_CUTOFF': ''
+    })
+
+def seed_database(app, form_type):
+    """Users, today's entries of every district and form, and a page of form_type history"""
+    from app import db
+    from app.models import User, DSREntry, FORM_CONFIGS, DISTRICTS
+
+    with app.app_context():
+        users = {}
+        for username, user_type, district in (('bench_admin', 'admin', None),
+                                              ('bench_district', 'district', DISTRICTS[0])):
+            user = User(username=username, user_type=user_type, district_name=district)
+            user.set_password(PASSWORD)
+            db.session.add(user)
+            users[user_type] = user
+        db.session.flush()
+
+        today = date.today()
+        stamp = datetime.combine(today, datetime.min.time())
+        rows = []
+        for district in DISTRICTS:
+            for name, form_config in FORM_CONFIGS.items():
+                data = {field['name']: f"{field['label']} {district}" for field in form_config['fields']}
+                copies = 10 if district == DISTRICTS[0] else 1
+                rows += [{'district_name': district, 'form_type': name, 'date': today, 'data': data,
+                          'created_at': stamp, 'updated_at': stamp, 'user_id': users['district'].id}] * copies
+        data = {field['name']: field['label'] for field in FORM_CONFIGS[form_type]['fields']}
+        for day in range(1, 60):
+            rows.append({'district_name': DISTRICTS[day % len(DISTRICTS)], 'form_type': form_type,
+                         'date': today - timedelta(days=day), 'data': data,
+                         'created_at': stamp, 'updated_at': stamp, 'user_id': users['district'].id})
+        db.session.execute(DSREntry.__table__.insert(), rows)
+        db.session.commit()
+
+def client_for(app, username, user_type):
+    client = app.test_client()
+    client.post('/auth/login', data={'username': username, 'password': PASSWORD, 'user_type': user_type})
+    return client
+
+def time_loads(database_uri, bytecode_dir):
+    """Seconds to load each template and base.html in a fresh app"""
+    from app import create_app
+
+    app = create_app(bench_config(database_uri, bytecode_dir, True))
+    loads = {}
+    for name in TEMPLATES:
+        app.jinja_env.cache.clear()
+        started = time.perf_counter()
+        app.jinja_env.get_template(name)
+        app.jinja_env.get_template('base.html')
+        loads[name] = time.perf_counter() - started
+    return loads
+
+def time_renders(database_uri, fragments, form_type, requests):
+    """Mean seconds spent rendering each template over a number of requests"""
+    from app import create_app
+
+    app = create_app(bench_config(database_uri, '', fragments))
+    pages = {
+        'district/form_entry.html': (client_for(app, 'bench_district', 'district'), f'/district/form/{form_type}'),
+        'admin/form_view.html': (client_for(app, 'bench_admin', 'admin'), f'/admin/form/{form_type}'),
+        'admin/dashboard.html': (client_for(app, 'bench_admin', 'admin'), '/admin/dashboard'),
+    }
+
+    started = {}
+    spent = {name: 0.0 for name in pages}
+
+    def before(sender, template, context, **extra):
+        started[template.name] = time.perf_counter()
+
+    def after(sender, template, context, **extra):
+        if template.name in spent:
+            spent[template.name] += time.perf_counter() - started[template.name]
+
+    for name, (client, url) in pages.items():
+        client.get(url)  # compile and fill the fragment cache
+    before_render_template.connect(before, app)
+    template_rendered.connect(after, app)
+    try:
+        for name, (client, url) in pages.items():
+            for _ in range(requests):
+                response = client.get(url)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{url} returned {response.status_code}")
+    finally:
+        before_render_template.disconnect(before, app)
+        template_rendered.disconnect(after, app)
+    return {name: total / requests for name, total in spent.items()}
+
+def main(argv=None):
+    from app.models import FORM_CONFIGS
+
+    parser = argparse.ArgumentParser(description='Template render benchmark')
+    parser.add_argument('--requests', type=int, default=200, help='requests per template (default 200)')
+    parser.add_argument('--form', default='crime_data', choices=sorted(FORM_CONFIGS), metavar='FORM_TYPE',
+                        help='form rendered by form_entry and form_view (default crime_data)')
+    args = parser.parse_args(argv)
+
+    scratch_dir = tempfile.mkdtemp()
+    database_uri = f"sqlite:///{os.path.join(scratch_dir, 'bench.db')}"
+    bytecode_dir = os.path.join(scratch_dir, 'jinja_cache')
+
+    try:
+        from app import create_app
+        seed_database(create_app(bench_config(database_uri, '', True)), args.form)
+
+        cold = time_loads(database_uri, bytecode_dir)
+        warm = time_loads(database_uri, bytecode_dir)
+        plain = time_renders(database_uri, False, args.form, args.requests)
+        cached = time_renders(database_uri, True, args.form, args.requests)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    print(f"{args.requests} requests per template, form {args.form}\n")
+    print(f"{'template':<28} {'load ms':>8} {'bytecode':>9} {'nocache':>8} {'fragment':>9} {'speedup':>8}")
+    for name in TEMPLATES:
+        print(f"{name:<28} {cold[name] * 1000:>8.2f} {warm[name] * 1000:>9.2f} {plain[name] * 1000:>8.3f} "
+              f"{cached[name] * 1000:>9.3f} {plain[name] / cached[name]:>7.2f}x")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""
+Static Asset Build
+Writes content-hashed copies of app/static into ASSET_BUILD_DIR (default
+instance/assets/) with gzip/brotli copies of CSS and JS and WebP/AVIF
+copies of the header logos and landing image, plus the manifest that
+asset_url() reads. Run it on each deploy, before starting the workers;
+files changed after a build are served unversioned until the next one.
+
+Image variants need Pillow (AVIF needs Pillow built with libavif) and .br
+files need the brotli package:
+    pip install Pillow brotli
+
+Usage:
+    python build_assets.py
+    python build_assets.py --output /srv/dsr/assets
+"""
+
+import os
+import sys
+import argparse
+
+from config import Config
+from app import assets
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app', 'static')
+
+def _size(path):
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build fingerprinted, precompressed static assets')
+    parser.add_argument('--output', default=str(Config.ASSET_BUILD_DIR),
+                        help=f'build directory (default {Config.ASSET_BUILD_DIR})')
+    args = parser.parse_args(argv)
+
+    if assets.brotli is None:
+        print("brotli not installed: writing gzip copies only")
+    if not assets._image_formats():
+        print("Pillow with WebP/AVIF support not installed: skipping image variants")
+
+    manifest = assets.build(STATIC_DIR, args.output)
+
+    print(f"\n{'file':<28} {'bytes':>9} {'gzip':>8} {'br':>8}  variants")
+    for name, built in sorted(manifest['files'].items()):
+        target = os.path.join(args.output, built)
+        variants = manifest['images'].get(name, {})
+        smallest = min((_size(os.path.join(args.output, path)) for sizes in variants.values() for path, _ in sizes),
+                       default=None)
+        note = f"{sum(len(sizes) for sizes in variants.values())} images, smallest {smallest} bytes" if variants else ''
+        print(f"{name:<28} {_size(target):>9} {_size(target + '.gz') or '-':>8} {_size(target + '.br') or '-':>8}  {note}")
+    print(f"\nManifest written to {os.path.join(args.output, assets.MANIFEST)}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
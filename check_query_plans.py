@@ -0,0 +1,201 @@
+"""
+Query Plan Regression Check
+Seeds a scratch database with DSR entries and runs EXPLAIN on the DSREntry
+queries issued by the hot routes in app/routes.py.
+Fails (exit code 1) if any of them falls back to a sequential table scan,
+or if a query listed in SEARCH_KEYS does not use all of its equality
+columns as index search keys (an index that only narrows by district
+still walks the district's whole history).
+
+Usage:
+    python check_query_plans.py                       # temporary SQLite database
+    python check_query_plans.py postgresql://u:p@host/scratch_db
+
+The PostgreSQL database must be a scratch database - its tables are dropped.
+"""
+
+import os
+import sys
+import random
+import tempfile
+from datetime import date, datetime, timedelta
+
+from config import Config
+from app import create_app, db
+from app.models import User, DSREntry, CaseMention, FORM_CONFIGS, DISTRICTS
+from app.exports import district_entries_query
+from app.stream_exports import form_entries_query
+from app.json_fields import field_filter
+from app.pagination import PAGE_SIZE
+from sqlalchemy import tuple_
+
+SEED_DAYS = 60
+SEED_ENTRIES_PER_FORM = 2
+
+# Equality-filtered columns that must all be index search keys
+SEARCH_KEYS = {
+    'admin.search': ('district_name', 'date'),
+    'admin.download_dsr': ('district_name', 'date'),
+    'district.form_entry (GET)': ('district_name', 'form_type', 'date'),
+}
+
+def seed_database():
+    """Fill the scratch database with entries for every district, form and day"""
+    user = User(username='plan_check', user_type='admin')
+    user.set_password('plan_check')
+    db.session.add(user)
+    db.session.flush()
+
+    start = date.today() - timedelta(days=SEED_DAYS)
+    rows = []
+    for day in range(SEED_DAYS + 1):
+        entry_date = start + timedelta(days=day)
+        for district in DISTRICTS:
+            for form_type, form_config in FORM_CONFIGS.items():
+                for _ in range(SEED_ENTRIES_PER_FORM):
+                    stamp = datetime.combine(entry_date, datetime.min.time()) + timedelta(minutes=random.randint(0, 1439))
+                    data = {field['name']: str(random.randint(0, 99)) for field in form_config['fields']}
+                    rows.append({
+                        'district_name': district,
+                        'form_type': form_type,
+                        'date': entry_date,
+                        'data': data,
+                        'created_at': stamp,
+                        'updated_at': stamp,
+                        'user_id': user.id
+                    })
+        db.session.execute(DSREntry.__table__.insert(), rows)
+        rows = []
+    db.session.commit()
+
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(db.text('ANALYZE dsr_entry'))
+    else:
+        db.session.execute(db.text('ANALYZE'))
+    db.session.commit()
+
+def keyset(query, cursor=None):
+    """Page query as issued by app.pagination.keyset_page"""
+    if cursor:
+        query = query.filter(tuple_(DSREntry.date, DSREntry.id) < tuple_(*cursor))
+    return query.order_by(DSREntry.date.desc(), DSREntry.id.desc()).limit(PAGE_SIZE + 1).statement
+
+def route_queries():
+    """The DSREntry queries issued by each hot route, keyed by route name"""
+    today = date.today()
+    cursor = (today - timedelta(days=SEED_DAYS // 2), 1)
+    district = DISTRICTS[0]
+    form_type = next(iter(FORM_CONFIGS))
+
+    return {
+        'admin.dashboard (recent entries)':
+            DSREntry.query.order_by(DSREntry.updated_at.desc()).limit(10).statement,
+        'admin.dashboard (today count)':
+            db.select(db.func.count()).select_from(DSREntry).filter_by(date=today),
+        'admin.district_view':
+            keyset(DSREntry.query.filter_by(district_name=district)),
+        'admin.district_view (next page)':
+            keyset(DSREntry.query.filter_by(district_name=district), cursor),
+        'admin.form_view':
+            keyset(DSREntry.query.filter_by(form_type=form_type)),
+        'admin.form_view (next page)':
+            keyset(DSREntry.query.filter_by(form_type=form_type), cursor),
+        'admin.form_view (date filter)':
+            keyset(DSREntry.query.filter_by(form_type=form_type, date=today)),
+        'admin.form_view (field filter)':
+            keyset(DSREntry.query.filter_by(form_type=form_type)
+                   .filter(field_filter(DSREntry.data, FORM_CONFIGS[form_type], 'fir_no', 'eq', '42'))),
+        'admin.case_timeline':
+            db.session.query(CaseMention, DSREntry).join(DSREntry, DSREntry.id == CaseMention.entry_id)
+                      .filter(CaseMention.kind == 'case', CaseMention.identifier == '42/2024')
+                      .order_by(CaseMention.date, CaseMention.entry_id).statement,
+        'admin.export_form':
+            form_entries_query(form_type, today - timedelta(days=SEED_DAYS // 2), today).statement,
+        'admin.export_form (district)':
+            form_entries_query(form_type, today - timedelta(days=SEED_DAYS // 2), today, district).statement,
+        'admin.search':
+            DSREntry.query.filter_by(date=today, district_name=district).statement,
+        'admin.download_dsr':
+            district_entries_query(district, today).statement,
+        'district.dashboard':
+            DSREntry.query.filter_by(district_name=district).order_by(DSREntry.updated_at.desc()).limit(10).statement,
+        'district.form_entry (GET)':
+            DSREntry.query.filter_by(district_name=district, form_type=form_type, date=today)
+                          .order_by(DSREntry.created_at.desc()).statement,
+    }
+
+def explain(statement, search_keys=()):
+    """
+    Return the query plan lines and what is wrong with the plan: a
+    sequential scan of dsr_entry, or search_keys not used as index keys
+    """
+    dialect = db.engine.dialect
+    sql = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+
+    if dialect.name == 'postgresql':
+        lines = [row[0] for row in db.session.execute(db.text('EXPLAIN ' + sql))]
+        seq_scan = any('Seq Scan on dsr_entry' in line for line in lines)
+        conditions = ' '.join(line for line in lines if 'Index Cond:' in line)
+        missing = [column for column in search_keys if f'({column} = ' not in conditions]
+    else:
+        lines = [row[-1] for row in db.session.execute(db.text('EXPLAIN QUERY PLAN ' + sql))]
+        # "SCAN dsr_entry USING INDEX ..." walks an index in order; a bare
+        # "SCAN dsr_entry" is a full table scan
+        seq_scan = any(line.startswith(('SCAN dsr_entry', 'SCAN TABLE dsr_entry')) and 'USING' not in line
+                       for line in lines)
+        # "SEARCH dsr_entry USING INDEX ix (district_name=? AND date=?)"
+        conditions = ' '.join(line for line in lines if line.startswith('SEARCH dsr_entry'))
+        missing = [column for column in search_keys if f'{column}=?' not in conditions]
+
+    problems = ['sequential scan'] if seq_scan else []
+    if missing:
+        problems.append(f"not an index search key: {', '.join(missing)}")
+    return lines, problems
+
+def main(database_uri=None):
+    scratch_file = None
+    if not database_uri:
+        handle, scratch_file = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        database_uri = f'sqlite:///{scratch_file}'
+
+    class CheckConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database_uri
+
+    app = create_app(CheckConfig)
+    failures = []
+    try:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            seed_database()
+
+            if db.engine.dialect.name == 'postgresql':
+                # With seq scans priced out, the planner only picks one
+                # when no index can serve the query at all
+                db.session.execute(db.text('SET enable_seqscan = off'))
+
+            for route, statement in route_queries().items():
+                lines, problems = explain(statement, SEARCH_KEYS.get(route, ()))
+                status = f"FAIL: {'; '.join(problems)}" if problems else 'ok'
+                print(f"[{status}] {route}")
+                for line in lines:
+                    print(f"       {line}")
+                if problems:
+                    failures.append(route)
+
+            db.session.rollback()
+            db.drop_all()
+            db.engine.dispose()
+    finally:
+        if scratch_file:
+            os.remove(scratch_file)
+
+    if failures:
+        print(f"\n{len(failures)} route(s) do not use their index fully: {', '.join(failures)}")
+        return 1
+    print("\nAll route queries use an index")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1] if len(sys.argv) > 1 else None))
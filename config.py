@@ -31,6 +31,15 @@ class DatabaseConfig:
     POSTGRES_USER = os.environ.get('POSTGRES_USER', 'dsr_user')
     POSTGRES_PASSWORD = os.environ.get('POSTGRES_PASSWORD', 'dsr_pass123')
     
+    # PostgreSQL pool settings, per worker process: keep
+    # workers x (POOL_SIZE + MAX_OVERFLOW) below the server's max_connections
+    POSTGRES_POOL_SIZE = int(os.environ.get('POSTGRES_POOL_SIZE', 5))
+    POSTGRES_MAX_OVERFLOW = int(os.environ.get('POSTGRES_MAX_OVERFLOW', 5))
+    POSTGRES_POOL_TIMEOUT = int(os.environ.get('POSTGRES_POOL_TIMEOUT', 10))  # Seconds to wait for a free connection
+    POSTGRES_POOL_RECYCLE = int(os.environ.get('POSTGRES_POOL_RECYCLE', 1800))  # Reopen connections older than this
+    POSTGRES_STATEMENT_TIMEOUT_MS = int(os.environ.get('POSTGRES_STATEMENT_TIMEOUT_MS', 30000))
+    POSTGRES_IDLE_IN_TRANSACTION_TIMEOUT_MS = int(os.environ.get('POSTGRES_IDLE_IN_TRANSACTION_TIMEOUT_MS', 60000))
+    
     @classmethod
     def get_database_uri(cls):
         """
@@ -47,6 +56,32 @@ class DatabaseConfig:
             # SQLite connection string (default - current behavior)
             return f"sqlite:///{cls.SQLITE_PATH}"
     
+    @classmethod
+    def get_engine_options(cls, database_uri=None):
+        """
+        SQLAlchemy engine options for PostgreSQL: pool sizing, a liveness
+        check before each checkout, connection recycling and server-side
+        timeouts so one slow query or abandoned transaction cannot hold a
+        connection indefinitely. Empty for SQLite (library defaults).
+        """
+        if not (database_uri or cls.get_database_uri()).startswith('postgresql'):
+            return {}
+        
+        return {
+            'pool_size': cls.POSTGRES_POOL_SIZE,
+            'max_overflow': cls.POSTGRES_MAX_OVERFLOW,
+            'pool_timeout': cls.POSTGRES_POOL_TIMEOUT,
+            'pool_recycle': cls.POSTGRES_POOL_RECYCLE,
+            'pool_pre_ping': True,
+            'pool_use_lifo': True,  # Reuse warm connections so idle extras can be recycled
+            'connect_args': {
+                'connect_timeout': 10,
+                'application_name': 'control-room-dsr',
+                'options': (f'-c statement_timeout={cls.POSTGRES_STATEMENT_TIMEOUT_MS} '
+                            f'-c idle_in_transaction_session_timeout={cls.POSTGRES_IDLE_IN_TRANSACTION_TIMEOUT_MS}')
+            }
+        }
+    
     @classmethod
     def get_database_type(cls):
         """Returns current database type"""
@@ -75,10 +110,66 @@ class Config:
     # Database configuration (flexible)
     SQLALCHEMY_DATABASE_URI = DatabaseConfig.get_database_uri()
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = {}  # Built from SQLALCHEMY_DATABASE_URI by app/db_pool.configure(); entries here override
     
     # Upload settings (unchanged)
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app', 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024  # Chunk size offered to resumable uploads
+    UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_MB', 512)) * 1024 * 1024
+    UPLOAD_SESSION_TTL = 24 * 60 * 60  # Unfinished uploads are discarded after a day
+    UPLOAD_SEND_MODE = os.environ.get('UPLOAD_SEND_MODE', '')  # '', 'x-accel-redirect' (nginx) or 'x-sendfile'
+    UPLOAD_ACCEL_PREFIX = os.environ.get('UPLOAD_ACCEL_PREFIX', '/protected_uploads/')  # nginx internal location for UPLOAD_FOLDER
+    
+    # Seconds a worker reuses a loaded user before reading it again (0 disables the cache)
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+    
+    # SQLite runtime profile (ignored on PostgreSQL)
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 15000))  # Wait this long for the write lock
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',     # Readers and the writer do not block each other
+        'synchronous': 'NORMAL',   # Safe with WAL; syncs at checkpoints instead of every commit
+        'cache_size': -32000,      # 32MB page cache per connection
+        'temp_store': 'MEMORY'
+    }
+    SQLITE_WRITE_QUEUE = os.environ.get('SQLITE_WRITE_QUEUE', '1') != '0'  # Serialize DSR writes per worker
+    SQLITE_GROUP_COMMIT_MAX = int(os.environ.get('SQLITE_GROUP_COMMIT_MAX', 64))  # Queued writes per commit
+    
+    # Live dashboard feed (/live)
+    LIVE_FEED_POLL_INTERVAL = float(os.environ.get('LIVE_FEED_POLL_INTERVAL', 1.0))  # Seconds between reads of other workers' events
+    LIVE_FEED_HEARTBEAT = int(os.environ.get('LIVE_FEED_HEARTBEAT', 20))  # Seconds between keepalive comments to idle clients
+    LIVE_FEED_RETENTION = int(os.environ.get('LIVE_FEED_RETENTION', 600))  # Seconds events stay in the live_event log
+    LIVE_FEED_BACKLOG = int(os.environ.get('LIVE_FEED_BACKLOG', 500))  # Recent events kept in memory per worker
+    LIVE_FEED_MAX_STREAM = int(os.environ.get('LIVE_FEED_MAX_STREAM', 300))  # Seconds before a /live response ends and the browser reconnects
+    
+    # Export settings
+    EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', 0)) or None  # None = one per CPU
+    EXPORT_CACHE_DIR = DatabaseConfig.INSTANCE_DIR / 'export_cache'
+    EXPORT_CACHE_MAX_BYTES = int(os.environ.get('EXPORT_CACHE_MAX_MB', 256)) * 1024 * 1024
+    EXPORT_ASYNC_ROWS = int(os.environ.get('EXPORT_ASYNC_ROWS', 2000))  # Exports of more entries run as background jobs
+    EXPORT_STREAM_IDLE_TIMEOUT_MS = int(os.environ.get('EXPORT_STREAM_IDLE_TIMEOUT_MS', 600000))  # PostgreSQL idle-in-transaction limit while a CSV/NDJSON export streams
+    
+    # Background jobs (app/jobs.py)
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))  # Runner threads per web process (0 = use run_jobs.py)
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 2.0))  # Seconds between checks of an empty queue
+    JOB_TIMEOUT = int(os.environ.get('JOB_TIMEOUT', 900))  # Lease of a running job, renewed while it runs; a job whose runner stops renewing counts as lost after this
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+    JOB_RETRY_DELAY = int(os.environ.get('JOB_RETRY_DELAY', 30))  # Seconds before the first retry, doubling each time
+    JOB_RESULTS_DIR = DatabaseConfig.INSTANCE_DIR / 'job_results'
+    JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', 24 * 60 * 60))  # Seconds finished jobs and results are kept
+    
+    # End-of-day pre-generation of district and state workbooks (app/end_of_day.py)
+    EOD_CUTOFF = os.environ.get('EOD_CUTOFF', '19:00')  # HH:MM in IST; empty disables
+    EOD_REGENERATE_DELAY = int(os.environ.get('EOD_REGENERATE_DELAY', 60))  # Seconds to gather late changes before re-rendering
+    EOD_CHECK_INTERVAL = int(os.environ.get('EOD_CHECK_INTERVAL', 30))  # Seconds between scheduler checks
+    
+    # Template caches (app/template_cache.py)
+    TEMPLATE_FRAGMENT_CACHE = os.environ.get('TEMPLATE_FRAGMENT_CACHE', '1') != '0'  # Cache FORM_CONFIGS-derived markup per worker
+    TEMPLATE_BYTECODE_CACHE_DIR = os.environ.get('TEMPLATE_BYTECODE_CACHE_DIR',
+                                                 str(DatabaseConfig.INSTANCE_DIR / 'jinja_cache'))  # Empty disables
+    
+    # Fingerprinted static files written by build_assets.py (app/assets.py)
+    ASSET_BUILD_DIR = os.environ.get('ASSET_BUILD_DIR', str(DatabaseConfig.INSTANCE_DIR / 'assets'))
 
 # Helper functions for migration
 def print_config_info():
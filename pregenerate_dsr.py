@@ -0,0 +1,41 @@
+"""
+DSR Workbook Pre-generation
+Renders the district and statewide workbooks of a date into the export
+cache now, instead of waiting for the end-of-day cutoff (EOD_CUTOFF). Only
+workbooks whose entries changed since they were last rendered are built.
+
+Usage:
+    python pregenerate_dsr.py                    # today (IST)
+    python pregenerate_dsr.py --date 2025-01-31
+    python pregenerate_dsr.py --district Krishna --district Guntur
+"""
+
+import sys
+import time
+import argparse
+from datetime import datetime
+
+from app import create_app
+from app.models import DISTRICTS, ist_now
+from app.end_of_day import pregenerate
+
+def _date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pre-generate DSR workbooks into the export cache')
+    parser.add_argument('--date', type=_date, help='report date, YYYY-MM-DD (default: today in IST)')
+    parser.add_argument('--district', action='append', choices=DISTRICTS, metavar='NAME',
+                        help='only this district (repeatable; default: all)')
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    day = args.date or ist_now().date()
+    started = time.perf_counter()
+    with app.app_context():
+        rendered = pregenerate(day, args.district)
+    print(f"{day}: {rendered} workbooks rendered in {time.perf_counter() - started:.1f}s")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,46 @@
+"""
+Daily Rollup Rebuild
+Recomputes the daily rollup of number fields (DailyRollup) from the DSR
+entries, one window of days per transaction. The application fills an
+empty rollup on startup and keeps it current on every write; run this
+after changing number fields in FORM_CONFIGS, after editing entries
+directly in the database, or to repair the rollup.
+
+Usage:
+    python rebuild_rollups.py
+    python rebuild_rollups.py --from 2025-01-01 --to 2025-03-31
+"""
+
+import sys
+import time
+import argparse
+from datetime import datetime
+
+from app import create_app, rollups
+
+def _date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Rebuild the daily rollup of number fields')
+    parser.add_argument('--from', dest='date_from', type=_date,
+                        help='first date to rebuild, YYYY-MM-DD (default: earliest entry)')
+    parser.add_argument('--to', dest='date_to', type=_date,
+                        help='last date to rebuild, YYYY-MM-DD (default: latest entry)')
+    args = parser.parse_args(argv)
+    if args.date_from and args.date_to and args.date_from > args.date_to:
+        parser.error('--from is after --to')
+
+    app = create_app()
+    started = time.perf_counter()
+
+    def progress(window_start, window_end):
+        print(f"{window_start} to {window_end} done ({time.perf_counter() - started:.1f}s)", flush=True)
+
+    with app.app_context():
+        rollups.rebuild(date_from=args.date_from, date_to=args.date_to, progress=progress)
+    print(f"Done in {time.perf_counter() - started:.1f}s")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -72,5 +72,6 @@ if __name__ == '__main__':
     # app.run(debug=True, host='0.0.0.0', port=5000)
 
 # For production, use a WSGI server like Gunicorn:
-# Example command (run from project root):
-#   gunicorn -w 4 -b 0.0.0.0:8000 "app:create_app()"
\ No newline at end of file
+# Example command (run from project root); threaded workers, since every
+# open dashboard holds a thread for its /live feed:
+#   gunicorn -w 4 --worker-class gthread --threads 32 -b 0.0.0.0:8000 "app:create_app()"
\ No newline at end of file
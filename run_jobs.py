@@ -0,0 +1,38 @@
+"""
+Background Job Runner
+Runs queued background jobs (large exports) in a process of its own. Use
+it with JOB_WORKERS=0 in the web processes so workbook generation never
+shares a process with request handling. Several runners, on this or other
+machines sharing the database, can run at once.
+
+Usage:
+    JOB_WORKERS=0 gunicorn ...   # web processes queue jobs only
+    python run_jobs.py --workers 4
+"""
+
+import sys
+import time
+import argparse
+
+from app import create_app
+from app.jobs import jobs
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run queued background jobs')
+    parser.add_argument('--workers', type=int, default=2, help='runner threads (default 2)')
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+
+    app = create_app()
+    jobs.start(args.workers)
+    print(f"Running jobs with {args.workers} threads, Ctrl+C to stop", flush=True)
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        print("Stopped; unfinished jobs are requeued once their lease runs out")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())